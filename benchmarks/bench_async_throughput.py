@@ -0,0 +1,101 @@
+"""Load test: sync ChatHandler on a thread pool vs AsyncChatHandler on one event loop.
+
+Both paths run the real compiled bot2 graph with an in-memory checkpointer, a
+stubbed LLM (fixed latency) and an in-memory message store (fixed latency), so
+the difference comes from how each path waits on I/O.
+
+Usage: python benchmarks/bench_async_throughput.py [--conversations 200] [--turns 3]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langgraph.checkpoint.memory import MemorySaver  # noqa: E402
+
+from benchmarks.stubs import AsyncInMemoryDatabaseManager, InMemoryDatabaseManager, ScriptedChatModel  # noqa: E402
+from bot2 import create_chatbot  # noqa: E402
+from chat_handler import AsyncChatHandler, ChatHandler  # noqa: E402
+
+
+class PeakThreads:
+    """Samples threading.active_count() in the background"""
+
+    def __init__(self):
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(0.01):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_sync(args, chatbot) -> dict:
+    db = InMemoryDatabaseManager(latency=args.db_latency)
+
+    def conversation(i: int) -> None:
+        handler = ChatHandler(db=db, chatbot=chatbot)
+        for turn in range(args.turns):
+            handler.process_message(f"hello {turn}", f"user{i}")
+
+    with PeakThreads() as threads:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            list(pool.map(conversation, range(args.conversations)))
+        elapsed = time.perf_counter() - start
+    return {"elapsed": elapsed, "peak_threads": threads.peak}
+
+
+def run_async(args, chatbot) -> dict:
+    db = AsyncInMemoryDatabaseManager(latency=args.db_latency)
+
+    async def conversation(i: int) -> None:
+        handler = AsyncChatHandler(db=db, chatbot=chatbot)
+        for turn in range(args.turns):
+            await handler.process_message(f"hello {turn}", f"user{i}")
+
+    async def main():
+        await asyncio.gather(*(conversation(i) for i in range(args.conversations)))
+
+    with PeakThreads() as threads:
+        start = time.perf_counter()
+        asyncio.run(main())
+        elapsed = time.perf_counter() - start
+    return {"elapsed": elapsed, "peak_threads": threads.peak}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--db-latency", type=float, default=0.002)
+    parser.add_argument("--threads", type=int, default=40, help="sync worker threads (Gradio's default is 40)")
+    args = parser.parse_args()
+
+    llm = ScriptedChatModel(latency=args.llm_latency)
+    total_turns = args.conversations * args.turns
+    for name, runner in (("sync", run_sync), ("async", run_async)):
+        result = runner(args, create_chatbot(checkpointer=MemorySaver(), llm=llm))
+        print(
+            f"{name:<6} {total_turns} turns in {result['elapsed']:7.2f}s  "
+            f"{total_turns / result['elapsed']:8.1f} turns/s  peak threads {result['peak_threads']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Multi-client load test: many users share ONE handler, each with its own ClientState.
+
+Every client is a different user sending tagged messages through a single shared
+ChatHandler (thread pool) or AsyncChatHandler (one event loop), the way Gradio
+serves concurrent browser tabs. The LLM stub echoes the latest user message, so
+after the run every reply, stored row and checkpoint thread can be checked for
+messages that belong to another client. Exits non-zero on any cross-talk.
+
+Usage: python benchmarks/bench_concurrent_clients.py [--clients 200] [--turns 5]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langgraph.checkpoint.memory import MemorySaver  # noqa: E402
+
+from benchmarks.stubs import AsyncInMemoryDatabaseManager, EchoChatModel, InMemoryDatabaseManager  # noqa: E402
+from bot2 import create_chatbot  # noqa: E402
+from chat_handler import AsyncChatHandler, ChatHandler, ClientState, checkpoint_rows  # noqa: E402
+
+
+def tag(client: int, turn: int) -> str:
+    return f"client-{client} turn-{turn}"
+
+
+def check(clients: Dict[int, ClientState], replies: Dict[int, List[str]], rows_for, state_for, turns: int) -> List[str]:
+    """Every reply, stored row and checkpoint message of a client must carry that client's tag"""
+    errors = []
+    session_ids = [c.session_id for c in clients.values()]
+    if len(set(session_ids)) != len(session_ids):
+        errors.append("clients share a session id")
+    for i, client in clients.items():
+        expected = [tag(i, t) for t in range(turns)]
+        if replies[i] != [f"echo: {m}" for m in expected]:
+            errors.append(f"client {i}: replies {replies[i][:2]}...")
+        for source, rows in (("db", rows_for(client.session_id)), ("checkpoint", state_for(client.session_id))):
+            users = [text for sender, text in rows if sender == "user"]
+            if users != expected:
+                errors.append(f"client {i}: {source} rows {users[:2]}...")
+    return errors
+
+
+def run_sync(args, chatbot) -> dict:
+    db = InMemoryDatabaseManager(latency=args.db_latency)
+    handler = ChatHandler(db=db, chatbot=chatbot)
+    clients = {i: ClientState() for i in range(args.clients)}
+    replies = {i: [] for i in range(args.clients)}
+
+    def conversation(i: int) -> None:
+        for turn in range(args.turns):
+            replies[i].append(handler.process_message(tag(i, turn), f"user{i}", clients[i]))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(conversation, range(args.clients)))
+    elapsed = time.perf_counter() - start
+
+    def state_for(session_id):
+        return checkpoint_rows(chatbot.get_state({"configurable": {"thread_id": session_id}}))
+
+    return {"elapsed": elapsed, "errors": check(clients, replies, db.get_session_messages, state_for, args.turns)}
+
+
+def run_async(args, chatbot) -> dict:
+    db = AsyncInMemoryDatabaseManager(latency=args.db_latency)
+    handler = AsyncChatHandler(db=db, chatbot=chatbot)
+    clients = {i: ClientState() for i in range(args.clients)}
+    replies = {i: [] for i in range(args.clients)}
+
+    async def conversation(i: int) -> None:
+        for turn in range(args.turns):
+            replies[i].append(await handler.process_message(tag(i, turn), f"user{i}", clients[i]))
+
+    async def main():
+        await asyncio.gather(*(conversation(i) for i in range(args.clients)))
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    elapsed = time.perf_counter() - start
+
+    def state_for(session_id):
+        return checkpoint_rows(chatbot.get_state({"configurable": {"thread_id": session_id}}))
+
+    return {"elapsed": elapsed, "errors": check(clients, replies, db._sync.get_session_messages, state_for, args.turns)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--db-latency", type=float, default=0.002)
+    parser.add_argument("--threads", type=int, default=64, help="sync worker threads")
+    args = parser.parse_args()
+
+    llm = EchoChatModel(latency=args.llm_latency)
+    total_turns = args.clients * args.turns
+    failed = False
+    for name, runner in (("sync", run_sync), ("async", run_async)):
+        result = runner(args, create_chatbot(checkpointer=MemorySaver(), llm=llm))
+        print(
+            f"{name:<6} {args.clients} clients, {total_turns} turns in {result['elapsed']:7.2f}s  "
+            f"{total_turns / result['elapsed']:8.1f} turns/s  cross-talk errors: {len(result['errors'])}"
+        )
+        for error in result["errors"][:10]:
+            print(f"  {error}")
+        failed = failed or bool(result["errors"])
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
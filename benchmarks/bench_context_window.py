@@ -0,0 +1,117 @@
+"""Prompt size and chat_node latency vs session length, with and without context trimming.
+
+Each session is seeded with N synthetic turns (user message, tool call, a large tool
+result, assistant reply), then two more turns are run through the real bot2 graph.
+The stub LLM charges ``--ms-per-1k-tokens`` of prefill time, so latency follows the
+prompt size the way a hosted model's does. The first measured turn includes the
+one-off catch-up summarization; the second is the steady state.
+
+A final check streams a turn that triggers summarization the way ChatHandler does
+(stream_mode="messages" through _StreamAccumulator), and exits 1 if any summary
+text reaches the reply.
+
+Usage: python benchmarks/bench_context_window.py [--turns 10 50 100 200]
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage  # noqa: E402
+from langgraph.checkpoint.memory import MemorySaver  # noqa: E402
+
+from benchmarks.stubs import ScriptedChatModel  # noqa: E402
+from bot2 import create_chatbot  # noqa: E402
+from chat_handler import _StreamAccumulator  # noqa: E402
+from context_manager import CONTEXT_MAX_TOKENS, ContextManager, count_tokens  # noqa: E402
+
+
+class RecordingChatModel(ScriptedChatModel):
+    """Remembers the token count of every prompt it is sent"""
+
+    prompt_tokens: list = []
+
+    def _respond(self, messages):
+        self.prompt_tokens.append(count_tokens(messages))
+        return super()._respond(messages)
+
+
+def synthetic_turns(n: int, payload_chars: int) -> list:
+    messages = []
+    for i in range(n):
+        call_id = str(uuid.uuid4())
+        messages += [
+            HumanMessage(content=f"turn {i}: search youtube for lofi mix number {i} and tell me about it"),
+            AIMessage(content="", tool_calls=[{"name": "youtube_search", "args": {"query": f"lofi mix {i}"}, "id": call_id}]),
+            ToolMessage(content="x" * payload_chars, tool_call_id=call_id),
+            AIMessage(content=f"Here is lofi mix {i}. It is a relaxing playlist with about forty tracks."),
+        ]
+    return messages
+
+
+def measure(chatbot, llm: RecordingChatModel, seed: list) -> list:
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+    chatbot.update_state(config, {"messages": seed}, as_node="chat_node")
+    results = []
+    for turn in range(2):
+        start = time.perf_counter()
+        chatbot.invoke({"messages": [HumanMessage(content=f"next {turn}")]}, config=config)
+        results.append((llm.prompt_tokens[-1], time.perf_counter() - start))
+    return results
+
+
+def streamed_reply(chatbot, seed: list) -> str:
+    """Reply text a client would see for one streamed turn"""
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+    chatbot.update_state(config, {"messages": seed}, as_node="chat_node")
+    acc = _StreamAccumulator()
+    for chunk, metadata in chatbot.stream({"messages": [HumanMessage(content="next")]}, config=config,
+                                          stream_mode="messages"):
+        acc.feed(chunk, metadata)
+    return acc.reply
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 50, 100, 200])
+    parser.add_argument("--payload-chars", type=int, default=2000, help="size of each tool result")
+    parser.add_argument("--max-tokens", type=int, default=CONTEXT_MAX_TOKENS)
+    parser.add_argument("--latency", type=float, default=0.2, help="fixed LLM latency in seconds")
+    parser.add_argument("--ms-per-1k-tokens", type=float, default=40.0)
+    args = parser.parse_args()
+
+    per_1k = args.ms_per_1k_tokens / 1000
+    llm = RecordingChatModel(latency=args.latency, latency_per_1k_tokens=per_1k)
+    summarizer = ScriptedChatModel(latency=args.latency, latency_per_1k_tokens=per_1k, reply="User listened to lofi mixes.")
+    variants = {
+        "full": ContextManager(max_tokens=0),
+        "trimmed": ContextManager(summarizer=summarizer, max_tokens=args.max_tokens),
+    }
+
+    print(f"{'turns':>6} {'mode':<8} {'prompt tok':>11} {'first turn':>11} {'steady tok':>11} {'steady':>9}")
+    for n in args.turns:
+        seed = synthetic_turns(n, args.payload_chars)
+        for name, context in variants.items():
+            chatbot = create_chatbot(checkpointer=MemorySaver(), llm=llm, context=context)
+            (first_tok, first_s), (steady_tok, steady_s) = measure(chatbot, llm, seed)
+            print(
+                f"{n:>6} {name:<8} {first_tok:>11} {first_s * 1000:>9.0f}ms "
+                f"{steady_tok:>11} {steady_s * 1000:>7.0f}ms"
+            )
+
+    # a distinct summary text, so any of it leaking into the streamed reply is visible
+    llm = ScriptedChatModel(latency=0, reply="the reply")
+    summary = ScriptedChatModel(latency=0, reply="<<SUMMARY>>")
+    chatbot = create_chatbot(checkpointer=MemorySaver(), llm=llm,
+                             context=ContextManager(summarizer=summary, max_tokens=args.max_tokens))
+    reply = streamed_reply(chatbot, synthetic_turns(max(args.turns), args.payload_chars))
+    print(f"streamed reply while summarizing: {reply!r}")
+    if reply != llm.reply:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
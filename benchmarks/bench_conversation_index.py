@@ -0,0 +1,98 @@
+"""ConversationIndex cost on and off the request path, with many users under a memory cap.
+
+  * enqueue:  time add_turn() adds to a chat turn (the only part on the request path)
+  * indexing: background throughput, messages embedded and added per second
+  * search:   latency for users whose index is loaded vs one evicted to disk
+  * memory:   users loaded and MB held against --max-mb
+
+Uses the HashingEncoder stand-in with --encode-ms per batch, so no model download is
+needed; indexes go to a temporary directory. Exits 1 if a user's own earlier message
+is not found by search.
+
+Usage: python benchmarks/bench_conversation_index.py [--users 2000] [--turns 50] [--max-mb 16]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stubs import HashingEncoder  # noqa: E402
+from conversation_index import ConversationIndex  # noqa: E402
+
+TOPICS = ["jazz mix", "lofi beats", "workout playlist", "rainy day piano", "road trip rock",
+          "deep focus ambient", "sleep sounds", "party hip hop", "classical study", "morning coffee"]
+
+
+def user_text(user: int, turn: int) -> str:
+    topic = TOPICS[(user + turn) % len(TOPICS)]
+    return f"play the {topic} I liked, number {turn} for user {user}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=50, help="turns per user")
+    parser.add_argument("--max-mb", type=float, default=16.0, help="memory cap for loaded indexes")
+    parser.add_argument("--encode-ms", type=float, default=5.0, help="simulated model time per encode call")
+    parser.add_argument("--searches", type=int, default=200)
+    args = parser.parse_args()
+
+    encoder = HashingEncoder(latency=args.encode_ms / 1000)
+
+    def encode(texts):
+        return encoder.encode(texts, normalize_embeddings=True)
+
+    with tempfile.TemporaryDirectory() as directory:
+        index = ConversationIndex(directory=directory, max_mb=args.max_mb, queue_size=args.users * args.turns,
+                                  encode=encode, encode_query=encode)
+        enqueue = []
+        start = time.perf_counter()
+        for turn in range(args.turns):
+            for user in range(args.users):
+                t = time.perf_counter()
+                index.add_turn(f"user{user}", f"session{user}-{turn // 10}", user_text(user, turn),
+                               f"Playing {TOPICS[(user + turn) % len(TOPICS)]}")
+                enqueue.append(time.perf_counter() - t)
+        index.flush()
+        elapsed = time.perf_counter() - start
+        messages = args.users * args.turns * 2
+        stats = index.stats()
+        print(f"{args.users} users x {args.turns} turns ({messages:,} messages)")
+        print(f"  enqueue p50       {statistics.median(enqueue) * 1e6:8.1f} us   "
+              f"max {max(enqueue) * 1e3:.2f} ms")
+        print(f"  indexing          {messages / elapsed:8.0f} messages/s")
+        print(f"  loaded            {stats['users_loaded']} users, {stats['loaded_mb']:.1f} MB "
+              f"(cap {args.max_mb} MB), {stats['evictions']} evictions")
+
+        recent = list(index._loaded)
+        hot, cold, failures = [], [], 0
+        for i in range(args.searches):
+            if i % 2 == 0 and recent:
+                user = int(random.choice(recent)[4:])
+                samples = hot
+            else:
+                user = random.randrange(args.users)
+                samples = cold if f"user{user}" not in index._loaded else hot
+            turn = random.randrange(args.turns)
+            t = time.perf_counter()
+            matches = index.search(f"user{user}", user_text(user, turn), k=5)
+            samples.append(time.perf_counter() - t)
+            if not matches or matches[0][0] != f"session{user}-{turn // 10}":
+                failures += 1
+        for name, samples in (("search (loaded)", hot), ("search (from disk)", cold)):
+            if samples:
+                print(f"  {name:<17} {statistics.median(samples) * 1e3:8.2f} ms p50 over {len(samples)}")
+        print(f"  top-1 session     {args.searches - failures}/{args.searches} correct")
+        index.close()
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""Offline end-to-end turn latency: ChatHandler.process_message through the compiled bot2 graph.
+
+Nothing leaves the machine:
+  * LLM:        ToolCallingChatModel (scripted tool calls, fixed latency)
+  * YouTube:    FakeYouTube
+  * embeddings: HashingEncoder over a synthetic catalog (--catalog real uses the
+                sentence-transformer and playlist.json instead)
+  * database:   in-memory stand-in + MemorySaver (--db memory), or a throwaway schema
+                on a local Postgres (--db postgres), dropped afterwards
+
+Each turn's wall time is split into db (DatabaseManager + checkpointer), embedding
+(query encode), faiss (index search), llm (stub model) and graph (everything else:
+LangGraph scheduling, tools, context trimming). p50/p95/p99 per stage go to a JSON
+file named after the current commit, so runs can be compared across commits.
+
+Usage: python benchmarks/bench_e2e.py [--turns 500] [--db memory|postgres] [--output FILE]
+"""
+import argparse
+import contextvars
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langgraph.checkpoint.memory import MemorySaver  # noqa: E402
+
+import bot2  # noqa: E402
+import database  # noqa: E402
+import migrations  # noqa: E402
+import setvectordb  # noqa: E402
+from benchmarks.stubs import (  # noqa: E402
+    FakeYouTube, HashingEncoder, InMemoryDatabaseManager, ToolCallingChatModel, synthetic_playlists,
+)
+from chat_handler import ChatHandler, ClientState  # noqa: E402
+from database_manager import DatabaseManager  # noqa: E402
+from youtube_client import DiskCache, YouTubeClient  # noqa: E402
+import router as fast_path  # noqa: E402
+
+STAGES = ("db", "embedding", "faiss", "llm")
+
+MESSAGES = [
+    "play my {} playlist",
+    "play {} on youtube",
+    "search {} live performance",
+    "open https://example.com/{}",
+    "what should I listen to while I work on {}?",
+]
+TOPICS = ["lofi", "jazz", "workout", "focus", "rock", "classical", "ambient", "sleep", "party", "chill study"]
+
+
+class StageTimer:
+    """Accumulates time per stage for the current turn.
+
+    The turn's totals live in a ContextVar rather than a threading.local. Tools run
+    on ToolExecutor's pool threads, each in a copy of the caller's context, and
+    the copies share the same dict (hence the lock).
+    """
+
+    def __init__(self):
+        self._stages: contextvars.ContextVar = contextvars.ContextVar("bench_stages", default=None)
+        self._lock = threading.Lock()
+
+    def start_turn(self) -> None:
+        self._stages.set(defaultdict(float))
+
+    def end_turn(self) -> dict:
+        with self._lock:
+            return dict(self._stages.get() or {})
+
+    def wrap(self, stage: str, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                stages = self._stages.get()
+                if stages is not None:
+                    with self._lock:
+                        stages[stage] += time.perf_counter() - start
+        return timed
+
+
+class TimedProxy:
+    """Times every method call on `target` under one stage"""
+
+    def __init__(self, target, timer: StageTimer, stage: str):
+        self._target = target
+        self._timer = timer
+        self._stage = stage
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._target, name)
+        return self._timer.wrap(self._stage, attr) if callable(attr) else attr
+
+
+timer = StageTimer()
+
+
+class TimedToolCallingChatModel(ToolCallingChatModel):
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return timer.wrap("llm", super()._generate)(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+
+def time_checkpointer(checkpointer):
+    for name in ("get_tuple", "list", "put", "put_writes"):
+        setattr(checkpointer, name, timer.wrap("db", getattr(checkpointer, name)))
+    return checkpointer
+
+
+def install_catalog(args) -> None:
+    """Swap in the embedding model and playlist index before anything loads the real ones"""
+    if args.catalog == "real":
+        store = setvectordb.get_store()
+        # playlists the fake YouTube "finds" must not be saved into the real index cache
+        store.cache_dir = store.discovered_path = None
+    else:
+        model = HashingEncoder(latency=args.embed_latency)
+        playlists = synthetic_playlists(args.playlists)
+        ids = np.array([setvectordb.playlist_key(p) for p in playlists], dtype="int64")
+        embeddings = setvectordb.encode_playlists(model, playlists)
+        store = setvectordb.PlaylistIndex(playlists, setvectordb.build_index(embeddings, ids), ids, embeddings,
+                                          model, model_name="hashing")
+        setvectordb._model.set(model)
+        setvectordb._store.set(store)
+    store.search = timer.wrap("faiss", store.search)
+    setvectordb.encode_queries = timer.wrap("embedding", setvectordb.encode_queries)
+
+
+def messages_for(turns: int):
+    for i in range(turns):
+        template = MESSAGES[i % len(MESSAGES)]
+        yield template.format(TOPICS[(i // len(MESSAGES)) % len(TOPICS)])
+
+
+def run_turns(handler: ChatHandler, args) -> list:
+    samples = []
+    clients = [ClientState() for _ in range(args.sessions)]
+    for i, message in enumerate(messages_for(args.turns)):
+        client = clients[i % len(clients)]
+        timer.start_turn()
+        start = time.perf_counter()
+        handler.process_message(message, "bench_user", client)
+        total = time.perf_counter() - start
+        stages = timer.end_turn()
+        stages["graph"] = max(total - sum(stages.get(s, 0.0) for s in STAGES), 0.0)
+        stages["total"] = total
+        samples.append(stages)
+    return samples
+
+
+def summarize(samples: list) -> dict:
+    summary = {}
+    for stage in STAGES + ("graph", "total"):
+        ms = np.array([s.get(stage, 0.0) for s in samples]) * 1000
+        summary[stage] = {"mean": float(ms.mean()), "p50": float(np.percentile(ms, 50)),
+                          "p95": float(np.percentile(ms, 95)), "p99": float(np.percentile(ms, 99))}
+    return summary
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_memory(args, llm) -> list:
+    db = TimedProxy(InMemoryDatabaseManager(latency=args.db_latency), timer, "db")
+    chatbot = bot2.create_chatbot(checkpointer=time_checkpointer(MemorySaver()), llm=llm,
+                                  router=fast_path.FastPathRouter() if args.fast_path else None)
+    return run_turns(ChatHandler(db=db, chatbot=chatbot), args)
+
+
+def run_postgres(args, llm) -> list:
+    import psycopg
+    from langgraph.checkpoint.postgres import PostgresSaver
+    from psycopg.conninfo import make_conninfo
+    from psycopg_pool import ConnectionPool
+
+    schema = f"bench_e2e_{uuid.uuid4().hex[:8]}"
+    with psycopg.connect(args.dsn, autocommit=True) as admin:
+        admin.execute(f"CREATE SCHEMA {schema}")
+    try:
+        conninfo = make_conninfo(args.dsn, options=f"-c search_path={schema}")
+        migrations.migrate(conninfo)
+        pool = ConnectionPool(conninfo, min_size=1, max_size=4, kwargs=database.connection_kwargs, open=True)
+        try:
+            # DatabaseManager borrows from database.get_pool(); point it at the throwaway schema
+            database._pool.set(pool)
+            checkpointer = PostgresSaver(pool)
+            checkpointer.setup()
+            chatbot = bot2.create_chatbot(checkpointer=time_checkpointer(checkpointer), llm=llm,
+                                          router=fast_path.FastPathRouter() if args.fast_path else None)
+            handler = ChatHandler(db=TimedProxy(DatabaseManager(), timer, "db"), chatbot=chatbot)
+            return run_turns(handler, args)
+        finally:
+            database._pool.reset()
+            pool.close()
+    finally:
+        with psycopg.connect(args.dsn, autocommit=True) as admin:
+            admin.execute(f"DROP SCHEMA {schema} CASCADE")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=500)
+    parser.add_argument("--sessions", type=int, default=20, help="turns are spread round-robin over this many sessions")
+    parser.add_argument("--db", choices=("memory", "postgres"), default="memory")
+    parser.add_argument("--dsn", default=os.getenv("BENCH_DATABASE_URL", database.DATABASE_URL),
+                        help="Postgres for --db postgres; only a throwaway schema is touched")
+    parser.add_argument("--catalog", choices=("synthetic", "real"), default="synthetic")
+    parser.add_argument("--playlists", type=int, default=5000, help="synthetic catalog size")
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--db-latency", type=float, default=0.001, help="in-memory store latency per call")
+    parser.add_argument("--embed-latency", type=float, default=0.005, help="HashingEncoder latency per call")
+    parser.add_argument("--youtube-latency", type=float, default=0.05)
+    parser.add_argument("--fast-path", action="store_true", help="include the router node")
+    parser.add_argument("--output", help="JSON results file (default: bench_e2e_<commit>.json)")
+    args = parser.parse_args()
+
+    fake_youtube = FakeYouTube(latency=args.youtube_latency)
+    bot2._youtube.set(fake_youtube)
+    # fake API responses must never land in the real .youtube_cache/
+    youtube_cache_dir = tempfile.mkdtemp(prefix="bench_e2e_youtube_")
+    bot2._youtube_api.set(YouTubeClient(lambda: fake_youtube, cache=DiskCache(youtube_cache_dir)))
+    install_catalog(args)
+    llm = TimedToolCallingChatModel(latency=args.llm_latency)
+
+    try:
+        samples = (run_postgres if args.db == "postgres" else run_memory)(args, llm)
+    finally:
+        shutil.rmtree(youtube_cache_dir, ignore_errors=True)
+    summary = summarize(samples)
+
+    print(f"{args.turns} turns, db={args.db}, catalog={args.catalog}, fast_path={args.fast_path}")
+    print(f"{'stage':<10} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8}  (ms)")
+    for stage, row in summary.items():
+        print(f"{stage:<10} {row['mean']:8.2f} {row['p50']:8.2f} {row['p95']:8.2f} {row['p99']:8.2f}")
+
+    commit = git_commit()
+    result = {
+        "benchmark": "e2e",
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "args": vars(args) | {"dsn": None},
+        "stages_ms": summary,
+        "query_cache": setvectordb.query_cache.stats(),
+    }
+    output = args.output or f"bench_e2e_{commit}.json"
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
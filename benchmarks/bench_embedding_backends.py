@@ -0,0 +1,127 @@
+"""Compare the torch, onnx and int8 embedding backends (embeddings.py).
+
+Each backend runs in its own subprocess, so import time and memory are measured
+from a clean interpreter. Reported per backend:
+
+  * load time:  import + model load, as a fresh worker pays it
+  * peak RSS:   after loading and encoding the catalog
+  * encode:     single-query latency percentiles (the bot2 lookup path)
+  * agreement:  share of queries whose top-1 playlist matches the torch backend's,
+                and the mean cosine between each backend's query vectors and torch's
+
+Usage: python benchmarks/bench_embedding_backends.py [--backends torch onnx int8] [--playlists playlist.json]
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def run_child(backend: str, model_name: str, workdir: str) -> None:
+    """Load one backend, encode the catalog and queries, write vectors and timings"""
+    start = time.perf_counter()
+    import embeddings
+    encoder = embeddings.load_encoder(model_name, backend)
+    load_s = time.perf_counter() - start
+
+    with open(os.path.join(workdir, "texts.json")) as f:
+        texts = json.load(f)
+    docs = encoder.encode(texts["names"], normalize_embeddings=True)
+    encoder.encode(texts["queries"][:5], normalize_embeddings=True)  # warm up
+    latencies, queries = [], []
+    for query in texts["queries"]:
+        t = time.perf_counter()
+        queries.append(encoder.encode([query], normalize_embeddings=True)[0])
+        latencies.append(time.perf_counter() - t)
+
+    import resource
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+    np.save(os.path.join(workdir, f"{backend}_docs.npy"), np.asarray(docs, dtype="float32"))
+    np.save(os.path.join(workdir, f"{backend}_queries.npy"), np.asarray(queries, dtype="float32"))
+    p50, p95, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 95, 99])
+    print(json.dumps({"backend": backend, "load_s": load_s, "rss_mb": rss_mb,
+                      "p50_ms": p50, "p95_ms": p95, "p99_ms": p99}))
+
+
+def catalog_names(path: str, n: int) -> list:
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return [p["name"] for p in json.load(f)]
+    from benchmarks.stubs import synthetic_playlists
+    return [p["name"] for p in synthetic_playlists(n)]
+
+
+def make_queries(names: list, n: int, rng: random.Random) -> list:
+    """Lowercased, partial paraphrases of catalog names, like what users type"""
+    queries = []
+    for name in rng.sample(names, min(n, len(names))):
+        words = name.lower().split()
+        keep = max(1, len(words) - rng.randint(0, 2))
+        queries.append("play " + " ".join(words[:keep]))
+    return queries
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "int8"])
+    parser.add_argument("--playlists", default="playlist.json", help="falls back to a synthetic catalog")
+    parser.add_argument("--catalog", type=int, default=2000, help="synthetic catalog size")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--model", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.model, args.workdir)
+        return
+
+    from setvectordb import MODEL_NAME
+    names = catalog_names(args.playlists, args.catalog)
+    queries = make_queries(names, args.queries, random.Random(0))
+    backends = args.backends if "torch" in args.backends else ["torch"] + args.backends
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, "texts.json"), "w") as f:
+            json.dump({"names": names, "queries": queries}, f)
+        for backend in backends:
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", backend, "--workdir", workdir,
+                 "--model", MODEL_NAME],
+                capture_output=True, text=True, cwd=ROOT,
+            )
+            if proc.returncode != 0:
+                print(f"{backend}: failed\n{proc.stderr.strip().splitlines()[-1] if proc.stderr else ''}")
+                continue
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            result["docs"] = np.load(os.path.join(workdir, f"{backend}_docs.npy"))
+            result["queries"] = np.load(os.path.join(workdir, f"{backend}_queries.npy"))
+            results[backend] = result
+
+    print(f"{len(names)} playlists, {len(queries)} queries, model {MODEL_NAME}")
+    print(f"{'backend':<8} {'load s':>7} {'RSS MB':>8} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} "
+          f"{'top-1 agree':>12} {'cosine':>7}")
+    reference = results.get("torch")
+    reference_top1 = (reference["queries"] @ reference["docs"].T).argmax(axis=1) if reference else None
+    for backend, r in results.items():
+        agree, cosine = "", ""
+        if reference is not None and r["queries"].shape == reference["queries"].shape:
+            top1 = (r["queries"] @ r["docs"].T).argmax(axis=1)
+            agree = f"{(top1 == reference_top1).mean() * 100:.1f}%"
+            cosine = f"{np.mean(np.sum(r['queries'] * reference['queries'], axis=1)):.4f}"
+        print(f"{backend:<8} {r['load_s']:7.2f} {r['rss_mb']:8.0f} {r['p50_ms']:7.2f} {r['p95_ms']:7.2f} "
+              f"{r['p99_ms']:7.2f} {agree:>12} {cosine:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Compare Flat, IVF and HNSW playlist indexes on synthetic catalogs.
+
+For each catalog size and index type this reports build time, single-query
+latency percentiles, serialized index size and recall@k against the exact
+flat baseline. Vectors are clustered and L2-normalized like sentence embeddings.
+
+Usage: python benchmarks/bench_index_types.py [--sizes 1000 10000 100000 300000] [--k 5]
+"""
+import argparse
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import setvectordb  # noqa: E402
+
+
+def synthetic_catalog(n: int, dim: int, rng: np.random.Generator) -> np.ndarray:
+    centers = rng.standard_normal((max(n // 100, 1), dim)).astype("float32")
+    x = centers[rng.integers(0, len(centers), n)] + 0.3 * rng.standard_normal((n, dim)).astype("float32")
+    faiss.normalize_L2(x)
+    return x
+
+
+def percentiles(samples) -> str:
+    p50, p95, p99 = np.percentile(np.asarray(samples) * 1000, [50, 95, 99])
+    return f"{p50:7.3f} {p95:7.3f} {p99:7.3f}"
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 300000])
+    parser.add_argument("--kinds", nargs="+", default=["flat", "ivf", "hnsw"])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, default=setvectordb.INDEX_NPROBE)
+    parser.add_argument("--ef-search", type=int, default=setvectordb.INDEX_EF_SEARCH)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'n':>8} {'index':<6} {'build s':>8} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'size MB':>8} {'recall@' + str(args.k):>9}")
+    for n in args.sizes:
+        catalog = synthetic_catalog(n, args.dim, rng)
+        queries = catalog[rng.integers(0, n, args.queries)] + 0.05 * rng.standard_normal((args.queries, args.dim)).astype("float32")
+        faiss.normalize_L2(queries)
+
+        exact = faiss.IndexFlatIP(args.dim)
+        exact.add(catalog)
+        _, truth = exact.search(queries, args.k)
+
+        for kind in args.kinds:
+            start = time.perf_counter()
+            index = setvectordb.create_index(catalog, kind=kind)
+            build = time.perf_counter() - start
+            setvectordb.set_search_params(index, nprobe=args.nprobe, ef_search=args.ef_search)
+
+            latencies = []
+            found = np.empty((args.queries, args.k), dtype="int64")
+            for i in range(args.queries):
+                start = time.perf_counter()
+                _, ids = index.search(queries[i:i + 1], args.k)
+                latencies.append(time.perf_counter() - start)
+                found[i] = ids[0]
+
+            size_mb = faiss.serialize_index(index).nbytes / 1e6
+            print(f"{n:>8} {kind:<6} {build:>8.2f} {percentiles(latencies)} {size_mb:>8.1f} {recall_at_k(found, truth):>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""search_messages latency on synthetic chat history: GIN full-text search vs an ILIKE scan.
+
+Builds the real schema (migrations.py) in a throwaway schema, bulk-loads --messages
+synthetic messages spread over --users users, then times SEARCH_MESSAGES_SQL for
+rare, common and phrase queries as random users. Word frequencies are skewed so
+common terms match a large share of rows, the worst case for ranking. Each line
+shows the plan the planner picked: the GIN index for selective terms, or the
+user's own sessions via the keyset index when a term matches too many rows.
+
+Runs against the database configured in .env (or --dsn); the schema is dropped afterwards.
+
+Usage: python benchmarks/bench_message_search.py [--messages 2000000] [--users 1000] [--baseline]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+
+import numpy as np
+import psycopg
+from psycopg.conninfo import make_conninfo
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations  # noqa: E402
+from database import DATABASE_URL  # noqa: E402
+from database_manager import SEARCH_MESSAGES_SQL  # noqa: E402
+
+# index 0 is the most frequent once skewed by power(random(), 3)
+VOCABULARY = (
+    "the play music playlist song please open youtube some my for a mix chill lofi study "
+    "workout morning focus rock jazz piano guitar classical beats evening rain coffee "
+    "sleep party road trip acoustic indie hip hop soul funk blues ambient synthwave "
+    "orchestra violin saxophone bossa nova flamenco reggae gospel opera techno trance"
+).split()
+
+SEED_USERS_SQL = """
+    INSERT INTO users (user_id, username)
+    SELECT 'u' || i, 'user' || i FROM generate_series(1, %(users)s) i
+    """
+SEED_SESSIONS_SQL = """
+    INSERT INTO sessions (session_id, user_id, start_time)
+    SELECT 's' || i, 'u' || (1 + mod(i, %(users)s)), now() - i * interval '1 minute'
+    FROM generate_series(1, %(sessions)s) i
+    """
+# the inner series depends on i, so the random sentence is drawn per row
+SEED_MESSAGES_SQL = """
+    INSERT INTO messages (message_id, session_id, sender, message_text, created_at)
+    SELECT 'm' || i, 's' || (1 + mod(i, %(sessions)s)),
+           CASE WHEN mod(i, 2) = 0 THEN 'user' ELSE 'ai' END,
+           (SELECT string_agg((%(words)s::text[])[1 + floor(power(random(), 3) * %(nwords)s)::int], ' ')
+            FROM generate_series(1, 6 + mod(i, 10))),
+           now() - i * interval '1 second'
+    FROM generate_series(%(start)s::int, %(stop)s::int) i
+    """
+ILIKE_SQL = """
+    SELECT m.session_id, s.session_name, m.sender, m.message_text, m.created_at
+    FROM messages m JOIN sessions s ON s.session_id = m.session_id
+    WHERE s.user_id = %(user_id)s AND m.message_text ILIKE %(pattern)s
+    ORDER BY m.created_at DESC
+    LIMIT %(limit)s
+    """
+
+QUERIES = {
+    "rare term": "flamenco",
+    "two rare terms": "opera techno",
+    "common term": "playlist",
+    "phrase": '"jazz piano"',
+    "excluded term": "rock -morning",
+}
+
+
+def seed(cur, args) -> None:
+    sessions = args.users * args.sessions_per_user
+    cur.execute(SEED_USERS_SQL, {"users": args.users})
+    cur.execute(SEED_SESSIONS_SQL, {"users": args.users, "sessions": sessions})
+    start = time.perf_counter()
+    for lo in range(1, args.messages + 1, args.batch):
+        hi = min(lo + args.batch - 1, args.messages)
+        cur.execute(SEED_MESSAGES_SQL, {"sessions": sessions, "words": VOCABULARY,
+                                        "nwords": len(VOCABULARY), "start": lo, "stop": hi})
+        print(f"  loaded {hi:,} messages ({time.perf_counter() - start:.0f}s)", end="\r")
+    print()
+    cur.execute("ANALYZE")
+
+
+def time_query(cur, sql: str, params_for, runs: int) -> np.ndarray:
+    samples = []
+    for _ in range(runs):
+        params = params_for()
+        start = time.perf_counter()
+        cur.execute(sql, params)
+        cur.fetchall()
+        samples.append(time.perf_counter() - start)
+    return np.asarray(samples) * 1000
+
+
+def uses_gin(cur, params: dict) -> bool:
+    cur.execute("EXPLAIN " + SEARCH_MESSAGES_SQL, params)
+    return any("messages_tsv_idx" in row[0] for row in cur.fetchall())
+
+
+def report(name: str, ms: np.ndarray) -> None:
+    print(f"  {name:<28} p50 {np.percentile(ms, 50):8.2f} ms  p95 {np.percentile(ms, 95):8.2f}  "
+          f"max {ms.max():8.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--sessions-per-user", type=int, default=50)
+    parser.add_argument("--runs", type=int, default=50, help="timed searches per query")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=500_000, help="messages per load statement")
+    parser.add_argument("--baseline", action="store_true", help="also time an ILIKE scan (slow)")
+    parser.add_argument("--dsn", default=os.getenv("BENCH_DATABASE_URL", DATABASE_URL))
+    args = parser.parse_args()
+
+    schema = f"bench_search_{uuid.uuid4().hex[:8]}"
+    with psycopg.connect(args.dsn, autocommit=True) as admin:
+        admin.execute(f"CREATE SCHEMA {schema}")
+    try:
+        conninfo = make_conninfo(args.dsn, options=f"-c search_path={schema}")
+        migrations.migrate(conninfo)
+        with psycopg.connect(conninfo, autocommit=True) as conn, conn.cursor() as cur:
+            print(f"seeding {args.messages:,} messages for {args.users:,} users")
+            seed(cur, args)
+
+            def random_user() -> str:
+                return f"u{random.randint(1, args.users)}"
+
+            print(f"search_messages (limit {args.limit}, {args.runs} runs, random user each run)")
+            for name, query in QUERIES.items():
+                def params():
+                    return {"user_id": random_user(), "query": query, "limit": args.limit}
+                ms = time_query(cur, SEARCH_MESSAGES_SQL, params, args.runs)
+                plan = "GIN" if uses_gin(cur, params()) else "user's sessions"
+                report(f"{name} [{plan}]", ms)
+
+            if args.baseline:
+                print("ILIKE scan baseline")
+                for name, query in QUERIES.items():
+                    term = query.strip('"').split()[0]
+                    def params():
+                        return {"user_id": random_user(), "pattern": f"%{term}%", "limit": args.limit}
+                    report(name, time_query(cur, ILIKE_SQL, params, max(args.runs // 10, 3)))
+    finally:
+        with psycopg.connect(args.dsn, autocommit=True) as admin:
+            admin.execute(f"DROP SCHEMA {schema} CASCADE")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""DB time per chat turn: legacy per-message writes vs the single-round-trip insert_turn.
+
+Legacy: INSERT user msg, SELECT COUNT(*), conditional UPDATE, INSERT ai msg (4 round-trips).
+New:    one INSERT ... CTE ... UPDATE statement (1 round-trip).
+
+Runs against the database configured in .env inside a throwaway schema that is
+dropped afterwards, so real tables are never touched.
+
+Usage: python benchmarks/bench_turn_persistence.py [--sessions 50] [--turns 20]
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+import psycopg
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DATABASE_URL, connection_kwargs  # noqa: E402
+from database_manager import INSERT_MESSAGE_SQL, INSERT_TURN_SQL, UPDATE_SESSION_NAME_SQL, turn_params  # noqa: E402
+
+LEGACY_COUNT_SQL = "SELECT COUNT(*) FROM messages WHERE session_id = %s"
+
+# one statement each: with prepare_threshold=0 every execute is prepared, and a
+# prepared statement can't hold several commands
+SCHEMA_SQL = (
+    "CREATE TABLE sessions (session_id TEXT PRIMARY KEY, user_id TEXT, session_name TEXT, start_time TIMESTAMP)",
+    """CREATE TABLE messages (message_id TEXT PRIMARY KEY, session_id TEXT, sender TEXT,
+                           message_text TEXT, created_at TIMESTAMP)""",
+    "CREATE INDEX ON messages (session_id)",
+)
+
+
+def legacy_turn(cur, session_id: str, user_text: str, ai_text: str) -> None:
+    cur.execute(INSERT_MESSAGE_SQL, (str(uuid.uuid4()), session_id, "user", user_text, datetime.now()))
+    cur.execute(LEGACY_COUNT_SQL, (session_id,))
+    if cur.fetchone()[0] == 1:
+        cur.execute(UPDATE_SESSION_NAME_SQL, (user_text[:30], session_id))
+    cur.execute(INSERT_MESSAGE_SQL, (str(uuid.uuid4()), session_id, "ai", ai_text, datetime.now()))
+
+
+def single_turn(cur, session_id: str, user_text: str, ai_text: str) -> None:
+    cur.execute(INSERT_TURN_SQL, turn_params(session_id, user_text, ai_text))
+
+
+def run(cur, turn_fn, sessions: int, turns: int) -> np.ndarray:
+    session_ids = [str(uuid.uuid4()) for _ in range(sessions)]
+    for sid in session_ids:
+        cur.execute("INSERT INTO sessions (session_id, user_id, start_time) VALUES (%s, 'bench', now())", (sid,))
+    samples = []
+    for turn in range(turns):
+        for sid in session_ids:
+            start = time.perf_counter()
+            turn_fn(cur, sid, f"play my workout playlist {turn}", "playing playlist for workout")
+            samples.append(time.perf_counter() - start)
+    return np.asarray(samples) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=20)
+    args = parser.parse_args()
+
+    schema = f"bench_turns_{uuid.uuid4().hex[:8]}"
+    with psycopg.Connection.connect(DATABASE_URL, **connection_kwargs) as conn, conn.cursor() as cur:
+        cur.execute(f"CREATE SCHEMA {schema}")
+        try:
+            cur.execute(f"SET search_path TO {schema}")
+            for statement in SCHEMA_SQL:
+                cur.execute(statement)
+            for name, fn in (("legacy (4 statements)", legacy_turn), ("insert_turn (1 statement)", single_turn)):
+                ms = run(cur, fn, args.sessions, args.turns)
+                print(f"{name:<26} mean {ms.mean():7.2f} ms  p50 {np.percentile(ms, 50):7.2f}  "
+                      f"p95 {np.percentile(ms, 95):7.2f}  p99 {np.percentile(ms, 99):7.2f}  per turn")
+        finally:
+            cur.execute(f"DROP SCHEMA {schema} CASCADE")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Startup-time benchmark for the playlist FAISS index: cold build vs disk cache hit.
+
+Usage: python benchmarks/bench_vectordb_startup.py [--playlists playlist.json] [--runs 3]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import setvectordb  # noqa: E402
+
+
+def time_load(path: str, cache_dir: str) -> float:
+    start = time.perf_counter()
+    setvectordb.load_or_build(path=path, cache_dir=cache_dir)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--playlists", default=setvectordb.PLAYLIST_PATH)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    cold, warm = [], []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cold.append(time_load(args.playlists, cache_dir))
+            warm.append(time_load(args.playlists, cache_dir))
+
+    best_cold, best_warm = min(cold), min(warm)
+    print(f"playlist file: {args.playlists}  runs: {args.runs}")
+    print(f"cold build : best {best_cold * 1000:8.1f} ms  mean {sum(cold) / len(cold) * 1000:8.1f} ms")
+    print(f"cache hit  : best {best_warm * 1000:8.1f} ms  mean {sum(warm) / len(warm) * 1000:8.1f} ms")
+    print(f"speedup    : {best_cold / best_warm:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
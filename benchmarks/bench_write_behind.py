@@ -0,0 +1,183 @@
+"""Request-path cost of persisting a chat turn: synchronous insert_turn vs the write-behind queue.
+
+  * sync:         one INSERT_TURN_SQL round-trip per turn, as ChatHandler does without WRITE_BEHIND
+  * write-behind: WriteBehindQueue.submit_turn() on the request path, batches written
+                  by the background writer; reports enqueue latency and drain throughput
+  * outage:       the writer's connections fail for --outage seconds; turns (the same
+                  message repeated, the case a text match gets wrong) keep being
+                  accepted, stay readable through merge_pending, and are all written
+                  once the database is back
+
+Builds the real schema (migrations.py) in a throwaway schema on the database configured
+in .env (or --dsn) and drops it afterwards. Exits 1 if any turn is missing, duplicated
+or out of order, or was not readable before it was written.
+
+Usage: python benchmarks/bench_write_behind.py [--sessions 50] [--turns 40] [--batch 200]
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+import psycopg
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import ConnectionPool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations  # noqa: E402
+from database import DATABASE_URL, connection_kwargs  # noqa: E402
+from database_manager import INSERT_TURN_SQL, turn_params  # noqa: E402
+from write_behind import WriteBehindQueue, merge_pending  # noqa: E402
+
+SESSION_ROWS_SQL = """
+    SELECT sender, message_text FROM messages WHERE session_id = %s ORDER BY created_at, message_id
+    """
+SESSION_ROWS_WITH_IDS_SQL = """
+    SELECT message_id, sender, message_text FROM messages WHERE session_id = %s ORDER BY created_at, message_id
+    """
+
+
+def turn_texts(session: int, turn: int):
+    return f"play workout mix {turn} for session {session}", f"playing workout mix {turn}"
+
+
+def repeated_texts(session: int, turn: int):
+    return turn_texts(session, 0)
+
+
+def create_sessions(pool, count: int) -> list:
+    session_ids = [str(uuid.uuid4()) for _ in range(count)]
+    with pool.connection() as conn:
+        conn.execute("INSERT INTO users (user_id, username) VALUES ('bench', 'bench') ON CONFLICT DO NOTHING")
+        with conn.cursor() as cur:
+            cur.executemany("INSERT INTO sessions (session_id, user_id, start_time) VALUES (%s, 'bench', now())",
+                            [(sid,) for sid in session_ids])
+    return session_ids
+
+
+def expected_rows(session: int, turns: int, texts=turn_texts) -> list:
+    rows = []
+    for turn in range(turns):
+        user_text, ai_text = texts(session, turn)
+        rows.extend([("user", user_text), ("ai", ai_text)])
+    return rows
+
+
+def check(pool, session_ids: list, turns: int, texts=turn_texts) -> int:
+    """Sessions whose stored history differs from what was sent"""
+    bad = 0
+    with pool.connection() as conn, conn.cursor() as cur:
+        for i, sid in enumerate(session_ids):
+            cur.execute(SESSION_ROWS_SQL, (sid,))
+            if cur.fetchall() != expected_rows(i, turns, texts):
+                bad += 1
+    return bad
+
+
+def report(name: str, ms: np.ndarray) -> None:
+    print(f"  {name:<22} p50 {np.percentile(ms, 50):8.3f} ms  p99 {np.percentile(ms, 99):8.3f}  "
+          f"max {ms.max():8.3f}")
+
+
+def run_sync(pool, session_ids: list, turns: int) -> np.ndarray:
+    samples = []
+    for turn in range(turns):
+        for i, sid in enumerate(session_ids):
+            start = time.perf_counter()
+            with pool.connection() as conn:
+                conn.execute(INSERT_TURN_SQL, turn_params(sid, *turn_texts(i, turn)))
+            samples.append(time.perf_counter() - start)
+    return np.asarray(samples) * 1000
+
+
+def run_write_behind(writer: WriteBehindQueue, session_ids: list, turns: int, texts=turn_texts) -> np.ndarray:
+    samples = []
+    for turn in range(turns):
+        for i, sid in enumerate(session_ids):
+            params = turn_params(sid, *texts(i, turn))
+            start = time.perf_counter()
+            writer.submit_turn(params)
+            samples.append(time.perf_counter() - start)
+    return np.asarray(samples) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=40, help="turns per session")
+    parser.add_argument("--batch", type=int, default=200, help="WRITE_BEHIND_BATCH")
+    parser.add_argument("--outage", type=float, default=2.0, help="seconds the writer cannot reach the database")
+    parser.add_argument("--dsn", default=os.getenv("BENCH_DATABASE_URL", DATABASE_URL))
+    args = parser.parse_args()
+
+    schema = f"bench_write_behind_{uuid.uuid4().hex[:8]}"
+    with psycopg.connect(args.dsn, autocommit=True) as admin:
+        admin.execute(f"CREATE SCHEMA {schema}")
+    failures = 0
+    try:
+        conninfo = make_conninfo(args.dsn, options=f"-c search_path={schema}")
+        migrations.migrate(conninfo)
+        with ConnectionPool(conninfo, min_size=2, max_size=4, kwargs=connection_kwargs, open=True) as pool:
+            turns = args.sessions * args.turns
+            print(f"{args.sessions} sessions x {args.turns} turns ({turns:,} turns) per run")
+
+            session_ids = create_sessions(pool, args.sessions)
+            start = time.perf_counter()
+            report("sync insert_turn", run_sync(pool, session_ids, args.turns))
+            print(f"  {'':<22} {turns / (time.perf_counter() - start):8.0f} turns/s")
+            failures += check(pool, session_ids, args.turns)
+
+            session_ids = create_sessions(pool, args.sessions)
+            writer = WriteBehindQueue(batch_size=args.batch, connection=pool.connection)
+            start = time.perf_counter()
+            enqueue = run_write_behind(writer, session_ids, args.turns)
+            writer.flush()
+            elapsed = time.perf_counter() - start
+            report("write-behind enqueue", enqueue)
+            stats = writer.stats()
+            print(f"  {'':<22} {turns / elapsed:8.0f} turns/s drained in {stats['batches']} batches")
+            failures += check(pool, session_ids, args.turns)
+
+            # outage: every connection attempt fails until the deadline passes
+            session_ids = create_sessions(pool, args.sessions)
+            down_until = time.monotonic() + args.outage
+
+            @contextmanager
+            def flaky_connection():
+                if time.monotonic() < down_until:
+                    raise psycopg.OperationalError("simulated outage")
+                with pool.connection() as conn:
+                    yield conn
+
+            writer = WriteBehindQueue(batch_size=args.batch, retry_base=0.1, retry_max=0.5,
+                                      connection=flaky_connection)
+            run_write_behind(writer, session_ids, args.turns, repeated_texts)
+            unreadable = 0
+            with pool.connection() as conn, conn.cursor() as cur:
+                for i, sid in enumerate(session_ids):
+                    pending = writer.pending_rows(sid)
+                    cur.execute(SESSION_ROWS_WITH_IDS_SQL, (sid,))
+                    if merge_pending(cur.fetchall(), pending) != expected_rows(i, args.turns, repeated_texts):
+                        unreadable += 1
+            start = time.perf_counter()
+            drained = writer.close(timeout=args.outage + 30)
+            stats = writer.stats()
+            print(f"  outage {args.outage:.1f}s: {stats['retries']} retries, drained "
+                  f"{time.perf_counter() - start:.2f}s after the last turn, "
+                  f"{unreadable} sessions unreadable meanwhile")
+            failures += unreadable + (0 if drained else 1) + check(pool, session_ids, args.turns, repeated_texts)
+    finally:
+        with psycopg.connect(args.dsn, autocommit=True) as admin:
+            admin.execute(f"DROP SCHEMA {schema} CASCADE")
+
+    print("ok" if not failures else f"{failures} sessions with missing or misordered turns")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
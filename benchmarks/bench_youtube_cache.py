@@ -0,0 +1,149 @@
+"""YouTube API calls and latency with the disk cache and quota budget, against a local API stub.
+
+Replays a workload of searches (with repeats, like a user asking for the same music
+again) through YouTubeClient backed by FakeYouTube, then checks the cache states:
+
+  cold    first lookup of each query goes to the API
+  warm    repeats are served from disk, no API call
+  stale   entries past the TTL are served at once and refreshed in the background
+  quota   with the budget spent, cached queries still answer and new ones raise QuotaExceeded
+  found   a playlist found through the API and added to the index survives a
+          playlist.json sync and a reload from the index cache
+
+Exits 1 if any check fails.
+
+Usage: python benchmarks/bench_youtube_cache.py [--queries 50] [--repeats 4] [--api-ms 150]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import setvectordb  # noqa: E402
+from benchmarks.stubs import FakeYouTube, HashingEncoder, synthetic_playlists  # noqa: E402
+from youtube_client import QUOTA_COST, DiskCache, QuotaBudget, QuotaExceeded, YouTubeClient  # noqa: E402
+
+
+def timed_search(client: YouTubeClient, query: str, kind: str = "video") -> float:
+    start = time.perf_counter()
+    client.search(query, kind=kind)
+    return time.perf_counter() - start
+
+
+def wait_for_refreshes(client: YouTubeClient, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while client._refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def check_found_playlists(failures: list) -> None:
+    """An API-found playlist stays in the index across a playlist.json sync and a reload"""
+    model = HashingEncoder()
+    found = {"id": "PLfoundthroughapi", "name": "rainy day bossa nova found through the api"}
+    with tempfile.TemporaryDirectory() as tmp:
+        path, cache_dir = os.path.join(tmp, "playlist.json"), os.path.join(tmp, "cache")
+        catalog = synthetic_playlists(200)
+        with open(path, "w") as f:
+            json.dump(catalog, f)
+        store = setvectordb.load_or_build(path, cache_dir=cache_dir, model=model)
+        store.add_discovered([found])
+
+        # what the watcher does after playlist.json changes
+        with open(path, "w") as f:
+            json.dump(catalog[1:] + [{"id": "PLaddedtojson", "name": "added to playlist.json"}], f)
+        playlists, raw = setvectordb.load_playlists(path)
+        diff = store.sync(playlists)
+        store.save(raw)
+        if found not in store.playlists:
+            failures.append("found playlist was dropped by a playlist.json sync")
+
+        reloaded = setvectordb.load_or_build(path, cache_dir=cache_dir, model=model)
+        query = model.encode([found["name"]], normalize_embeddings=True)
+        best = reloaded.search(query, 1)[0][0][0] if reloaded.playlists else None
+        if found not in reloaded.playlists or best != found:
+            failures.append("found playlist was lost on reload")
+        print(f"  found       sync {diff}, reloaded {len(reloaded.playlists)} playlists, "
+              f"best match {best['id'] if best else None}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=50, help="distinct queries")
+    parser.add_argument("--repeats", type=int, default=4, help="times each query is asked")
+    parser.add_argument("--api-ms", type=float, default=150.0, help="simulated API round-trip")
+    args = parser.parse_args()
+
+    queries = [f"lofi study mix {i}" for i in range(args.queries)]
+    workload = queries * args.repeats
+    random.Random(0).shuffle(workload)
+    failures = []
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        api = FakeYouTube(latency=args.api_ms / 1000)
+        client = YouTubeClient(lambda: api, cache=DiskCache(cache_dir), budget=QuotaBudget(10 ** 9))
+
+        seen, cold, warm = set(), [], []
+        for query in workload:
+            (warm if query in seen else cold).append(timed_search(client, query))
+            seen.add(query)
+        api_calls = len(api.calls)
+        print(f"workload: {len(workload)} searches, {args.queries} distinct")
+        print(f"  api calls   {api_calls} ({len(workload) - api_calls} avoided, "
+              f"{(len(workload) - api_calls) * QUOTA_COST['search']} quota units saved)")
+        print(f"  cold p50    {statistics.median(cold) * 1000:8.2f} ms")
+        print(f"  warm p50    {statistics.median(warm) * 1000:8.2f} ms")
+        if api_calls != args.queries:
+            failures.append(f"expected {args.queries} api calls, got {api_calls}")
+
+        # every entry is now past the TTL but within the stale window
+        client.ttl = 0.0
+        before = len(api.calls)
+        stale = [timed_search(client, query) for query in queries]
+        wait_for_refreshes(client)
+        print(f"  stale p50   {statistics.median(stale) * 1000:8.2f} ms "
+              f"({len(api.calls) - before} background refreshes)")
+        if statistics.median(stale) * 1000 >= args.api_ms:
+            failures.append("stale hits waited for the API")
+        if len(api.calls) - before != args.queries:
+            failures.append(f"expected {args.queries} background refreshes, got {len(api.calls) - before}")
+
+        # spend the whole budget: cached queries still answer, new ones can't
+        client.ttl = 3600.0
+        client.budget = QuotaBudget(0)
+        before = len(api.calls)
+        try:
+            client.search(queries[0])
+        except QuotaExceeded:
+            failures.append("cached query failed with the quota spent")
+        try:
+            client.search("never asked before")
+            failures.append("uncached query did not raise QuotaExceeded")
+        except QuotaExceeded:
+            pass
+        client.ttl = 0.0
+        client.stale_ttl = 0.0
+        try:
+            client.search(queries[1])  # expired, but any copy beats nothing
+        except QuotaExceeded:
+            failures.append("expired cached query failed with the quota spent")
+        if len(api.calls) != before:
+            failures.append("API was called with the quota spent")
+        print(f"  stats       {client.stats()}")
+
+    check_found_playlists(failures)
+
+    if failures:
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        sys.exit(1)
+    print("all cache checks passed")
+
+
+if __name__ == "__main__":
+    main()
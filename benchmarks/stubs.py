@@ -0,0 +1,288 @@
+"""Offline stand-ins for the LLM, embedding model, YouTube API and message store, shared by the benchmarks."""
+import asyncio
+import hashlib
+import threading
+import time
+import uuid
+import webbrowser
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from context_manager import count_tokens
+
+# tools must never open a real browser during a benchmark
+webbrowser.open = lambda *args, **kwargs: True
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Chat model that sleeps for ``latency`` seconds and returns a canned reply.
+
+    ``latency_per_1k_tokens`` adds prompt-size dependent time, like prefill on a real model.
+    """
+
+    latency: float = 0.05
+    latency_per_1k_tokens: float = 0.0
+    reply: str = "ok"
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _delay(self, messages: List[BaseMessage]) -> float:
+        if not self.latency_per_1k_tokens:
+            return self.latency
+        return self.latency + count_tokens(messages) / 1000 * self.latency_per_1k_tokens
+
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        return AIMessage(content=self.reply)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self._delay(messages))
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self._delay(messages))
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    def bind_tools(self, tools, **kwargs) -> "ScriptedChatModel":
+        return self
+
+
+class EchoChatModel(ScriptedChatModel):
+    """Replies with the latest user message, so a reply shows which conversation produced it"""
+
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        last = next((m for m in reversed(messages) if isinstance(m, HumanMessage)), None)
+        return AIMessage(content=f"echo: {last.content if last else ''}")
+
+
+class ToolCallingChatModel(ScriptedChatModel):
+    """Chat model that answers like the real assistant would, with scripted tool calls.
+
+    A user message mentioning a playlist/mix/album calls play_playlist, "open <url>"
+    calls open_url, "play"/"search" calls youtube_search, anything else gets a plain
+    reply. After a tool result it replies with a short confirmation.
+    """
+
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        last = messages[-1] if messages else None
+        if isinstance(last, ToolMessage):
+            return AIMessage(content=f"Done: {last.content}")
+        text = last.content if isinstance(last, HumanMessage) else ""
+        lowered = text.lower()
+        if any(word in lowered for word in ("playlist", "mix", "album")):
+            call = {"name": "play_playlist", "args": {"query": text}}
+        elif lowered.startswith("open "):
+            call = {"name": "open_url", "args": {"link": text.split(None, 1)[1]}}
+        elif lowered.startswith(("play ", "search ")):
+            call = {"name": "youtube_search", "args": {"query": text.split(None, 1)[1]}}
+        else:
+            return AIMessage(content=self.reply)
+        return AIMessage(content="", tool_calls=[{**call, "id": f"call_{uuid.uuid4().hex}"}])
+
+
+class HashingEncoder:
+    """SentenceTransformer stand-in: deterministic bag-of-words vectors, no model download.
+
+    Texts sharing words get similar vectors, which is enough for the index to return
+    sensible matches. ``latency`` is slept per encode call to mimic model cost.
+    """
+
+    def __init__(self, dimension: int = 384, latency: float = 0.0):
+        self.dimension = dimension
+        self.latency = latency
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def encode(self, texts, normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        if self.latency:
+            time.sleep(self.latency)
+        out = np.zeros((len(texts), self.dimension), dtype="float32")
+        for row, text in enumerate(texts):
+            for word in str(text).lower().split():
+                h = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "big")
+                out[row, h % self.dimension] += 1.0 if (h >> 32) & 1 else -1.0
+        if normalize_embeddings:
+            norms = np.linalg.norm(out, axis=1, keepdims=True)
+            out /= np.where(norms == 0, 1, norms)
+        return out
+
+
+def synthetic_playlists(n: int) -> List[Dict]:
+    """playlist.json-shaped entries with varied names"""
+    genres = ["lofi", "jazz", "workout", "focus", "rock", "classical", "hip hop", "ambient", "sleep", "party"]
+    moods = ["chill", "morning", "late night", "rainy day", "summer", "study", "road trip", "deep", "happy", "sad"]
+    return [{"id": f"PL{i:08d}", "name": f"{moods[i % len(moods)]} {genres[(i // len(moods)) % len(genres)]} mix {i}"}
+            for i in range(n)]
+
+
+class _Request:
+    def __init__(self, response: Dict, latency: float):
+        self.response = response
+        self.latency = latency
+
+    def execute(self) -> Dict:
+        if self.latency:
+            time.sleep(self.latency)
+        return self.response
+
+
+class _Resource:
+    def __init__(self, youtube: "FakeYouTube", kind: str):
+        self.youtube = youtube
+        self.kind = kind
+
+    def list(self, **params) -> _Request:
+        self.youtube.calls.append((self.kind, params))
+        return _Request(self.youtube.respond(self.kind, params), self.youtube.latency)
+
+
+class FakeYouTube:
+    """googleapiclient youtube v3 stand-in for search().list() / playlists().list() / playlistItems().list()"""
+
+    def __init__(self, latency: float = 0.0, results: int = 5):
+        self.latency = latency
+        self.results = results
+        self.calls: List = []
+
+    def search(self) -> _Resource:
+        return _Resource(self, "search")
+
+    def playlists(self) -> _Resource:
+        return _Resource(self, "playlists")
+
+    def playlistItems(self) -> _Resource:
+        return _Resource(self, "playlistItems")
+
+    def respond(self, kind: str, params: Dict) -> Dict:
+        query = params.get("q") or params.get("id") or params.get("playlistId") or ""
+        slug = hashlib.blake2b(str(query).encode(), digest_size=6).hexdigest()
+        count = min(int(params.get("maxResults", self.results)), self.results)
+        if kind == "search":
+            wanted = params.get("type", "video")
+            items = [{"id": {"kind": f"youtube#{wanted}", "playlistId" if wanted == "playlist" else "videoId": f"{slug}{i}"},
+                      "snippet": {"title": f"{query} result {i}", "channelTitle": "Fake channel"}}
+                     for i in range(count)]
+        else:
+            items = [{"id": f"{slug}{i}", "snippet": {"title": f"{query} item {i}"}} for i in range(count)]
+        return {"kind": f"youtube#{kind}ListResponse", "items": items, "pageInfo": {"totalResults": len(items)}}
+
+
+class InMemoryDatabaseManager:
+    """Dict-backed DatabaseManager with a fixed per-call latency"""
+
+    def __init__(self, latency: float = 0.002):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.users = {}
+        self.sessions = {}
+        self.messages = {}
+
+    def _wait(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    def insert_message(self, session_id: str, sender: str, message_text: str) -> None:
+        self._wait()
+        with self.lock:
+            rows = self.messages.setdefault(session_id, [])
+            rows.append((sender, message_text))
+            if sender == "user" and self.sessions[session_id]["session_name"] is None:
+                self.sessions[session_id]["session_name"] = message_text[:30]
+
+    def insert_turn(self, session_id: str, user_text: str, ai_text: str, user_at=None):
+        self._wait()
+        with self.lock:
+            rows = self.messages.setdefault(session_id, [])
+            rows.extend([("user", user_text), ("ai", ai_text)])
+            if self.sessions[session_id]["session_name"] is None:
+                self.sessions[session_id]["session_name"] = user_text[:30]
+        return str(uuid.uuid4()), str(uuid.uuid4())
+
+    def record_turn(self, session_id: str, user_text: str, message_count: int = 2) -> None:
+        self._wait()
+        with self.lock:
+            session = self.sessions[session_id]
+            session["session_name"] = session["session_name"] or user_text[:30]
+
+    def create_session(self, user_id: str) -> str:
+        self._wait()
+        session_id = str(uuid.uuid4())
+        with self.lock:
+            self.sessions[session_id] = {"user_id": user_id, "session_name": None, "start_time": datetime.now()}
+        return session_id
+
+    def get_or_create_user(self, username: str) -> str:
+        self._wait()
+        with self.lock:
+            return self.users.setdefault(username, str(uuid.uuid4()))
+
+    def get_session_messages(self, session_id: str):
+        self._wait()
+        with self.lock:
+            return list(self.messages.get(session_id, []))
+
+    def get_session_messages_page(self, session_id: str, limit: int = 50, before=None):
+        self._wait()
+        with self.lock:
+            rows = self.messages.get(session_id, [])
+            end = len(rows) if before is None else before
+            start = max(end - limit, 0)
+            return list(rows[start:end]), (start if start > 0 else None)
+
+    def get_user_sessions(self, user_id: str):
+        self._wait()
+        with self.lock:
+            rows = [
+                (sid, s["session_name"] or "[unnamed]", s["start_time"], len(self.messages.get(sid, [])))
+                for sid, s in self.sessions.items() if s["user_id"] == user_id
+            ]
+        return sorted(rows, key=lambda r: r[2], reverse=True)[:20]
+
+    def update_session_name(self, session_id: str, new_name: str) -> None:
+        self._wait()
+        with self.lock:
+            self.sessions[session_id]["session_name"] = new_name
+
+    def get_session_info(self, session_id: str) -> Optional[Any]:
+        self._wait()
+        with self.lock:
+            s = self.sessions.get(session_id)
+            return (session_id, s["session_name"], s["start_time"]) if s else None
+
+    def get_session_owner(self, session_id: str) -> Optional[str]:
+        self._wait()
+        with self.lock:
+            s = self.sessions.get(session_id)
+            return s["user_id"] if s else None
+
+    def delete_session(self, session_id: str) -> None:
+        self._wait()
+        with self.lock:
+            self.messages.pop(session_id, None)
+            self.sessions.pop(session_id, None)
+
+
+class AsyncInMemoryDatabaseManager:
+    """Async facade over InMemoryDatabaseManager; latency is awaited instead of slept"""
+
+    def __init__(self, latency: float = 0.002):
+        self.latency = latency
+        self._sync = InMemoryDatabaseManager(latency=0)
+
+    def __getattr__(self, name: str):
+        method = getattr(self._sync, name)
+
+        async def call(*args, **kwargs):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return method(*args, **kwargs)
+
+        return call
@@ -1,51 +1,125 @@
-from langgraph.graph import StateGraph,START,END 
-from typing import TypedDict,Annotated 
+from langgraph.graph import StateGraph,START,END
+from typing import TypedDict,Annotated
 from langchain_core.messages import BaseMessage ,HumanMessage
-from langchain_openai import ChatOpenAI 
-from langgraph.graph.message import add_messages 
-from dotenv import load_dotenv 
+from langchain_openai import ChatOpenAI
+from langgraph.graph.message import add_messages
+from dotenv import load_dotenv
 
 from langgraph.checkpoint.postgres import PostgresSaver
-from psycopg import Connection 
-import os 
-from langgraph.prebuilt import ToolNode, tools_condition 
-import webbrowser 
-from langchain_core.tools import tool 
-import numpy as np
-from setvectordb import playlists,index,model
-import time 
-from googleapiclient.discovery import build 
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from langchain_core.runnables import RunnableLambda
+import database
+import os
+from langgraph.prebuilt import tools_condition
+import webbrowser
+from langchain_core.tools import tool
+import setvectordb
+import metrics
+from context_manager import ContextManager
+from tool_executor import ToolExecutor
+from youtube_client import YouTubeClient
+import response_cache
+import router as fast_path
+import asyncio
+import startup
+import time
+from googleapiclient.discovery import build
 
 load_dotenv()
 
-llm = ChatOpenAI(model="gpt-5-mini-2025-08-07")
+### -------- Lazy resources --------
+# nothing below connects or loads a model at import time; each resource is
+# created on first use, or warmed in the background via startup.warm_up_in_background()
+_llm = startup.lazy("llm",lambda: ChatOpenAI(model="gpt-5-mini-2025-08-07"))
 
-DATABASE_URL = f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
+def _create_checkpointer():
+  # shares the bounded pool with DatabaseManager instead of holding its own socket
+  checkpointer = PostgresSaver(database.get_pool())
+  checkpointer.setup()
+  return checkpointer
 
-connection_kwargs = {
-    "autocommit": True,
-    "prepare_threshold": 0,
-}
-conn = Connection.connect(DATABASE_URL, **connection_kwargs)
-checkpointer = PostgresSaver(conn)
-checkpointer.setup()
+_checkpointer = startup.lazy("checkpointer",_create_checkpointer)
+
+async def _create_async_checkpointer():
+  checkpointer = AsyncPostgresSaver(await database.get_async_pool())
+  await checkpointer.setup()
+  return checkpointer
+
+_async_checkpointer = startup.lazy_async("async_checkpointer",_create_async_checkpointer)
 
 ####------------Youtube-- Setup----####
-youtube = build("youtube","v3",developerKey=os.getenv("YOUTUBE_API_KEY"))
+_youtube = startup.lazy("youtube",lambda: build("youtube","v3",developerKey=os.getenv("YOUTUBE_API_KEY")))
+
+def _create_youtube_api():
+  # every API call goes through the one service above, a disk cache and the quota budget
+  client = YouTubeClient(get_youtube)
+  metrics.register_collector("assistant_youtube_api",client.stats)
+  return client
+
+_youtube_api = startup.lazy("youtube_api",_create_youtube_api)
+
+# a local index match scoring at least this is trusted without asking the API
+PLAYLIST_MATCH_THRESHOLD = float(os.getenv("PLAYLIST_MATCH_THRESHOLD","0.5"))
+## -----------------------------------
+
+def get_llm():
+  return _llm.get()
+
+def get_checkpointer():
+  return _checkpointer.get()
+
+def get_youtube():
+  return _youtube.get()
+
+def get_youtube_api():
+  return _youtube_api.get()
+
+async def get_async_checkpointer():
+  return await _async_checkpointer.get()
 ## -----------------------------------
 
 ### --------Graph initialization-------
 class ChatState(TypedDict):
   messages :Annotated[list[BaseMessage],add_messages]
+  # rolling summary of messages[:summarized_count], maintained by ContextManager
+  summary :str
+  summarized_count :int
 
 ##--------------------------------
 
 ### helper functions -----------
+def get_playlist_matches(queries:list[str],k:int=1)->list[list[tuple]]:
+  """Top-k (playlist, score) pairs for many queries with one batched encode + index.search"""
+  with metrics.EMBED_SECONDS.time():
+    query_embeddings = setvectordb.encode_queries(queries)
+  store = setvectordb.get_store()
+  with metrics.SEARCH_SECONDS.time():
+    return store.search(query_embeddings,k)
+
+def get_playlist_ids(queries:list[str],k:int=1)->list[list[str]]:
+  """Top-k playlist ids for many queries"""
+  return [[playlist["id"] for playlist,_ in row] for row in get_playlist_matches(queries,k)]
+
 def get_playlist_id(query:str,k:int=1):
-  query_embedding = model.encode([query],normalize_embeddings=True)
-  distances,indices = index.search(np.array(query_embedding),k)
-  best_idx = indices[0][0]
-  return playlists[best_idx]["id"]
+  ids = get_playlist_ids([query],k)[0]
+  return ids[0] if ids else None
+
+def find_playlist(query:str):
+  """Best playlist for query: the local index when it is confident, else the YouTube API.
+  API results are added to the local index, so the next similar query stays local."""
+  matches = get_playlist_matches([query])[0]
+  if matches and matches[0][1] >= PLAYLIST_MATCH_THRESHOLD:
+    return matches[0][0]
+  try:
+    found = get_youtube_api().search(query,kind="playlist")
+  except Exception as e:
+    print(f"[youtube] playlist search failed, using the local index: {e}")
+    found = []
+  if found:
+    # persisted apart from playlist.json, so watcher syncs and restarts keep them
+    setvectordb.get_store().add_discovered([{"id":r["id"],"name":r["title"]} for r in found])
+    return {"id":found[0]["id"],"name":found[0]["title"]}
+  return matches[0][0] if matches else None
 ## ---------------------------------
 
 
@@ -57,8 +131,8 @@ def open_url(link:str):
 
 @tool
 def youtube_search(query:str):
-  """Search YouTube for a video or song by query. 
-    Use this when the user asks to play a specific song, video, or when the request 
+  """Search YouTube for a video or song by query.
+    Use this when the user asks to play a specific song, video, or when the request
     doesn’t clearly mention a playlist."""
   url = f"https://www.youtube.com/results?search_query={query}"
   webbrowser.open(url)
@@ -67,44 +141,151 @@ def youtube_search(query:str):
 @tool
 def play_playlist(query:str)->str:
   """Play a YouTube playlist by query or ID.
-    Use this only when the user specifically mentions a playlist, 
+    Use this only when the user specifically mentions a playlist,
     album, mix, or wants continuous playback."""
-  playlist_id = get_playlist_id(query)
-  if playlist_id:
-    url = f"https://www.youtube.com/playlist?list={playlist_id}"
+  playlist = find_playlist(query)
+  if playlist:
+    url = f"https://www.youtube.com/playlist?list={playlist['id']}"
     webbrowser.open(url)
     return f"playing playlist for {query}"
   else:
     return f"No playlist found for {query}"
 
+@tool
+def youtube_api_search(query:str)->str:
+  """Find a video with the YouTube API and play the best match.
+    Use this when the user wants a specific song or video played directly
+    rather than a results page."""
+  try:
+    videos = get_youtube_api().search(query,kind="video")
+  except Exception as e:
+    return f"YouTube search unavailable: {e}"
+  if not videos:
+    return f"No video found for {query}"
+  webbrowser.open(f"https://www.youtube.com/watch?v={videos[0]['id']}")
+  return f"Playing: {videos[0]['title']}"
+
+@tool
+def search_playlist(query:str)->str:
+  """Look up a YouTube playlist for a query without playing it; returns its id and title."""
+  playlist = find_playlist(query)
+  if playlist:
+    return f"{playlist['id']}: {playlist['name']}"
+  return f"No playlist found for {query}"
+
 
 ### ------ Tool set up -------------
-tools = [open_url,youtube_search,play_playlist]
-tool_node = ToolNode(tools)
+tools = [open_url,youtube_search,play_playlist,youtube_api_search,search_playlist]
 ##-----------------------------------
 
-### -- llm with tool ------------
-llm_with_tools = llm.bind_tools(tools)
-## -----------------------
+##----------- Graph set up -------------
+def create_chatbot(checkpointer=None,llm=None,context=None,cache=None,router=None):
+  """Build and compile the chat graph; the llm, checkpointer and context manager can be swapped for stubs.
+  `cache` is an optional response_cache.ResponseCache consulted before the LLM,
+  `router` an optional router.FastPathRouter that dispatches obvious tool intents without it."""
+  llm = llm or get_llm()
+  llm_with_tools = llm.bind_tools(tools)
+  context = context or ContextManager(summarizer=llm)
+
+  @metrics.timed(metrics.NODE_SECONDS,node="router")
+  def router_node(state:ChatState):
+    routed = router.route(state['messages']) if router is not None else None
+    return {"messages":[routed]} if routed is not None else {}
 
-### --------- Node functions -------
-def chat_node(state:ChatState):
-  messages = state['messages']
-  response = llm_with_tools.invoke(messages)
-  return {"messages":[response]}
-## --------------------------------
+  @metrics.timed(metrics.NODE_SECONDS,node="router")
+  async def arouter_node(state:ChatState):
+    if router is None:
+      return {}
+    # the playlist score needs an embedding, keep it off the event loop
+    routed = await asyncio.to_thread(router.route,state['messages'])
+    return {"messages":[routed]} if routed is not None else {}
 
-##----------- Graph set up -------------
-graph = StateGraph(ChatState)
-graph.add_node("chat_node",chat_node)
-graph.add_node("tools",tool_node)
-
-graph.add_edge(START,"chat_node")
-graph.add_conditional_edges("chat_node",tools_condition)
-graph.add_edge('tools','chat_node')
-graph.add_edge("chat_node",END)
+  def route_after_router(state:ChatState):
+    last = state['messages'][-1]
+    return "tools" if getattr(last,"tool_calls",None) else "chat_node"
+
+  @metrics.timed(metrics.NODE_SECONDS,node="chat_node")
+  def chat_node(state:ChatState,config):
+    if router is not None:
+      reply = router.compose_reply(state['messages'])
+      if reply is not None:
+        return {"messages":[reply]}
+    scope = response_cache.cache_scope(config)
+    if cache is not None:
+      cached = cache.respond(state['messages'],scope)
+      if cached is not None:
+        return {"messages":[cached]}
+    messages,update = context.prepare(state)
+    response = llm_with_tools.invoke(messages)
+    if cache is not None:
+      cache.record(state['messages']+[response],scope)
+    return {"messages":[response],**update}
+
+  @metrics.timed(metrics.NODE_SECONDS,node="chat_node")
+  async def achat_node(state:ChatState,config):
+    if router is not None:
+      reply = router.compose_reply(state['messages'])
+      if reply is not None:
+        return {"messages":[reply]}
+    scope = response_cache.cache_scope(config)
+    if cache is not None:
+      # embedding the message is CPU work, keep it off the event loop
+      cached = await asyncio.to_thread(cache.respond,state['messages'],scope)
+      if cached is not None:
+        return {"messages":[cached]}
+    messages,update = await context.aprepare(state)
+    response = await llm_with_tools.ainvoke(messages)
+    if cache is not None:
+      await asyncio.to_thread(cache.record,state['messages']+[response],scope)
+    return {"messages":[response],**update}
+
+  # parallel, timeout-bounded replacement for ToolNode(tools)
+  tool_node = ToolExecutor(tools)
+
+  @metrics.timed(metrics.NODE_SECONDS,node="tools")
+  def tools_node(state:ChatState,config):
+    return tool_node.invoke(state,config)
+
+  @metrics.timed(metrics.NODE_SECONDS,node="tools")
+  async def atools_node(state:ChatState,config):
+    return await tool_node.ainvoke(state,config)
+
+  graph = StateGraph(ChatState)
+  # sync invoke/stream use chat_node, ainvoke/astream use achat_node without a worker thread
+  graph.add_node("router",RunnableLambda(router_node,afunc=arouter_node,name="router"))
+  graph.add_node("chat_node",RunnableLambda(chat_node,afunc=achat_node,name="chat_node"))
+  graph.add_node("tools",RunnableLambda(tools_node,afunc=atools_node,name="tools"))
+
+  # router -> tools -> chat_node (reply composed from the tool result) on the fast path,
+  # router -> chat_node (LLM) otherwise
+  graph.add_edge(START,"router")
+  graph.add_conditional_edges("router",route_after_router,{"tools":"tools","chat_node":"chat_node"})
+  graph.add_conditional_edges("chat_node",tools_condition)
+  graph.add_edge('tools','chat_node')
+  graph.add_edge("chat_node",END)
+  return graph.compile(checkpointer=checkpointer)
 ##-----------------------------------
 
 ## --  graph compilation ---------------
-chatbot = graph.compile(checkpointer=checkpointer)
-## -------------------------------
\ No newline at end of file
+_chatbot = startup.lazy("graph",lambda: create_chatbot(get_checkpointer(),cache=response_cache.cache,router=fast_path.router))
+
+def get_chatbot():
+  return _chatbot.get()
+
+async def _create_async_chatbot():
+  return create_chatbot(await get_async_checkpointer(),cache=response_cache.cache,router=fast_path.router)
+
+_async_chatbot = startup.lazy_async("async_graph",_create_async_chatbot)
+
+async def get_async_chatbot():
+  """Graph compiled with AsyncPostgresSaver, for ainvoke/astream"""
+  return await _async_chatbot.get()
+
+def __getattr__(name):
+  # `from bot2 import chatbot` still works, it just initializes on access
+  lazy_attrs = {"chatbot":get_chatbot,"checkpointer":get_checkpointer,"youtube":get_youtube,"llm":get_llm,
+                "youtube_api":get_youtube_api}
+  if name in lazy_attrs:
+    return lazy_attrs[name]()
+  raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+## -------------------------------
@@ -1,90 +1,500 @@
-from langchain_core.messages import HumanMessage
-from bot2 import chatbot
-from database_manager import DatabaseManager
-from typing import List, Tuple, Optional
+from langchain_core.messages import AIMessage, HumanMessage, AIMessageChunk, ToolMessage
+from bot2 import get_async_chatbot, get_chatbot
+from context_manager import NOSTREAM_TAG
+from database_manager import AsyncDatabaseManager, DatabaseManager
+import conversation_index
+import metrics
+import write_behind
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime
+import os
+from typing import AsyncIterator, Dict, Iterator, List, Tuple, Optional
 
+# turns shown when a session is opened; older turns load on demand
+HISTORY_PAGE_TURNS = int(os.getenv("HISTORY_PAGE_TURNS", "20"))
+# "dual": turns go to the messages table and the checkpointer
+# "checkpoint": the checkpointer is the only copy; history is rendered from its latest state
+STORAGE_MODE = os.getenv("CHAT_STORAGE_MODE", "dual")
+
+
+def checkpoint_rows(state) -> List[Tuple[str, str]]:
+    """(sender, text) rows from a graph state snapshot, skipping tool traffic"""
+    rows = []
+    for m in (state.values or {}).get("messages", []):
+        if isinstance(m, HumanMessage):
+            rows.append(("user", m.content))
+        elif isinstance(m, AIMessage) and not m.tool_calls and isinstance(m.content, str) and m.content:
+            rows.append(("ai", m.content))
+    return rows
+
+
+def page_rows(rows: List[Tuple[str, str]], limit: int, before: Optional[int]) -> Tuple[List[Tuple[str, str]], Optional[int]]:
+    """Offset pagination over in-memory rows; the cursor is the end index of the next older page"""
+    end = len(rows) if before is None else before
+    start = max(end - limit, 0)
+    return rows[start:end], (start if start > 0 else None)
+
+
+def format_history(messages: List[Tuple[str, str]]) -> List[List[str]]:
+    """Turn (sender, text) rows into Gradio [user, ai] pairs"""
+    history = []
+    for sender, text in messages:
+        if sender == "user":
+            history.append([text, None])
+        elif sender == "ai":
+            if history and history[-1][1] is None:
+                history[-1][1] = text
+            else:
+                history.append([None, text])
+    return history
+
+
+def prepend_history(older: List[List[str]], newer: List[List[str]]) -> List[List[str]]:
+    """Join an older page onto the visible history, re-pairing a turn split across the page boundary"""
+    if older and newer and older[-1][1] is None and newer[0][0] is None:
+        return older[:-1] + [[older[-1][0], newer[0][1]]] + newer[1:]
+    return older + newer
+
+
+def format_sessions(sessions: List[Tuple]) -> List[Tuple[str, str]]:
+    """Turn session rows into dropdown (label, session_id) choices"""
+    choices = []
+    for session_id, session_name, start_time, msg_count in sessions:
+        display_text = f"{session_name} ({msg_count} messages)"
+        choices.append((display_text, session_id))
+    return choices
+
+
+def format_search_results(hits: List[Tuple]) -> List[Tuple[str, str]]:
+    """Turn ranked search hits into (label, session_id) choices, one per session"""
+    choices, seen = [], set()
+    for session_id, session_name, sender, snippet, created_at, rank in hits:
+        if session_id in seen:
+            continue
+        seen.add(session_id)
+        choices.append((f"{session_name} · {sender}: {snippet}", session_id))
+    return choices
+
+
+def merge_similar(choices: List[Tuple[str, str]], similar: List[Tuple]) -> List[Tuple[str, str]]:
+    """Append semantic matches for sessions the keyword search didn't find"""
+    seen = {session_id for _, session_id in choices}
+    for session_id, sender, snippet, score in similar:
+        if session_id not in seen:
+            seen.add(session_id)
+            choices.append((f"≈ {sender}: {snippet}", session_id))
+    return choices
+
+
+class _StreamAccumulator:
+    """Translates LangGraph "messages" stream chunks into UI events and tracks the final reply"""
 
-class ChatHandler:
     def __init__(self):
-        self.db = DatabaseManager()
-        self.current_user_id: Optional[str] = None
-        self.current_session_id: Optional[str] = None
-   
-    def set_user(self, username: str) -> None:
+        self.parts: List[str] = []
+
+    @property
+    def reply(self) -> str:
+        return "".join(self.parts)
+
+    def feed(self, chunk, metadata: Dict) -> List[Dict]:
+        events = []
+        if NOSTREAM_TAG in (metadata.get("tags") or ()):
+            # side calls inside a node (the rolling summary), not part of the reply
+            return events
+        node = metadata.get("langgraph_node")
+        if node in ("router", "chat_node") and isinstance(chunk, AIMessage):
+            # LLM output arrives as AIMessageChunks; routed or cached responses as one whole AIMessage
+            calls = chunk.tool_call_chunks if isinstance(chunk, AIMessageChunk) else chunk.tool_calls
+            for tool_chunk in calls or []:
+                if tool_chunk.get("name"):
+                    # text streamed before a tool call is not the final answer
+                    self.parts = []
+                    events.append({"type": "tool", "name": tool_chunk["name"], "status": "running"})
+            text = chunk.content if isinstance(chunk.content, str) else ""
+            if text:
+                self.parts.append(text)
+                events.append({"type": "token", "text": text, "reply": self.reply})
+        elif node == "tools" and isinstance(chunk, ToolMessage):
+            events.append({"type": "tool", "name": chunk.name, "status": "done"})
+        return events
+
+
+@dataclass
+class ClientState:
+    """Who is chatting and in which session, for one client (browser tab).
+
+    Handlers keep no per-user state of their own; each UI session holds one of
+    these (e.g. in a gr.State) and passes it to every call, so concurrent clients
+    never see each other's session.
+    """
+    user_id: Optional[str] = None
+    session_id: Optional[str] = None
+
+
+class ChatHandler:
+    def __init__(self, db=None, chatbot=None, storage_mode: str = None, conversations=None):
+        # WRITE_BEHIND=1: turns are queued and written by a background writer
+        self.db = db or (write_behind.WriteBehindDatabaseManager() if write_behind.WRITE_BEHIND_ENABLED
+                         else DatabaseManager())
+        self._chatbot = chatbot
+        self.storage_mode = storage_mode or STORAGE_MODE
+        # semantic index of past messages; None unless CONVERSATION_INDEX=1
+        self.conversations = conversations or conversation_index.conversations
+        # used by callers that don't pass their own ClientState (scripts, single-user tools)
+        self.client = ClientState()
+
+    @property
+    def chatbot(self):
+        return self._chatbot or get_chatbot()
+
+    @property
+    def current_user_id(self) -> Optional[str]:
+        return self.client.user_id
+
+    @property
+    def current_session_id(self) -> Optional[str]:
+        return self.client.session_id
+
+    def set_user(self, username: str, client: Optional[ClientState] = None) -> None:
         """Set the current user"""
-        self.current_user_id = self.db.get_or_create_user(username)
-   
-    def create_new_session(self, username: str) -> str:
+        client = client or self.client
+        client.user_id = self.db.get_or_create_user(username)
+
+    def create_new_session(self, username: str, client: Optional[ClientState] = None) -> str:
         """Create a new chat session"""
-        self.set_user(username)
-        self.current_session_id = self.db.create_session(self.current_user_id)
-        return self.current_session_id
-    
-    def set_session(self, session_id: str) -> None:
+        client = client or self.client
+        self.set_user(username, client)
+        client.session_id = self.db.create_session(client.user_id)
+        return client.session_id
+
+    def set_session(self, session_id: str, client: Optional[ClientState] = None) -> None:
         """Set the current session"""
-        self.current_session_id = session_id
-    
-    def process_message(self, message: str, username: str) -> str:
+        (client or self.client).session_id = session_id
+
+    def _ensure_session(self, username: str, client: ClientState) -> None:
+        if not client.user_id:
+            self.set_user(username, client)
+
+        if not client.session_id:
+            self.create_new_session(username, client)
+
+    def _persist_turn(self, session_id: str, message: str, ai_reply: str, received_at: datetime,
+                      user_id: Optional[str] = None) -> None:
+        if self.storage_mode == "checkpoint":
+            # the checkpointer already holds the turn; keep only the session list metadata current
+            self.db.record_turn(session_id, message)
+        else:
+            self.db.insert_turn(session_id, message, ai_reply, received_at)
+        if self.conversations is not None:
+            # only enqueued; embedding happens on the index's background thread
+            self.conversations.add_turn(user_id, session_id, message, ai_reply)
+
+    def _persist_unanswered(self, session_id: str, message: str, user_id: Optional[str] = None) -> None:
+        """Store the user message of a turn that failed or was cancelled before its reply.
+
+        The checkpointer saved the HumanMessage when the graph started, so the messages
+        table gets it too rather than the two histories disagreeing.
+        """
+        try:
+            if self.storage_mode == "checkpoint":
+                self.db.record_turn(session_id, message, message_count=1)
+            else:
+                self.db.insert_message(session_id, "user", message)
+        except Exception as e:
+            print(f"[chat_handler] could not store unanswered message in session {session_id}: {e}")
+        if self.conversations is not None:
+            self.conversations.add_messages(user_id, session_id, [("user", message)])
+
+    def _session_rows(self, session_id: str) -> List[Tuple[str, str]]:
+        if self.storage_mode == "checkpoint":
+            config = {"configurable": {"thread_id": session_id}}
+            return checkpoint_rows(self.chatbot.get_state(config))
+        return self.db.get_session_messages(session_id)
+
+    def process_message(self, message: str, username: str, client: Optional[ClientState] = None) -> str:
         """Process user message and return AI response"""
-        if not self.current_user_id:
-            self.set_user(username)
-        
-        if not self.current_session_id:
-            self.create_new_session(username)
-        
-        # Insert user message
-        self.db.insert_message(self.current_session_id, "user", message)
-        
+        client = client or self.client
+        self._ensure_session(username, client)
+        session_id = client.session_id
+        received_at = datetime.now()
+
         # Get AI response
-        config = {"configurable": {"thread_id": self.current_session_id}}
-        response = chatbot.invoke({'messages': [HumanMessage(content=message)]}, config=config)
+        config = {"configurable": {"thread_id": session_id, "user_id": client.user_id}}
+        try:
+            with metrics.TURN_SECONDS.time(mode="invoke"):
+                response = self.chatbot.invoke({'messages': [HumanMessage(content=message)]}, config=config)
+        except BaseException:
+            self._persist_unanswered(session_id, message, client.user_id)
+            raise
         ai_reply = response['messages'][-1].content
-        
-        # Insert AI response
-        self.db.insert_message(self.current_session_id, "ai", ai_reply)
-        
+
+        # Persist user message + AI response in one round-trip
+        self._persist_turn(session_id, message, ai_reply, received_at, client.user_id)
+
         return ai_reply
-    
-    def get_session_history(self, session_id: str = None) -> List[List[str]]:
+
+    def stream_message(self, message: str, username: str, client: Optional[ClientState] = None) -> Iterator[Dict]:
+        """Process user message, yielding token and tool-status events as they arrive.
+
+        Events are dicts with a "type" key:
+          {"type": "token", "text": delta, "reply": reply_so_far}
+          {"type": "tool", "name": tool_name, "status": "running" | "done"}
+          {"type": "done", "reply": final_reply}
+        The turn is persisted once, after the graph finishes. If the graph raises or the
+        consumer stops early (a cancelled Gradio stream), only the user message is stored.
+        """
+        client = client or self.client
+        self._ensure_session(username, client)
+        session_id = client.session_id
+        received_at = datetime.now()
+
+        config = {"configurable": {"thread_id": session_id, "user_id": client.user_id}}
+        acc = _StreamAccumulator()
+        try:
+            with metrics.TURN_SECONDS.time(mode="stream"):
+                for chunk, metadata in self.chatbot.stream(
+                    {'messages': [HumanMessage(content=message)]},
+                    config=config,
+                    stream_mode="messages",
+                ):
+                    yield from acc.feed(chunk, metadata)
+        except BaseException:  # GeneratorExit when the consumer stops early
+            self._persist_unanswered(session_id, message, client.user_id)
+            raise
+
+        ai_reply = acc.reply
+        self._persist_turn(session_id, message, ai_reply, received_at, client.user_id)
+        yield {"type": "done", "reply": ai_reply}
+
+    def get_session_history(self, session_id: str = None, client: Optional[ClientState] = None) -> List[List[str]]:
         """Get formatted chat history for Gradio"""
         if not session_id:
-            session_id = self.current_session_id
-        
+            session_id = (client or self.client).session_id
+
         if not session_id:
             return []
-        
-        messages = self.db.get_session_messages(session_id)
-        history = []
-        
-        for sender, text in messages:
-            if sender == "user":
-                history.append([text, None])
-            elif sender == "ai":
-                if history and history[-1][1] is None:
-                    history[-1][1] = text
-                else:
-                    history.append([None, text])
-        
-        return history
-    
-    def get_user_sessions_formatted(self, username: str) -> List[Tuple[str, str]]:
+
+        return format_history(self._session_rows(session_id))
+
+    def get_session_history_page(self, session_id: str = None, before=None, turns: int = HISTORY_PAGE_TURNS,
+                                 client: Optional[ClientState] = None) -> Tuple[List[List[str]], Optional[tuple]]:
+        """Get the latest `turns` turns (or the page older than `before`) and the cursor for the next page"""
+        session_id = session_id or (client or self.client).session_id
+        if not session_id:
+            return [], None
+        if self.storage_mode == "checkpoint":
+            rows, cursor = page_rows(self._session_rows(session_id), turns * 2, before)
+        else:
+            rows, cursor = self.db.get_session_messages_page(session_id, limit=turns * 2, before=before)
+        return format_history(rows), cursor
+
+    def get_user_sessions_formatted(self, username: str, client: Optional[ClientState] = None) -> List[Tuple[str, str]]:
         """Get formatted session list for dropdown"""
-        self.set_user(username)
-        sessions = self.db.get_user_sessions(self.current_user_id)
-        
-        choices = []
-        for session_id, session_name, start_time, msg_count in sessions:
-            display_text = f"{session_name} ({msg_count} messages)"
-            choices.append((display_text, session_id))
-        
+        client = client or self.client
+        self.set_user(username, client)
+        return format_sessions(self.db.get_user_sessions(client.user_id))
+
+    def search_sessions(self, query: str, username: str, client: Optional[ClientState] = None,
+                        limit: int = 20) -> List[Tuple[str, str]]:
+        """Sessions whose messages match `query`, best match first, as dropdown choices"""
+        client = client or self.client
+        if not client.user_id:
+            self.set_user(username, client)
+        choices = format_search_results(self.db.search_messages(client.user_id, query, limit))
+        if self.conversations is not None:
+            choices = merge_similar(choices, self.conversations.search(client.user_id, query, limit))
         return choices
-   
+
     def rename_session(self, session_id: str, new_name: str) -> None:
         """Rename a session"""
         self.db.update_session_name(session_id, new_name)
-    
-    def delete_session(self, session_id: str) -> None:
+
+    def delete_session(self, session_id: str, client: Optional[ClientState] = None) -> None:
         """Delete a session"""
+        client = client or self.client
+        if self.conversations is not None:
+            # the client may not know its user yet (after a restart, or a session picked before set_user)
+            user_id = self.db.get_session_owner(session_id) or client.user_id
         self.db.delete_session(session_id)
-        if self.current_session_id == session_id:
-            self.current_session_id = None
\ No newline at end of file
+        if self.conversations is not None:
+            self.conversations.remove_session(user_id, session_id)
+        if client.session_id == session_id:
+            client.session_id = None
+
+
+class AsyncChatHandler:
+    """asyncio version of ChatHandler: no worker thread is held during the LLM round-trip"""
+
+    def __init__(self, db=None, chatbot=None, storage_mode: str = None, conversations=None):
+        self.db = db or (write_behind.AsyncWriteBehindDatabaseManager() if write_behind.WRITE_BEHIND_ENABLED
+                         else AsyncDatabaseManager())
+        self._chatbot = chatbot
+        self.storage_mode = storage_mode or STORAGE_MODE
+        self.conversations = conversations or conversation_index.conversations
+        self.client = ClientState()
+
+    async def get_chatbot(self):
+        return self._chatbot or await get_async_chatbot()
+
+    @property
+    def current_user_id(self) -> Optional[str]:
+        return self.client.user_id
+
+    @property
+    def current_session_id(self) -> Optional[str]:
+        return self.client.session_id
+
+    async def set_user(self, username: str, client: Optional[ClientState] = None) -> None:
+        """Set the current user"""
+        client = client or self.client
+        client.user_id = await self.db.get_or_create_user(username)
+
+    async def create_new_session(self, username: str, client: Optional[ClientState] = None) -> str:
+        """Create a new chat session"""
+        client = client or self.client
+        await self.set_user(username, client)
+        client.session_id = await self.db.create_session(client.user_id)
+        return client.session_id
+
+    def set_session(self, session_id: str, client: Optional[ClientState] = None) -> None:
+        """Set the current session"""
+        (client or self.client).session_id = session_id
+
+    async def _ensure_session(self, username: str, client: ClientState) -> None:
+        if not client.user_id:
+            await self.set_user(username, client)
+        if not client.session_id:
+            await self.create_new_session(username, client)
+
+    async def _persist_turn(self, session_id: str, message: str, ai_reply: str, received_at: datetime,
+                            user_id: Optional[str] = None) -> None:
+        if self.storage_mode == "checkpoint":
+            await self.db.record_turn(session_id, message)
+        else:
+            await self.db.insert_turn(session_id, message, ai_reply, received_at)
+        if self.conversations is not None:
+            self.conversations.add_turn(user_id, session_id, message, ai_reply)
+
+    async def _persist_unanswered(self, session_id: str, message: str, user_id: Optional[str] = None) -> None:
+        """Async version of ChatHandler._persist_unanswered"""
+        try:
+            if self.storage_mode == "checkpoint":
+                await self.db.record_turn(session_id, message, message_count=1)
+            else:
+                await self.db.insert_message(session_id, "user", message)
+        except Exception as e:
+            print(f"[chat_handler] could not store unanswered message in session {session_id}: {e}")
+        if self.conversations is not None:
+            self.conversations.add_messages(user_id, session_id, [("user", message)])
+
+    async def _session_rows(self, session_id: str) -> List[Tuple[str, str]]:
+        if self.storage_mode == "checkpoint":
+            chatbot = await self.get_chatbot()
+            config = {"configurable": {"thread_id": session_id}}
+            return checkpoint_rows(await chatbot.aget_state(config))
+        return await self.db.get_session_messages(session_id)
+
+    async def process_message(self, message: str, username: str, client: Optional[ClientState] = None) -> str:
+        """Process user message and return AI response"""
+        client = client or self.client
+        await self._ensure_session(username, client)
+        session_id = client.session_id
+        received_at = datetime.now()
+
+        chatbot = await self.get_chatbot()
+        config = {"configurable": {"thread_id": session_id, "user_id": client.user_id}}
+        try:
+            with metrics.TURN_SECONDS.time(mode="ainvoke"):
+                response = await chatbot.ainvoke({'messages': [HumanMessage(content=message)]}, config=config)
+        except BaseException:
+            await self._persist_unanswered(session_id, message, client.user_id)
+            raise
+        ai_reply = response['messages'][-1].content
+
+        await self._persist_turn(session_id, message, ai_reply, received_at, client.user_id)
+        return ai_reply
+
+    async def stream_message(self, message: str, username: str,
+                             client: Optional[ClientState] = None) -> AsyncIterator[Dict]:
+        """Async version of ChatHandler.stream_message, same event format"""
+        client = client or self.client
+        await self._ensure_session(username, client)
+        session_id = client.session_id
+        received_at = datetime.now()
+
+        chatbot = await self.get_chatbot()
+        config = {"configurable": {"thread_id": session_id, "user_id": client.user_id}}
+        acc = _StreamAccumulator()
+        try:
+            with metrics.TURN_SECONDS.time(mode="astream"):
+                async for chunk, metadata in chatbot.astream(
+                    {'messages': [HumanMessage(content=message)]},
+                    config=config,
+                    stream_mode="messages",
+                ):
+                    for event in acc.feed(chunk, metadata):
+                        yield event
+        except BaseException:  # GeneratorExit on aclose(), CancelledError when the task is cancelled
+            await self._persist_unanswered(session_id, message, client.user_id)
+            raise
+
+        ai_reply = acc.reply
+        await self._persist_turn(session_id, message, ai_reply, received_at, client.user_id)
+        yield {"type": "done", "reply": ai_reply}
+
+    async def get_session_history(self, session_id: str = None,
+                                  client: Optional[ClientState] = None) -> List[List[str]]:
+        """Get formatted chat history for Gradio"""
+        session_id = session_id or (client or self.client).session_id
+        if not session_id:
+            return []
+        return format_history(await self._session_rows(session_id))
+
+    async def get_session_history_page(self, session_id: str = None, before=None, turns: int = HISTORY_PAGE_TURNS,
+                                       client: Optional[ClientState] = None) -> Tuple[List[List[str]], Optional[tuple]]:
+        """Async version of ChatHandler.get_session_history_page"""
+        session_id = session_id or (client or self.client).session_id
+        if not session_id:
+            return [], None
+        if self.storage_mode == "checkpoint":
+            rows, cursor = page_rows(await self._session_rows(session_id), turns * 2, before)
+        else:
+            rows, cursor = await self.db.get_session_messages_page(session_id, limit=turns * 2, before=before)
+        return format_history(rows), cursor
+
+    async def get_user_sessions_formatted(self, username: str,
+                                          client: Optional[ClientState] = None) -> List[Tuple[str, str]]:
+        """Get formatted session list for dropdown"""
+        client = client or self.client
+        await self.set_user(username, client)
+        return format_sessions(await self.db.get_user_sessions(client.user_id))
+
+    async def search_sessions(self, query: str, username: str, client: Optional[ClientState] = None,
+                              limit: int = 20) -> List[Tuple[str, str]]:
+        """Async version of ChatHandler.search_sessions"""
+        client = client or self.client
+        if not client.user_id:
+            await self.set_user(username, client)
+        choices = format_search_results(await self.db.search_messages(client.user_id, query, limit))
+        if self.conversations is not None:
+            # may load the user's index from disk and runs the embedding model
+            similar = await asyncio.to_thread(self.conversations.search, client.user_id, query, limit)
+            choices = merge_similar(choices, similar)
+        return choices
+
+    async def rename_session(self, session_id: str, new_name: str) -> None:
+        """Rename a session"""
+        await self.db.update_session_name(session_id, new_name)
+
+    async def delete_session(self, session_id: str, client: Optional[ClientState] = None) -> None:
+        """Delete a session"""
+        client = client or self.client
+        if self.conversations is not None:
+            # the client may not know its user yet (after a restart, or a session picked before set_user)
+            user_id = await self.db.get_session_owner(session_id) or client.user_id
+        await self.db.delete_session(session_id)
+        if self.conversations is not None:
+            self.conversations.remove_session(user_id, session_id)
+        if client.session_id == session_id:
+            client.session_id = None
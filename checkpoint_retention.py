@@ -0,0 +1,248 @@
+"""Retention for the LangGraph PostgresSaver tables (checkpoints, checkpoint_writes, checkpoint_blobs).
+
+The saver writes a checkpoint for every super-step of every thread and never deletes
+one. Each turn's latest checkpoint already holds the whole conversation, so older
+checkpoints only serve time travel. Compaction does three things:
+
+  * keeps the newest CHECKPOINT_KEEP checkpoints of each thread (and namespace),
+    along with their pending writes
+  * drops channel blobs that no remaining checkpoint references
+  * drops every checkpoint of a thread whose session row is gone (deleted before
+    migration 5 started cascading session deletes)
+
+Threads are compacted only after CHECKPOINT_IDLE_SECONDS without a new checkpoint.
+The saver writes blobs before the checkpoint that references them, so a thread that
+is mid-turn could otherwise lose a blob. Each batch of CHECKPOINT_COMPACT_BATCH
+threads gets its own transaction, which keeps row locks short. A dry run executes
+the same deletes and rolls them back, so its report is exact.
+
+``start_compactor()`` runs compaction every CHECKPOINT_COMPACT_INTERVAL seconds in a
+daemon thread (0 disables it).
+
+Usage: python checkpoint_retention.py [--dry-run] [--keep 5] [--no-orphans]
+"""
+import argparse
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+import metrics
+from database import connection
+
+CHECKPOINT_KEEP = int(os.getenv("CHECKPOINT_KEEP", "5"))
+CHECKPOINT_COMPACT_INTERVAL = float(os.getenv("CHECKPOINT_COMPACT_INTERVAL", "3600"))
+CHECKPOINT_COMPACT_BATCH = int(os.getenv("CHECKPOINT_COMPACT_BATCH", "200"))
+CHECKPOINT_IDLE_SECONDS = float(os.getenv("CHECKPOINT_IDLE_SECONDS", "300"))
+
+TABLES_EXIST_SQL = "SELECT to_regclass('checkpoints') IS NOT NULL"
+# threads with more checkpoints than we keep, or with no session left; idle ones only
+SELECT_CANDIDATE_THREADS_SQL = """
+    SELECT c.thread_id, bool_and(s.session_id IS NULL) AS orphan
+    FROM checkpoints c
+    LEFT JOIN sessions s ON s.session_id = c.thread_id
+    GROUP BY c.thread_id
+    HAVING (count(*) > %(keep)s OR (%(orphans)s AND bool_and(s.session_id IS NULL)))
+       AND max((c.checkpoint ->> 'ts')::timestamptz) < %(idle_before)s
+    ORDER BY c.thread_id
+    """
+DELETE_THREADS_SQL = [
+    "DELETE FROM checkpoint_writes WHERE thread_id = ANY(%(thread_ids)s)",
+    "DELETE FROM checkpoint_blobs WHERE thread_id = ANY(%(thread_ids)s)",
+    "DELETE FROM checkpoints WHERE thread_id = ANY(%(thread_ids)s)",
+]
+# checkpoint ids are uuid6, so they sort by creation time
+PRUNE_CHECKPOINTS_SQL = """
+    WITH stale AS (
+        SELECT thread_id, checkpoint_ns, checkpoint_id FROM (
+            SELECT thread_id, checkpoint_ns, checkpoint_id,
+                   row_number() OVER (PARTITION BY thread_id, checkpoint_ns
+                                      ORDER BY checkpoint_id DESC) AS rn
+            FROM checkpoints WHERE thread_id = ANY(%(thread_ids)s)
+        ) ranked
+        WHERE rn > %(keep)s
+    ), dropped_writes AS (
+        DELETE FROM checkpoint_writes w USING stale s
+        WHERE w.thread_id = s.thread_id AND w.checkpoint_ns = s.checkpoint_ns
+          AND w.checkpoint_id = s.checkpoint_id
+        RETURNING 1
+    ), dropped AS (
+        DELETE FROM checkpoints c USING stale s
+        WHERE c.thread_id = s.thread_id AND c.checkpoint_ns = s.checkpoint_ns
+          AND c.checkpoint_id = s.checkpoint_id
+        RETURNING 1
+    )
+    SELECT (SELECT count(*) FROM dropped), (SELECT count(*) FROM dropped_writes)
+    """
+# separate statement: it must see the checkpoints left after PRUNE_CHECKPOINTS_SQL
+PRUNE_BLOBS_SQL = """
+    WITH live AS (
+        SELECT c.thread_id, c.checkpoint_ns, v.key AS channel, v.value #>> '{}' AS version
+        FROM checkpoints c, jsonb_each(c.checkpoint -> 'channel_versions') v
+        WHERE c.thread_id = ANY(%(thread_ids)s)
+    ), dropped AS (
+        DELETE FROM checkpoint_blobs b
+        WHERE b.thread_id = ANY(%(thread_ids)s)
+          AND NOT EXISTS (SELECT 1 FROM live l
+                          WHERE l.thread_id = b.thread_id AND l.checkpoint_ns = b.checkpoint_ns
+                            AND l.channel = b.channel AND l.version = b.version)
+        RETURNING 1
+    )
+    SELECT count(*) FROM dropped
+    """
+TABLE_SIZES_SQL = """
+    SELECT relname, pg_total_relation_size(oid) FROM pg_class
+    WHERE relname IN ('checkpoints', 'checkpoint_writes', 'checkpoint_blobs')
+    ORDER BY relname
+    """
+
+
+@dataclass
+class CompactionReport:
+    dry_run: bool = False
+    threads: int = 0
+    orphan_threads: int = 0
+    checkpoints: int = 0
+    writes: int = 0
+    blobs: int = 0
+    seconds: float = 0.0
+
+    def __str__(self) -> str:
+        verb = "would delete" if self.dry_run else "deleted"
+        return (f"{self.threads} threads compacted ({self.orphan_threads} orphaned): {verb} "
+                f"{self.checkpoints} checkpoints, {self.writes} writes, {self.blobs} blobs "
+                f"in {self.seconds:.2f}s")
+
+
+def _batches(items: List, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _compact_batch(cur, thread_ids: List[str], orphan_ids: List[str], keep: int, report: CompactionReport) -> None:
+    if orphan_ids:
+        params = {"thread_ids": orphan_ids}
+        counts = []
+        for sql in DELETE_THREADS_SQL:
+            cur.execute(sql, params)
+            counts.append(cur.rowcount)
+        report.writes += counts[0]
+        report.blobs += counts[1]
+        report.checkpoints += counts[2]
+    if thread_ids:
+        params = {"thread_ids": thread_ids, "keep": keep}
+        cur.execute(PRUNE_CHECKPOINTS_SQL, params)
+        checkpoints, writes = cur.fetchone()
+        cur.execute(PRUNE_BLOBS_SQL, params)
+        report.checkpoints += checkpoints
+        report.writes += writes
+        report.blobs += cur.fetchone()[0]
+
+
+def compact(keep: int = CHECKPOINT_KEEP, dry_run: bool = False, purge_orphans: bool = True,
+            batch_size: int = CHECKPOINT_COMPACT_BATCH,
+            idle_seconds: float = CHECKPOINT_IDLE_SECONDS) -> CompactionReport:
+    """Trim every idle thread to its newest `keep` checkpoints and drop orphaned threads"""
+    if keep < 1:
+        raise ValueError("keep must be at least 1: the latest checkpoint is the conversation")
+    start = time.perf_counter()
+    report = CompactionReport(dry_run=dry_run)
+    idle_before = datetime.now(timezone.utc) - timedelta(seconds=idle_seconds)
+    with connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(TABLES_EXIST_SQL)
+            if not cur.fetchone()[0]:
+                return report  # the checkpointer hasn't run setup() yet
+            cur.execute(SELECT_CANDIDATE_THREADS_SQL,
+                        {"keep": keep, "orphans": purge_orphans, "idle_before": idle_before})
+            candidates = cur.fetchall()
+        for batch in _batches(candidates, batch_size):
+            orphan_ids = [thread_id for thread_id, orphan in batch if orphan and purge_orphans]
+            thread_ids = [thread_id for thread_id, orphan in batch if not (orphan and purge_orphans)]
+            with conn.transaction(force_rollback=dry_run), conn.cursor() as cur:
+                _compact_batch(cur, thread_ids, orphan_ids, keep, report)
+            report.threads += len(batch)
+            report.orphan_threads += len(orphan_ids)
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def prune_thread(thread_id: str, keep: int = CHECKPOINT_KEEP) -> CompactionReport:
+    """Trim one thread now, regardless of how recently it was written"""
+    report = CompactionReport()
+    start = time.perf_counter()
+    with connection() as conn, conn.transaction(), conn.cursor() as cur:
+        _compact_batch(cur, [thread_id], [], keep, report)
+    report.threads = 1
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def table_sizes() -> dict:
+    """Bytes (with indexes and TOAST) used by each checkpoint table"""
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(TABLE_SIZES_SQL)
+        return dict(cur.fetchall())
+
+
+class CheckpointCompactor(threading.Thread):
+    """Runs compact() every `interval` seconds"""
+
+    def __init__(self, interval: float = CHECKPOINT_COMPACT_INTERVAL, keep: int = CHECKPOINT_KEEP):
+        super().__init__(name="checkpoint-compactor", daemon=True)
+        self.interval = interval
+        self.keep = keep
+        self.last_report: Optional[CompactionReport] = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.last_report = compact(self.keep)
+                if self.last_report.threads:
+                    print(f"[checkpoints] {self.last_report}")
+            except Exception as e:
+                # e.g. the database is briefly unreachable; try again next interval
+                print(f"[checkpoints] compaction failed: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+
+    def stats(self) -> dict:
+        return asdict(self.last_report) if self.last_report else {}
+
+
+_compactor: Optional[CheckpointCompactor] = None
+
+
+def start_compactor(interval: float = CHECKPOINT_COMPACT_INTERVAL) -> Optional[CheckpointCompactor]:
+    """Start the background compactor; no-op if disabled or already running"""
+    global _compactor
+    if interval <= 0 or _compactor is not None:
+        return _compactor
+    _compactor = CheckpointCompactor(interval)
+    _compactor.start()
+    metrics.register_collector("assistant_checkpoint_compaction", _compactor.stats)
+    return _compactor
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="report what would be deleted, delete nothing")
+    parser.add_argument("--keep", type=int, default=CHECKPOINT_KEEP, help="checkpoints kept per thread")
+    parser.add_argument("--idle", type=float, default=CHECKPOINT_IDLE_SECONDS,
+                        help="skip threads written in the last N seconds")
+    parser.add_argument("--no-orphans", action="store_true", help="keep threads whose session was deleted")
+    args = parser.parse_args()
+
+    report = compact(args.keep, dry_run=args.dry_run, purge_orphans=not args.no_orphans, idle_seconds=args.idle)
+    print(report)
+    # deleted rows are reused by later inserts once autovacuum runs; VACUUM FULL returns the space
+    for table, size in table_sizes().items():
+        print(f"  {table:<18} {size / 1e6:10.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Token-budgeted prompt construction for chat_node.
+
+The graph state keeps every message (history is rendered from it), but the LLM
+only sees:
+  * a rolling summary of older turns, cached in graph state
+  * older turns not yet folded into the summary
+  * the most recent turns, verbatim, up to CONTEXT_MAX_TOKENS
+Tool results from previous turns are truncated, since the model already acted on them.
+"""
+import os
+from typing import List, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, ToolMessage
+
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "3000"))  # 0 disables trimming
+# unsummarized older turns are folded into the summary once they exceed this many tokens,
+# so summarization costs one extra LLM call every few turns rather than every turn
+CONTEXT_SUMMARY_BATCH_TOKENS = int(os.getenv("CONTEXT_SUMMARY_BATCH_TOKENS", "1000"))
+CONTEXT_TOOL_PAYLOAD_CHARS = int(os.getenv("CONTEXT_TOOL_PAYLOAD_CHARS", "200"))
+# LangGraph's stream_mode="messages" skips model calls carrying this tag
+NOSTREAM_TAG = "nostream"
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and a personal "
+    "assistant that opens URLs, searches YouTube and plays playlists. Update the summary "
+    "with the new messages. Keep user preferences, names, and anything later turns may "
+    "refer to. Reply with the summary only, at most 200 words.\n\n"
+    "Current summary:\n{summary}\n\nNew messages:\n{transcript}"
+)
+
+try:
+    from langchain_core.messages.utils import count_tokens_approximately
+except ImportError:  # older langchain_core
+    def count_tokens_approximately(messages) -> int:
+        return sum(len(str(m.content)) // 4 + 3 for m in messages)
+
+
+def count_tokens(messages: List[BaseMessage]) -> int:
+    return count_tokens_approximately(messages)
+
+
+def _transcript(messages: List[BaseMessage]) -> str:
+    return "\n".join(f"{m.type}: {m.content}" for m in messages if m.content)
+
+
+class ContextManager:
+    def __init__(self, summarizer=None, max_tokens: int = CONTEXT_MAX_TOKENS,
+                 summary_batch_tokens: int = CONTEXT_SUMMARY_BATCH_TOKENS,
+                 tool_payload_chars: int = CONTEXT_TOOL_PAYLOAD_CHARS):
+        # summarization runs inside chat_node; untagged, its tokens would stream as the reply
+        self.summarizer = summarizer.with_config(tags=[NOSTREAM_TAG]) if summarizer is not None else None
+        self.max_tokens = max_tokens
+        self.summary_batch_tokens = summary_batch_tokens
+        self.tool_payload_chars = tool_payload_chars
+
+    def window_start(self, messages: List[BaseMessage]) -> int:
+        """Index of the oldest message kept verbatim.
+
+        Only cuts at a HumanMessage, so a tool call is never separated from its result,
+        and always keeps the latest user turn even if it alone exceeds the budget.
+        """
+        budget, start = self.max_tokens, len(messages)
+        for i in range(len(messages) - 1, -1, -1):
+            budget -= count_tokens([messages[i]])
+            if budget < 0 and start < len(messages):
+                break
+            if isinstance(messages[i], HumanMessage):
+                start = i
+        return start
+
+    def strip_stale_tool_payloads(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """Truncate tool results that belong to earlier turns"""
+        last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=0)
+        out = []
+        for i, m in enumerate(messages):
+            if i < last_human and isinstance(m, ToolMessage) and len(str(m.content)) > self.tool_payload_chars:
+                m = m.model_copy(update={"content": str(m.content)[:self.tool_payload_chars] + " …[truncated]"})
+            out.append(m)
+        return out
+
+    def _plan(self, state) -> Tuple[List[BaseMessage], List[BaseMessage], str, int]:
+        messages = state["messages"]
+        summary = state.get("summary") or ""
+        summarized = state.get("summarized_count") or 0
+        start = max(self.window_start(messages), summarized)
+        pending = messages[summarized:start]
+        return messages, pending, summary, start
+
+    def _prompt(self, messages, summary: str, summarized: int) -> List[BaseMessage]:
+        prompt = self.strip_stale_tool_payloads(messages[summarized:])
+        if summary:
+            prompt = [SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")] + prompt
+        return prompt
+
+    def prepare(self, state) -> Tuple[List[BaseMessage], dict]:
+        """(messages to send to the LLM, graph state update)"""
+        if self.max_tokens <= 0:
+            return state["messages"], {}
+        messages, pending, summary, start = self._plan(state)
+        summarized, update = state.get("summarized_count") or 0, {}
+        if self.summarizer is not None and pending and count_tokens(pending) >= self.summary_batch_tokens:
+            summary = self.summarizer.invoke(SUMMARY_PROMPT.format(summary=summary or "(none)", transcript=_transcript(pending))).content
+            summarized = start
+            update = {"summary": summary, "summarized_count": summarized}
+        return self._prompt(messages, summary, summarized), update
+
+    async def aprepare(self, state) -> Tuple[List[BaseMessage], dict]:
+        """Async version of prepare"""
+        if self.max_tokens <= 0:
+            return state["messages"], {}
+        messages, pending, summary, start = self._plan(state)
+        summarized, update = state.get("summarized_count") or 0, {}
+        if self.summarizer is not None and pending and count_tokens(pending) >= self.summary_batch_tokens:
+            summary = (await self.summarizer.ainvoke(SUMMARY_PROMPT.format(summary=summary or "(none)", transcript=_transcript(pending)))).content
+            summarized = start
+            update = {"summary": summary, "summarized_count": summarized}
+        return self._prompt(messages, summary, summarized), update
@@ -0,0 +1,392 @@
+"""Per-user semantic index over past chat messages ("the chat where I asked about that jazz mix").
+
+The chat handlers pass every persisted turn to ``add_turn``, which only enqueues it.
+A background thread drains the queue in batches and embeds the queued messages with
+one encode call, using the setvectordb sentence-transformer. It then appends them to
+the owning user's FAISS index. Nothing on the request path waits for the model.
+
+Each user's index is saved in CONVERSATION_INDEX_DIR as a .faiss file plus a JSON
+sidecar mapping ids to (session_id, sender, snippet) and naming the model and backend
+that made the vectors; an index from another one is re-built from the database. Indexes are loaded on first use
+and kept in an LRU. Once the loaded ones pass CONVERSATION_INDEX_MAX_MB, the least
+recently used are saved and dropped, so only active users sit in RAM. Changed
+indexes are also saved every CONVERSATION_INDEX_SAVE_INTERVAL seconds and on close().
+
+Opt-in with CONVERSATION_INDEX=1.
+
+Usage: python conversation_index.py --backfill   # index messages already in the database
+"""
+import argparse
+import atexit
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+import embeddings as embedding_backends
+import metrics
+import setvectordb
+
+CONVERSATION_INDEX_ENABLED = os.getenv("CONVERSATION_INDEX", "0") == "1"
+CONVERSATION_INDEX_DIR = os.getenv("CONVERSATION_INDEX_DIR", ".conversation_index")
+CONVERSATION_INDEX_MAX_MB = float(os.getenv("CONVERSATION_INDEX_MAX_MB", "256"))
+CONVERSATION_INDEX_BATCH = int(os.getenv("CONVERSATION_INDEX_BATCH", "64"))
+CONVERSATION_INDEX_QUEUE = int(os.getenv("CONVERSATION_INDEX_QUEUE", "10000"))
+CONVERSATION_INDEX_SAVE_INTERVAL = float(os.getenv("CONVERSATION_INDEX_SAVE_INTERVAL", "30"))
+# search queries get their own LRU so they don't evict playlist queries from setvectordb.query_cache
+CONVERSATION_QUERY_CACHE_SIZE = int(os.getenv("CONVERSATION_QUERY_CACHE_SIZE", "256"))
+
+# characters of each message kept for result labels
+SNIPPET_CHARS = 160
+# rough per-entry cost of the id map and sidecar dict, on top of the vector
+ENTRY_OVERHEAD_BYTES = 200
+
+SELECT_ALL_MESSAGES_SQL = """
+    SELECT s.user_id, m.session_id, m.sender, m.message_text FROM messages m
+    JOIN sessions s ON s.session_id = m.session_id
+    ORDER BY s.user_id, m.session_id, m.created_at, m.message_id
+    """
+SELECT_USER_MESSAGES_SQL = """
+    SELECT s.user_id, m.session_id, m.sender, m.message_text FROM messages m
+    JOIN sessions s ON s.session_id = m.session_id
+    WHERE s.user_id = %s
+    ORDER BY m.session_id, m.created_at, m.message_id
+    """
+
+# (session_id, sender, snippet, score)
+Match = Tuple[str, str, str, float]
+
+
+class UserIndex:
+    """One user's message vectors, and (session_id, sender, snippet) per FAISS id"""
+
+    def __init__(self, index: faiss.Index, entries: Dict[int, list], next_id: int = 0, model: Optional[str] = None):
+        self.index = index
+        self.entries = entries
+        self.next_id = next_id
+        self.model = model  # embedding_backends.model_id of the vectors
+
+    @classmethod
+    def new(cls, dimension: int, model: Optional[str] = None) -> "UserIndex":
+        return cls(faiss.IndexIDMap2(faiss.IndexFlatIP(dimension)), {}, model=model)
+
+    @property
+    def nbytes(self) -> int:
+        return self.index.ntotal * (self.index.d * 4 + ENTRY_OVERHEAD_BYTES)
+
+    def add(self, vectors: np.ndarray, rows: List[Tuple[str, str, str]]) -> None:
+        ids = np.arange(self.next_id, self.next_id + len(rows), dtype="int64")
+        self.index.add_with_ids(vectors, ids)
+        for i, (session_id, sender, text) in zip(ids, rows):
+            self.entries[int(i)] = [session_id, sender, text[:SNIPPET_CHARS]]
+        self.next_id += len(rows)
+
+    def remove_session(self, session_id: str) -> int:
+        ids = [i for i, entry in self.entries.items() if entry[0] == session_id]
+        if ids:
+            self.index.remove_ids(np.array(ids, dtype="int64"))
+            for i in ids:
+                del self.entries[i]
+        return len(ids)
+
+    def search(self, vector: np.ndarray, k: int) -> List[Match]:
+        """Best message per session, best first"""
+        if self.index.ntotal == 0:
+            return []
+        # several hits usually come from one session, so look further than k
+        scores, ids = self.index.search(vector, min(k * 4, self.index.ntotal))
+        matches, seen = [], set()
+        for score, i in zip(scores[0], ids[0]):
+            entry = self.entries.get(int(i))
+            if entry is None or entry[0] in seen:
+                continue
+            seen.add(entry[0])
+            matches.append((entry[0], entry[1], entry[2], float(score)))
+            if len(matches) == k:
+                break
+        return matches
+
+    def save(self, path: str) -> None:
+        """Atomic (tmp file + os.replace) write of the index and its sidecar"""
+        faiss.write_index(self.index, f"{path}.faiss.tmp")
+        with open(f"{path}.json.tmp", "w") as f:
+            json.dump({"model": self.model, "next_id": self.next_id, "entries": self.entries}, f)
+        os.replace(f"{path}.faiss.tmp", f"{path}.faiss")
+        os.replace(f"{path}.json.tmp", f"{path}.json")
+
+    @classmethod
+    def load(cls, path: str) -> Optional["UserIndex"]:
+        try:
+            index = faiss.read_index(f"{path}.faiss")
+            with open(f"{path}.json", "r") as f:
+                sidecar = json.load(f)
+        except (OSError, RuntimeError, ValueError):
+            return None
+        entries = {int(i): entry for i, entry in sidecar["entries"].items()}
+        return cls(index, entries, sidecar["next_id"], sidecar.get("model"))
+
+
+class ConversationIndex:
+    def __init__(self, directory: str = CONVERSATION_INDEX_DIR, max_mb: float = CONVERSATION_INDEX_MAX_MB,
+                 batch_size: int = CONVERSATION_INDEX_BATCH, queue_size: int = CONVERSATION_INDEX_QUEUE,
+                 save_interval: float = CONVERSATION_INDEX_SAVE_INTERVAL,
+                 encode: Optional[Callable] = None, encode_query: Optional[Callable] = None,
+                 model_id: Optional[str] = None):
+        self.directory = directory
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.batch_size = batch_size
+        self.save_interval = save_interval
+        self.encode = encode or setvectordb.encode_texts
+        # torch and onnx give vectors of the same dimension that still don't compare
+        self.model_id = model_id or embedding_backends.model_id(setvectordb.MODEL_NAME)
+        self.query_cache = setvectordb.QueryEmbeddingCache(CONVERSATION_QUERY_CACHE_SIZE)
+        self.encode_query = encode_query or (lambda queries: self.query_cache.get_many(queries, self.encode))
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._loaded: "OrderedDict[str, UserIndex]" = OrderedDict()  # LRU order
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self.indexed = 0
+        self.dropped = 0
+        self.loads = 0
+        self.evictions = 0
+        self.rebuilds = 0
+
+    def _path(self, user_id: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(user_id.encode()).hexdigest()[:32])
+
+    ### -------- Request path: enqueue only --------
+    def _start(self) -> None:
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="conversation-index", daemon=True)
+                    self._worker.start()
+
+    def _enqueue(self, op: tuple, block: bool) -> None:
+        self._start()
+        try:
+            self._queue.put(op, block=block)
+        except queue.Full:
+            # losing a message from search beats slowing down the chat
+            self.dropped += 1
+
+    def add_messages(self, user_id: str, session_id: str, messages: List[Tuple[str, str]],
+                     block: bool = False) -> None:
+        """Queue (sender, text) messages of one session for indexing"""
+        messages = [(sender, text) for sender, text in messages if isinstance(text, str) and text.strip()]
+        if user_id and messages:
+            self._enqueue(("add", user_id, session_id, messages), block)
+
+    def add_turn(self, user_id: str, session_id: str, user_text: str, ai_text: str) -> None:
+        self.add_messages(user_id, session_id, [("user", user_text), ("ai", ai_text)])
+
+    def remove_session(self, user_id: str, session_id: str, block: bool = False) -> None:
+        """Queued too, so it is applied after any of the session's pending messages"""
+        if user_id:
+            self._enqueue(("remove", user_id, session_id), block)
+
+    ### -------- Background writer --------
+    def _get(self, user_id: str, dimension: Optional[int] = None) -> Optional[UserIndex]:
+        """The user's index, loaded from disk if needed; new if `dimension` is given. Lock held."""
+        user = self._loaded.get(user_id)
+        if user is not None:
+            self._loaded.move_to_end(user_id)
+            return user
+        user = UserIndex.load(self._path(user_id))
+        if user is not None and user.model != self.model_id:
+            # saved empty over the stale file so it is only rebuilt once
+            print(f"[conversations] index built with {user.model}, not {self.model_id}; re-indexing from the database")
+            user = UserIndex.new(user.index.d, self.model_id)
+            self._dirty.add(user_id)
+            self._rebuild(user_id)
+        elif user is not None:
+            self.loads += 1
+        elif dimension is not None:
+            user = UserIndex.new(dimension, self.model_id)
+        else:
+            return None
+        self._loaded[user_id] = user
+        self._evict()
+        return user
+
+    def _evict(self) -> None:
+        # the most recent user stays even if it alone is over the cap
+        while len(self._loaded) > 1 and sum(u.nbytes for u in self._loaded.values()) > self.max_bytes:
+            user_id, user = self._loaded.popitem(last=False)
+            if user_id in self._dirty:
+                self._save(user_id, user)
+            self.evictions += 1
+
+    def _save(self, user_id: str, user: UserIndex) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        user.save(self._path(user_id))
+        self._dirty.discard(user_id)
+
+    def _apply(self, batch: List[tuple]) -> None:
+        rows = [(op[1], op[2], sender, text) for op in batch if op[0] == "add" for sender, text in op[3]]
+        vectors = np.asarray(self.encode([text for _, _, _, text in rows]), dtype="float32") if rows else None
+        offset = 0
+        with self._lock:
+            for op in batch:
+                if op[0] == "add":
+                    n = len(op[3])
+                    user = self._get(op[1], vectors.shape[1])
+                    if user.index.d != vectors.shape[1]:
+                        # built with another embedding model; its vectors can't be compared
+                        user = self._loaded[op[1]] = UserIndex.new(vectors.shape[1], self.model_id)
+                    user.add(vectors[offset:offset + n], [(session_id, sender, text)
+                                                          for _, session_id, sender, text in rows[offset:offset + n]])
+                    offset += n
+                    self.indexed += n
+                else:
+                    user = self._get(op[1])
+                    if user is None or not user.remove_session(op[2]):
+                        continue
+                self._dirty.add(op[1])
+            self._evict()
+
+    def _rebuild(self, user_id: str) -> None:
+        # not on the worker: re-queueing blocks until the worker has room
+        self.rebuilds += 1
+        threading.Thread(target=self._reindex, args=(user_id,), name="conversation-reindex", daemon=True).start()
+
+    def _reindex(self, user_id: str) -> None:
+        try:
+            reindex_user(self, user_id)
+        except Exception as e:
+            print(f"[conversations] re-indexing a user's messages failed: {e}")
+
+    def save_dirty(self) -> None:
+        with self._lock:
+            for user_id in list(self._dirty):
+                if user_id in self._loaded:
+                    self._save(user_id, self._loaded[user_id])
+
+    def _run(self) -> None:
+        last_save = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                batch = [self._queue.get(timeout=self.save_interval)]
+            except queue.Empty:
+                batch = []
+            while batch and len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if batch:
+                    self._apply(batch)
+                if time.monotonic() - last_save >= self.save_interval:
+                    self.save_dirty()
+                    last_save = time.monotonic()
+            except Exception as e:
+                print(f"[conversations] indexing batch of {len(batch)} failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self) -> None:
+        """Block until everything queued so far is indexed"""
+        if self._worker is not None:
+            self._queue.join()
+
+    def close(self) -> None:
+        self.flush()
+        self._stop_event.set()
+        self.save_dirty()
+
+    ### -------- Search --------
+    def search(self, user_id: str, query: str, k: int = 10) -> List[Match]:
+        """Sessions of `user_id` with a message most similar to `query`, best first"""
+        vector = np.asarray(self.encode_query([query]), dtype="float32").reshape(1, -1)
+        with self._lock:
+            user = self._get(user_id)
+            if user is None or user.index.d != vector.shape[1]:
+                return []
+            return user.search(vector, k)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"queued": self._queue.qsize(), "indexed": self.indexed, "dropped": self.dropped,
+                    "users_loaded": len(self._loaded), "dirty": len(self._dirty), "loads": self.loads,
+                    "evictions": self.evictions, "rebuilds": self.rebuilds,
+                    "loaded_mb": sum(u.nbytes for u in self._loaded.values()) / (1024 * 1024),
+                    **{f"query_cache_{k}": v for k, v in self.query_cache.stats().items()}}
+
+
+# shared by the chat handlers; None unless CONVERSATION_INDEX=1
+conversations = ConversationIndex() if CONVERSATION_INDEX_ENABLED else None
+if conversations is not None:
+    metrics.register_collector("assistant_conversation_index", conversations.stats)
+    # index what is still queued and save changed indexes on a clean shutdown
+    atexit.register(conversations.close)
+
+
+def backfill(index: ConversationIndex) -> int:
+    """Queue every message already in the messages table; returns the number of messages.
+
+    Each session is removed before it is re-added, so running it again doesn't duplicate entries.
+    """
+    from database import connection
+
+    with connection() as conn, conn.transaction():
+        with conn.cursor(name="conversation_backfill") as cur:
+            cur.itersize = 2000
+            cur.execute(SELECT_ALL_MESSAGES_SQL)
+            return queue_sessions(index, cur)
+
+
+def reindex_user(index: ConversationIndex, user_id: str) -> int:
+    """Queue all of one user's messages again (their index was built by another model)"""
+    from database import connection
+
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(SELECT_USER_MESSAGES_SQL, (user_id,))
+        rows = cur.fetchall()
+    return queue_sessions(index, rows)
+
+
+def queue_sessions(index: ConversationIndex, rows) -> int:
+    """Queue (user_id, session_id, sender, text) rows, ordered by session, replacing each session"""
+    count, key, messages = 0, None, []
+    for user_id, session_id, sender, text in rows:
+        if (user_id, session_id) != key:
+            if messages:
+                index.remove_session(*key, block=True)
+                index.add_messages(*key, messages, block=True)
+            key, messages = (user_id, session_id), []
+        messages.append((sender, text))
+        count += 1
+    if messages:
+        index.remove_session(*key, block=True)
+        index.add_messages(*key, messages, block=True)
+    return count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backfill", action="store_true", help="index every message in the messages table")
+    args = parser.parse_args()
+
+    if not args.backfill:
+        parser.print_help()
+        return
+    index = conversations or ConversationIndex()
+    start = time.perf_counter()
+    count = backfill(index)
+    index.close()
+    print(f"[conversations] indexed {count} messages in {time.perf_counter() - start:.1f}s: {index.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,156 @@
-import psycopg2
+from contextlib import AsyncExitStack, ExitStack, asynccontextmanager, contextmanager
 from dotenv import load_dotenv
+import asyncio
 import os
+import threading
+import time
+from psycopg_pool import AsyncConnectionPool, ConnectionPool, PoolTimeout
+import metrics
+import startup
 load_dotenv()
-conn = psycopg2.connect(
-  host=os.getenv("DB_HOST"),
-  port=os.getenv("DB_PORT"),
-  database=os.getenv("DB_NAME"),
-  user=os.getenv("DB_USER"),
-  password = os.getenv("DB_PASSWORD")
-)
\ No newline at end of file
+
+DATABASE_URL = f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
+
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "600"))
+# apply pending schema migrations before the first pool is handed out
+AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "1") == "1"
+
+# shared by DatabaseManager and the LangGraph PostgresSaver
+connection_kwargs = {
+  "autocommit": True,
+  "prepare_threshold": 0,
+}
+
+class PoolMetrics:
+  """Acquire-latency and timeout counters for the connection pool"""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.acquired = 0
+    self.timeouts = 0
+    self.total_wait = 0.0
+    self.max_wait = 0.0
+
+  def record_acquire(self,wait:float)->None:
+    with self._lock:
+      self.acquired += 1
+      self.total_wait += wait
+      self.max_wait = max(self.max_wait,wait)
+
+  def record_timeout(self)->None:
+    with self._lock:
+      self.timeouts += 1
+
+  def snapshot(self)->dict:
+    with self._lock:
+      avg = self.total_wait / self.acquired if self.acquired else 0.0
+      return {"acquired":self.acquired,"timeouts":self.timeouts,
+              "avg_wait_ms":avg * 1000,"max_wait_ms":self.max_wait * 1000}
+
+pool_metrics = PoolMetrics()
+
+def _migrate():
+  if AUTO_MIGRATE:
+    import migrations
+    migrations.migrate()
+
+def _create_pool():
+  _migrate()
+  pool = ConnectionPool(
+    DATABASE_URL,
+    min_size=POOL_MIN_SIZE,
+    max_size=POOL_MAX_SIZE,
+    timeout=POOL_TIMEOUT,
+    max_idle=POOL_MAX_IDLE,
+    kwargs=connection_kwargs,
+    # health check before a connection is handed out
+    check=ConnectionPool.check_connection,
+    name="personal-assistant",
+    open=False,
+  )
+  pool.open(wait=True)
+  return pool
+
+_pool = startup.lazy("db_pool",_create_pool)
+
+def get_pool()->ConnectionPool:
+  """Process-wide pool, opened on first use"""
+  return _pool.get()
+
+@contextmanager
+def connection():
+  """Borrow a pooled connection for the duration of the block.
+
+  Delegates to pool.connection(), so the pool commits or rolls back whatever the
+  block left open before the connection is reused.
+  """
+  pool = get_pool()
+  with ExitStack() as stack:
+    start = time.perf_counter()
+    try:
+      conn = stack.enter_context(pool.connection())
+    except PoolTimeout:
+      pool_metrics.record_timeout()
+      raise
+    pool_metrics.record_acquire(time.perf_counter() - start)
+    yield conn
+
+### -------- Async pool --------
+async def _create_async_pool():
+  await asyncio.to_thread(_migrate)
+  pool = AsyncConnectionPool(
+    DATABASE_URL,
+    min_size=POOL_MIN_SIZE,
+    max_size=POOL_MAX_SIZE,
+    timeout=POOL_TIMEOUT,
+    max_idle=POOL_MAX_IDLE,
+    kwargs=connection_kwargs,
+    check=AsyncConnectionPool.check_connection,
+    name="personal-assistant-async",
+    open=False,
+  )
+  await pool.open(wait=True)
+  return pool
+
+_async_pool = startup.lazy_async("db_pool_async",_create_async_pool)
+
+async def get_async_pool()->AsyncConnectionPool:
+  """Pool for the asyncio request path, opened on first use inside the running loop"""
+  return await _async_pool.get()
+
+@asynccontextmanager
+async def async_connection():
+  """Async version of connection()"""
+  pool = await get_async_pool()
+  async with AsyncExitStack() as stack:
+    start = time.perf_counter()
+    try:
+      conn = await stack.enter_async_context(pool.connection())
+    except PoolTimeout:
+      pool_metrics.record_timeout()
+      raise
+    pool_metrics.record_acquire(time.perf_counter() - start)
+    yield conn
+## ---------------------------------
+
+def pool_stats()->dict:
+  """Our acquire metrics merged with psycopg_pool's own counters"""
+  stats = pool_metrics.snapshot()
+  if _pool.ready:
+    stats.update(_pool.get().get_stats())
+  return stats
+
+metrics.register_collector("assistant_db_pool",pool_stats)
+
+def close_pool()->None:
+  pool = _pool.reset()
+  if pool is not None:
+    pool.close()
+
+async def close_async_pool()->None:
+  pool = _async_pool.reset()
+  if pool is not None:
+    await pool.close()
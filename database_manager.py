@@ -1,133 +1,387 @@
 import uuid
 from datetime import datetime
-from typing import List, Tuple, Optional
-from database import conn
+from typing import Iterator, List, Tuple, Optional
+from database import async_connection, connection
+import metrics
 
 
-conn.autocommit = True
+# SQL shared by the sync and async managers
+INSERT_MESSAGE_SQL = """
+    INSERT INTO messages (message_id, session_id, sender, message_text, created_at)
+    VALUES (%s, %s, %s, %s, %s)
+    """
+UPDATE_SESSION_NAME_SQL = "UPDATE sessions SET session_name = %s WHERE session_id = %s"
+# a session's name is NULL until its first user message, so no COUNT(*) is needed
+NAME_UNNAMED_SESSION_SQL = """
+    UPDATE sessions SET session_name = %s
+    WHERE session_id = %s AND session_name IS NULL
+    """
+# user message + AI reply + first-message session name in one statement / round-trip
+INSERT_TURN_SQL = """
+    WITH turn AS (
+        INSERT INTO messages (message_id, session_id, sender, message_text, created_at)
+        VALUES (%(user_message_id)s, %(session_id)s, 'user', %(user_text)s, %(user_at)s),
+               (%(ai_message_id)s, %(session_id)s, 'ai', %(ai_text)s, %(ai_at)s)
+        RETURNING message_id
+    )
+    UPDATE sessions SET session_name = %(session_name)s
+    WHERE session_id = %(session_id)s AND session_name IS NULL
+    """
+# checkpoint storage mode: the turn lives in the checkpointer, only session metadata is written
+RECORD_TURN_SQL = """
+    UPDATE sessions SET message_count = message_count + %s,
+                        session_name = COALESCE(session_name, %s)
+    WHERE session_id = %s
+    """
+INSERT_SESSION_SQL = """
+    INSERT INTO sessions (session_id, user_id,  start_time)
+    VALUES (%s, %s,  %s)
+    """
+INSERT_USER_SQL = """
+    INSERT INTO users(user_id, username, created_at)
+    VALUES (%s, %s, %s)
+    """
+SELECT_USER_SQL = "SELECT user_id FROM users WHERE username = %s"
+SELECT_SESSION_MESSAGES_SQL = """
+    SELECT sender, message_text FROM messages
+    WHERE session_id = %s
+    ORDER BY created_at ASC, message_id ASC
+    """
+SELECT_SESSION_MESSAGES_WITH_IDS_SQL = """
+    SELECT message_id, sender, message_text FROM messages
+    WHERE session_id = %s
+    ORDER BY created_at ASC, message_id ASC
+    """
+# message_count is kept current by triggers (migrations.py), served from sessions_user_start_idx
+# keyset pages, newest first; (created_at, message_id) is unique and matches messages_session_keyset_idx
+SELECT_LATEST_PAGE_SQL = """
+    SELECT sender, message_text, created_at, message_id FROM messages
+    WHERE session_id = %s
+    ORDER BY created_at DESC, message_id DESC
+    LIMIT %s
+    """
+SELECT_OLDER_PAGE_SQL = """
+    SELECT sender, message_text, created_at, message_id FROM messages
+    WHERE session_id = %s AND (created_at, message_id) < (%s, %s)
+    ORDER BY created_at DESC, message_id DESC
+    LIMIT %s
+    """
+SELECT_USER_SESSIONS_SQL = """
+    SELECT session_id, COALESCE(session_name, '[unnamed]') as session_name,
+           start_time, message_count as msg_count
+    FROM sessions s
+    WHERE user_id = %s
+    ORDER BY start_time DESC
+    LIMIT 20
+    """
+SELECT_SESSION_INFO_SQL = "SELECT session_id, session_name, start_time FROM sessions WHERE session_id = %s"
+SELECT_SESSION_OWNER_SQL = "SELECT user_id FROM sessions WHERE session_id = %s"
+# GIN lookup on messages_tsv_idx (migration 6); only the top `limit` rows pay for ts_headline
+SEARCH_MESSAGES_SQL = """
+    SELECT hit.session_id, COALESCE(hit.session_name, '[unnamed]'), hit.sender,
+           ts_headline('english', hit.message_text, hit.query,
+                       'StartSel="«", StopSel="»", MaxWords=18, MinWords=6, MaxFragments=1'),
+           hit.created_at, hit.rank
+    FROM (
+        SELECT m.session_id, s.session_name, m.sender, m.message_text, m.created_at, q.query,
+               ts_rank(m.message_tsv, q.query) AS rank
+        FROM websearch_to_tsquery('english', %(query)s) AS q(query)
+        JOIN messages m ON m.message_tsv @@ q.query
+        JOIN sessions s ON s.session_id = m.session_id
+        WHERE s.user_id = %(user_id)s
+        ORDER BY rank DESC, m.created_at DESC
+        LIMIT %(limit)s
+    ) hit
+    ORDER BY hit.rank DESC, hit.created_at DESC
+    """
+DELETE_SESSION_MESSAGES_SQL = "DELETE FROM messages WHERE session_id = %s"
+DELETE_SESSION_SQL = "DELETE FROM sessions WHERE session_id = %s"
 
+HistoryCursor = Tuple[datetime, str]
+# (session_id, session_name, sender, highlighted snippet, created_at, rank)
+SearchHit = Tuple[str, str, str, str, datetime, float]
+
+
+def turn_params(session_id: str, user_text: str, ai_text: str, user_at: Optional[datetime] = None) -> dict:
+    """Bind parameters for INSERT_TURN_SQL"""
+    return {
+        "session_id": session_id,
+        "user_message_id": str(uuid.uuid4()),
+        "user_text": user_text,
+        "user_at": user_at or datetime.now(),
+        "ai_message_id": str(uuid.uuid4()),
+        "ai_text": ai_text,
+        "ai_at": datetime.now(),
+        "session_name": user_text[:30],
+    }
+
+
+def page_query(session_id: str, limit: int, before: Optional[HistoryCursor]) -> Tuple[str, tuple]:
+    # one row past the limit tells us whether an older page exists
+    if before is None:
+        return SELECT_LATEST_PAGE_SQL, (session_id, limit + 1)
+    return SELECT_OLDER_PAGE_SQL, (session_id, before[0], before[1], limit + 1)
+
+
+def split_page(rows: List[tuple], limit: int, with_ids: bool = False) -> Tuple[List[tuple], Optional[HistoryCursor]]:
+    """Newest-first rows -> (oldest-first (sender, text) rows, cursor for the next older page).
+
+    with_ids gives (message_id, sender, text) rows instead.
+    """
+    page = rows[:limit]
+    cursor = (page[-1][2], page[-1][3]) if len(rows) > limit else None
+    if with_ids:
+        return [(message_id, sender, text) for sender, text, _, message_id in reversed(page)], cursor
+    return [(sender, text) for sender, text, _, _ in reversed(page)], cursor
+
+
+@metrics.instrumented(metrics.DB_SECONDS)
 class DatabaseManager:
-    
+
     @staticmethod
     def insert_message(session_id: str, sender: str, message_text: str) -> None:
         """Insert a message into the database"""
-        with conn.cursor() as cur:
+        with connection() as conn, conn.cursor() as cur:
             cur.execute(
-                """
-                INSERT INTO messages (message_id, session_id, sender, message_text, created_at) 
-                VALUES (%s, %s, %s, %s, %s)
-                """,
+                INSERT_MESSAGE_SQL,
                 (str(uuid.uuid4()), session_id, sender, message_text, datetime.now())
             )
             if sender == "user":
-                cur.execute(
-                    "SELECT COUNT(*) FROM messages WHERE session_id = %s",
-                    (session_id,)
-                )
-                msg_count = cur.fetchone()[0]
-                if msg_count == 1:
-                    session_name = message_text[:30]
-                    cur.execute(
-                        "UPDATE sessions SET session_name = %s WHERE session_id = %s",
-                        (session_name,session_id)
-                    )
-   
+                cur.execute(NAME_UNNAMED_SESSION_SQL, (message_text[:30], session_id))
+
+    @staticmethod
+    def insert_turn(session_id: str, user_text: str, ai_text: str,
+                    user_at: Optional[datetime] = None) -> Tuple[str, str]:
+        """Persist a user message and its AI reply in a single round-trip; returns their message ids"""
+        params = turn_params(session_id, user_text, ai_text, user_at)
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(INSERT_TURN_SQL, params)
+        return params["user_message_id"], params["ai_message_id"]
+
+    @staticmethod
+    def record_turn(session_id: str, user_text: str, message_count: int = 2) -> None:
+        """Bump message_count and name an unnamed session without storing message rows"""
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(RECORD_TURN_SQL, (message_count, user_text[:30], session_id))
+
     @staticmethod
     def create_session(user_id: str) -> str:
         """Create a new session without name (name set after first message)"""
         session_id = str(uuid.uuid4())
-        
-        
-            
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO sessions (session_id, user_id,  start_time)
-                VALUES (%s, %s,  %s)
-                """,
-                (session_id, user_id,  datetime.now())
-            )
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(INSERT_SESSION_SQL, (session_id, user_id,  datetime.now()))
         return session_id
-    
+
     @staticmethod
     def create_user(username: str) -> str:
         """Create a new user"""
         user_id = str(uuid.uuid4())
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO users(user_id, username, created_at)
-                VALUES (%s, %s, %s)
-                """,
-                (user_id, username, datetime.now())
-            )
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(INSERT_USER_SQL, (user_id, username, datetime.now()))
         return user_id
-    
+
     @staticmethod
     def get_or_create_user(username: str) -> str:
         """Get existing user or create new one"""
-        with conn.cursor() as cur:
-            cur.execute("SELECT user_id FROM users WHERE username = %s", (username,))
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(SELECT_USER_SQL, (username,))
             result = cur.fetchone()
-            if result:
-                return result[0]
-            else:
-                return DatabaseManager.create_user(username)
-   
-    @staticmethod
-    def get_session_messages(session_id: str) -> List[Tuple[str, str]]:
-        """Get all messages from a session"""
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT sender, message_text FROM messages 
-                WHERE session_id = %s 
-                ORDER BY created_at ASC
-                """, 
-                (session_id,)
-            )
+        # connection is released before create_user borrows one
+        if result:
+            return result[0]
+        else:
+            return DatabaseManager.create_user(username)
+
+    @staticmethod
+    def get_session_messages(session_id: str, with_ids: bool = False) -> List[tuple]:
+        """Get all messages from a session; with_ids gives (message_id, sender, text) rows"""
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(SELECT_SESSION_MESSAGES_WITH_IDS_SQL if with_ids else SELECT_SESSION_MESSAGES_SQL,
+                        (session_id,))
             return cur.fetchall()
-   
+
+    @staticmethod
+    def get_session_messages_page(session_id: str, limit: int = 50,
+                                  before: Optional[HistoryCursor] = None, with_ids: bool = False
+                                  ) -> Tuple[List[tuple], Optional[HistoryCursor]]:
+        """Get up to `limit` messages older than `before` (the latest ones if None), oldest first.
+
+        Returns the rows and a cursor for the next older page, or None when there is none.
+        """
+        sql, params = page_query(session_id, limit, before)
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(sql, params)
+            return split_page(cur.fetchall(), limit, with_ids)
+
+    @staticmethod
+    def iter_session_messages(session_id: str, itersize: int = 500) -> Iterator[Tuple[str, str]]:
+        """Stream a whole session through a server-side cursor instead of one fetchall()"""
+        with connection() as conn, conn.transaction():
+            with conn.cursor(name=f"history_{uuid.uuid4().hex}") as cur:
+                cur.itersize = itersize
+                cur.execute(SELECT_SESSION_MESSAGES_SQL, (session_id,))
+                yield from cur
+
     @staticmethod
     def get_user_sessions(user_id: str) -> List[Tuple[str, str, datetime, int]]:
         """Get all sessions for a user with session names"""
-        with conn.cursor() as cur:
-            cur.execute(
-                 """
-            SELECT session_id, COALESCE(session_name, '[unnamed]') as session_name,
-                   start_time,
-                   (SELECT COUNT(*) FROM messages WHERE session_id = s.session_id) as msg_count
-            FROM sessions s 
-            WHERE user_id = %s 
-            ORDER BY start_time DESC 
-            LIMIT 20
-            """, 
-                (user_id,)
-            )
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(SELECT_USER_SESSIONS_SQL, (user_id,))
+            return cur.fetchall()
+
+    @staticmethod
+    def search_messages(user_id: str, query: str, limit: int = 20) -> List[SearchHit]:
+        """Full-text search over a user's messages, best match first.
+
+        `query` uses web search syntax ("quoted phrases", -excluded, or). Matched terms
+        in the snippet are wrapped in «». Sessions stored with CHAT_STORAGE_MODE=checkpoint
+        have no message rows, so they are not searchable.
+        """
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(SEARCH_MESSAGES_SQL, {"user_id": user_id, "query": query, "limit": limit})
             return cur.fetchall()
-   
+
     @staticmethod
     def update_session_name(session_id: str, new_name: str) -> None:
         """Update session name"""
-        with conn.cursor() as cur:
-            cur.execute(
-                "UPDATE sessions SET session_name = %s WHERE session_id = %s",
-                (new_name, session_id)
-            )
-    
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(UPDATE_SESSION_NAME_SQL, (new_name, session_id))
+
     @staticmethod
     def get_session_info(session_id: str) -> Optional[Tuple[str, str, datetime]]:
         """Get session info by ID"""
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT session_id, session_name, start_time FROM sessions WHERE session_id = %s",
-                (session_id,)
-            )
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(SELECT_SESSION_INFO_SQL, (session_id,))
             return cur.fetchone()
-   
+
+    @staticmethod
+    def get_session_owner(session_id: str) -> Optional[str]:
+        """user_id of the session's owner, None if the session doesn't exist"""
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(SELECT_SESSION_OWNER_SQL, (session_id,))
+            row = cur.fetchone()
+            return row[0] if row else None
+
     @staticmethod
     def delete_session(session_id: str) -> None:
-        """Delete a session and all its messages"""
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM messages WHERE session_id = %s", (session_id,))
-            cur.execute("DELETE FROM sessions WHERE session_id = %s", (session_id,))
\ No newline at end of file
+        """Delete a session, its messages and (by trigger, see migration 5) its checkpoints"""
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(DELETE_SESSION_MESSAGES_SQL, (session_id,))
+            cur.execute(DELETE_SESSION_SQL, (session_id,))
+
+
+@metrics.instrumented(metrics.DB_SECONDS)
+class AsyncDatabaseManager:
+    """asyncio twin of DatabaseManager, backed by the async connection pool"""
+
+    @staticmethod
+    async def insert_message(session_id: str, sender: str, message_text: str) -> None:
+        """Insert a message into the database"""
+        async with async_connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                INSERT_MESSAGE_SQL,
+                (str(uuid.uuid4()), session_id, sender, message_text, datetime.now())
+            )
+            if sender == "user":
+                await cur.execute(NAME_UNNAMED_SESSION_SQL, (message_text[:30], session_id))
+
+    @staticmethod
+    async def insert_turn(session_id: str, user_text: str, ai_text: str,
+                          user_at: Optional[datetime] = None) -> Tuple[str, str]:
+        """Persist a user message and its AI reply in a single round-trip; returns their message ids"""
+        params = turn_params(session_id, user_text, ai_text, user_at)
+        async with async_connection() as conn, conn.cursor() as cur:
+            await cur.execute(INSERT_TURN_SQL, params)
+        return params["user_message_id"], params["ai_message_id"]
+
+    @staticmethod
+    async def record_turn(session_id: str, user_text: str, message_count: int = 2) -> None:
+        """Bump message_count and name an unnamed session without storing message rows"""
+        async with async_connection() as conn, conn.cursor() as cur:
+            await cur.execute(RECORD_TURN_SQL, (message_count, user_text[:30], session_id))
+
+    @staticmethod
+    async def create_session(user_id: str) -> str:
+        """Create a new session without name (name set after first message)"""
+        session_id = str(uuid.uuid4())
+        async with async_connection() as conn, conn.cursor() as cur:
+            await cur.execute(INSERT_SESSION_SQL, (session_id, user_id,  datetime.now()))
+        return session_id
+
+    @staticmethod
+    async def create_user(username: str) -> str:
+        """Create a new user"""
+        user_id = str(uuid.uuid4())
+        async with async_connection() as conn, conn.cursor() as cur:
+            await cur.execute(INSERT_USER_SQL, (user_id, username, datetime.now()))
+        return user_id
+
+    @staticmethod
+    async def get_or_create_user(username: str) -> str:
+        """Get existing user or create new one"""
+        async with async_connection() as conn, conn.cursor() as cur:
+            await cur.execute(SELECT_USER_SQL, (username,))
+            result = await cur.fetchone()
+        if result:
+            return result[0]
+        return await AsyncDatabaseManager.create_user(username)
+
+    @staticmethod
+    async def get_session_messages(session_id: str, with_ids: bool = False) -> List[tuple]:
+        """Get all messages from a session; with_ids gives (message_id, sender, text) rows"""
+        async with async_connection() as conn, conn.cursor() as cur:
+            await cur.execute(SELECT_SESSION_MESSAGES_WITH_IDS_SQL if with_ids else SELECT_SESSION_MESSAGES_SQL,
+                              (session_id,))
+            return await cur.fetchall()
+
+    @staticmethod
+    async def get_session_messages_page(session_id: str, limit: int = 50,
+                                        before: Optional[HistoryCursor] = None, with_ids: bool = False
+                                        ) -> Tuple[List[tuple], Optional[HistoryCursor]]:
+        """Async version of DatabaseManager.get_session_messages_page"""
+        sql, params = page_query(session_id, limit, before)
+        async with async_connection() as conn, conn.cursor() as cur:
+            await cur.execute(sql, params)
+            return split_page(await cur.fetchall(), limit, with_ids)
+
+    @staticmethod
+    async def get_user_sessions(user_id: str) -> List[Tuple[str, str, datetime, int]]:
+        """Get all sessions for a user with session names"""
+        async with async_connection() as conn, conn.cursor() as cur:
+            await cur.execute(SELECT_USER_SESSIONS_SQL, (user_id,))
+            return await cur.fetchall()
+
+    @staticmethod
+    async def search_messages(user_id: str, query: str, limit: int = 20) -> List[SearchHit]:
+        """Async version of DatabaseManager.search_messages"""
+        async with async_connection() as conn, conn.cursor() as cur:
+            await cur.execute(SEARCH_MESSAGES_SQL, {"user_id": user_id, "query": query, "limit": limit})
+            return await cur.fetchall()
+
+    @staticmethod
+    async def update_session_name(session_id: str, new_name: str) -> None:
+        """Update session name"""
+        async with async_connection() as conn, conn.cursor() as cur:
+            await cur.execute(UPDATE_SESSION_NAME_SQL, (new_name, session_id))
+
+    @staticmethod
+    async def get_session_info(session_id: str) -> Optional[Tuple[str, str, datetime]]:
+        """Get session info by ID"""
+        async with async_connection() as conn, conn.cursor() as cur:
+            await cur.execute(SELECT_SESSION_INFO_SQL, (session_id,))
+            return await cur.fetchone()
+
+    @staticmethod
+    async def get_session_owner(session_id: str) -> Optional[str]:
+        """Async version of DatabaseManager.get_session_owner"""
+        async with async_connection() as conn, conn.cursor() as cur:
+            await cur.execute(SELECT_SESSION_OWNER_SQL, (session_id,))
+            row = await cur.fetchone()
+            return row[0] if row else None
+
+    @staticmethod
+    async def delete_session(session_id: str) -> None:
+        """Delete a session, its messages and (by trigger, see migration 5) its checkpoints"""
+        async with async_connection() as conn, conn.cursor() as cur:
+            await cur.execute(DELETE_SESSION_MESSAGES_SQL, (session_id,))
+            await cur.execute(DELETE_SESSION_SQL, (session_id,))
@@ -0,0 +1,111 @@
+"""Embedding backends for the playlist index, query lookups and chat message search.
+
+Every backend exposes the slice of the SentenceTransformer API that setvectordb uses,
+``encode(texts, normalize_embeddings=...)`` and ``get_sentence_embedding_dimension()``,
+so the index build and query paths don't care which one is loaded.
+
+EMBEDDING_BACKEND picks one:
+
+  torch  sentence-transformers on PyTorch (default, the original model)
+  onnx   the same model exported to ONNX, run on ONNX Runtime CPU with mean pooling
+         done in numpy; torch is never imported
+  int8   as onnx, with the int8-quantized export: smaller and faster, with close
+         but not identical vectors
+
+The onnx backends need ``pip install onnxruntime tokenizers huggingface_hub``. They
+download the model's published ONNX files from the Hugging Face hub on first use.
+EMBEDDING_ONNX_FILE overrides which file in the model repo is loaded.
+"""
+import os
+import platform
+from typing import List, Optional, Union
+
+import numpy as np
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "")
+# ONNX Runtime intra-op threads, 0 = its default (one per core)
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+# all-MiniLM-L6-v2's max_seq_length; playlist names and queries are far shorter
+MAX_SEQ_LENGTH = 256
+
+BACKENDS = ("torch", "onnx", "int8")
+
+
+def onnx_file(backend: str) -> str:
+    """Which of the model repo's ONNX exports a backend loads"""
+    if EMBEDDING_ONNX_FILE:
+        return EMBEDDING_ONNX_FILE
+    if backend == "int8":
+        arm = platform.machine().lower() in ("arm64", "aarch64")
+        return "onnx/model_qint8_arm64.onnx" if arm else "onnx/model_quint8_avx2.onnx"
+    return "onnx/model.onnx"
+
+
+def model_id(model_name: str, backend: str = EMBEDDING_BACKEND) -> str:
+    """Identifies the vectors a backend produces, for cache keys; torch keeps the bare model name"""
+    if backend == "torch":
+        return model_name
+    return f"{model_name}@{onnx_file(backend)}"
+
+
+class OnnxEncoder:
+    """SentenceTransformer-compatible encoder on ONNX Runtime: tokenize, run, mean-pool"""
+
+    def __init__(self, model_name: str, file_name: str, threads: int = EMBEDDING_THREADS,
+                 max_length: int = MAX_SEQ_LENGTH):
+        # imported here so the default torch backend doesn't need these installed
+        import onnxruntime as ort
+        from huggingface_hub import hf_hub_download
+        from tokenizers import Tokenizer
+
+        repo = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+        self.tokenizer = Tokenizer.from_file(hf_hub_download(repo, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.enable_padding()
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(hf_hub_download(repo, file_name), options,
+                                            providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        dimension = self.session.get_outputs()[0].shape[-1]
+        # symbolic in some exports; ask the model instead
+        self.dimension = dimension if isinstance(dimension, int) else self.encode(["probe"]).shape[1]
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def encode(self, texts: Union[str, List[str]], normalize_embeddings: bool = False,
+               batch_size: int = 64, **kwargs) -> np.ndarray:
+        texts = [texts] if isinstance(texts, str) else list(texts)
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            encoded = self.tokenizer.encode_batch(texts[start:start + batch_size])
+            input_ids = np.array([e.ids for e in encoded], dtype="int64")
+            mask = np.array([e.attention_mask for e in encoded], dtype="int64")
+            feeds = {"input_ids": input_ids, "attention_mask": mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.zeros_like(input_ids)
+            hidden = self.session.run(None, feeds)[0]
+            # mean over real tokens, as the model's sentence-transformers pooling layer does
+            weights = mask[..., None].astype("float32")
+            batches.append((hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None))
+        if not batches:
+            return np.empty((0, getattr(self, "dimension", 0)), dtype="float32")
+        vectors = np.concatenate(batches).astype("float32")
+        if normalize_embeddings:
+            vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors
+
+
+def load_encoder(model_name: str, backend: Optional[str] = None):
+    """The encoder for `backend` (EMBEDDING_BACKEND by default)"""
+    backend = backend or EMBEDDING_BACKEND
+    if backend == "torch":
+        # imported here so importing this module doesn't pull in torch
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    if backend in ("onnx", "int8"):
+        return OnnxEncoder(model_name, onnx_file(backend))
+    raise ValueError(f"unknown embedding backend {backend!r}, expected one of {', '.join(BACKENDS)}")
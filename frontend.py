@@ -1,15 +1,15 @@
 import gradio as gr
 from langchain_core.messages import HumanMessage
-from bot2 import chatbot
+from bot2 import get_chatbot
+from chat_handler import ClientState
 import uuid 
-from database import conn
+from database import connection
 from datetime import datetime
-
-conn.autocommit = True
+import startup
 
 # Database functions
 def insert_message(session_id, sender, message_text):
-    with conn.cursor() as cur:
+    with connection() as conn, conn.cursor() as cur:
         cur.execute(
             """
             INSERT INTO messages (message_id, session_id, sender, message_text, created_at) 
@@ -20,7 +20,7 @@ def insert_message(session_id, sender, message_text):
 
 def create_session(user_id):
     session_id = str(uuid.uuid4())
-    with conn.cursor() as cur:
+    with connection() as conn, conn.cursor() as cur:
         cur.execute(
             """
             INSERT INTO sessions (session_id, user_id, start_time)
@@ -32,7 +32,7 @@ def create_session(user_id):
 
 def create_user(username):
     user_id = str(uuid.uuid4())
-    with conn.cursor() as cur:
+    with connection() as conn, conn.cursor() as cur:
         cur.execute(
             """
             INSERT INTO users(user_id, username, created_at)
@@ -43,17 +43,17 @@ def create_user(username):
     return user_id
 
 def get_or_create_user(username):
-    with conn.cursor() as cur:
+    with connection() as conn, conn.cursor() as cur:
         # Check if user exists
         cur.execute("SELECT user_id FROM users WHERE username = %s", (username,))
         result = cur.fetchone()
-        if result:
-            return result[0]
-        else:
-            return create_user(username)
+    if result:
+        return result[0]
+    else:
+        return create_user(username)
 
 def get_session_messages(session_id):
-    with conn.cursor() as cur:
+    with connection() as conn, conn.cursor() as cur:
         cur.execute(
             """
             SELECT sender, message_text FROM messages 
@@ -65,7 +65,7 @@ def get_session_messages(session_id):
         return cur.fetchall()
 
 def get_user_sessions(user_id):
-    with conn.cursor() as cur:
+    with connection() as conn, conn.cursor() as cur:
         cur.execute(
             """
             SELECT session_id, start_time, 
@@ -79,49 +79,43 @@ def get_user_sessions(user_id):
         )
         return cur.fetchall()
 
-# Global variables for session management
-current_user_id = None
-current_session_id = None
+# Session management: each browser tab has its own ClientState (gr.State below)
 
-def chat_function(message, history, username):
-    global current_user_id, current_session_id
-    
+def chat_function(message, history, username, client):
     if not username.strip():
-        return history, ""
+        return history, "", client
     
     # Get or create user
-    if current_user_id is None:
-        current_user_id = get_or_create_user(username)
+    if client.user_id is None:
+        client.user_id = get_or_create_user(username)
     
     # Create session if none exists
-    if current_session_id is None:
-        current_session_id = create_session(current_user_id)
+    if client.session_id is None:
+        client.session_id = create_session(client.user_id)
     
     # Insert user message
-    insert_message(current_session_id, "user", message)
+    insert_message(client.session_id, "user", message)
     
     # Get AI response
-    config = {"configurable": {"thread_id": current_session_id}}
-    response = chatbot.invoke({'messages': [HumanMessage(content=message)]}, config=config)
+    config = {"configurable": {"thread_id": client.session_id, "user_id": client.user_id}}
+    response = get_chatbot().invoke({'messages': [HumanMessage(content=message)]}, config=config)
     ai_reply = response['messages'][-1].content
     
     # Insert AI response
-    insert_message(current_session_id, "ai", ai_reply)
+    insert_message(client.session_id, "ai", ai_reply)
     
     # Add to history
     history.append([message, ai_reply])
     
-    return history, ""
+    return history, "", client
 
-def load_session(username, session_choice):
-    global current_user_id, current_session_id
-    
+def load_session(username, session_choice, client):
     if not username.strip() or not session_choice:
-        return []
+        return [], client
     
     # Parse session_id from choice
     session_id = session_choice.split(" - ")[0].replace("Session ", "")
-    current_session_id = session_id
+    client.session_id = session_id
     
     # Load messages
     messages = get_session_messages(session_id)
@@ -135,45 +129,42 @@ def load_session(username, session_choice):
             else:
                 history.append([None, text])
     
-    return history
+    return history, client
 
-def refresh_sessions(username):
-    global current_user_id
-    
+def refresh_sessions(username, client):
     if not username.strip():
-        return gr.Dropdown(choices=[])
+        return gr.Dropdown(choices=[]), client
     
-    current_user_id = get_or_create_user(username)
-    sessions = get_user_sessions(current_user_id)
+    client.user_id = get_or_create_user(username)
+    sessions = get_user_sessions(client.user_id)
     
     choices = []
     for session_id, start_time, msg_count in sessions:
         choice_text = f"Session {session_id[:8]} - {start_time.strftime('%Y-%m-%d %H:%M')} ({msg_count} messages)"
         choices.append((choice_text, session_id))
     
-    return gr.Dropdown(choices=choices)
+    return gr.Dropdown(choices=choices), client
 
-def new_session(username):
-    global current_user_id, current_session_id
-    
+def new_session(username, client):
     if not username.strip():
-        return [], gr.Dropdown(choices=[])
+        return [], gr.Dropdown(choices=[]), client
     
-    current_user_id = get_or_create_user(username)
-    current_session_id = create_session(current_user_id)
+    client.user_id = get_or_create_user(username)
+    client.session_id = create_session(client.user_id)
     
     # Refresh sessions dropdown
-    sessions = get_user_sessions(current_user_id)
+    sessions = get_user_sessions(client.user_id)
     choices = []
     for session_id, start_time, msg_count in sessions:
         choice_text = f"Session {session_id[:8]} - {start_time.strftime('%Y-%m-%d %H:%M')} ({msg_count} messages)"
         choices.append((choice_text, session_id))
     
-    return [], gr.Dropdown(choices=choices)
+    return [], gr.Dropdown(choices=choices), client
 
 # Create Gradio interface
 with gr.Blocks(title="AI Chatbot", theme=gr.themes.Soft()) as demo:
     gr.Markdown("# 🤖 AI Chatbot with Database Storage")
+    client_state = gr.State(ClientState())
     
     with gr.Row():
         with gr.Column(scale=1):
@@ -209,33 +200,34 @@ with gr.Blocks(title="AI Chatbot", theme=gr.themes.Soft()) as demo:
     # Event handlers
     send_btn.click(
         chat_function,
-        inputs=[message_input, chatbot_interface, username_input],
-        outputs=[chatbot_interface, message_input]
+        inputs=[message_input, chatbot_interface, username_input, client_state],
+        outputs=[chatbot_interface, message_input, client_state]
     )
     
     message_input.submit(
         chat_function,
-        inputs=[message_input, chatbot_interface, username_input],
-        outputs=[chatbot_interface, message_input]
+        inputs=[message_input, chatbot_interface, username_input, client_state],
+        outputs=[chatbot_interface, message_input, client_state]
     )
     
     refresh_btn.click(
         refresh_sessions,
-        inputs=[username_input],
-        outputs=[sessions_dropdown]
+        inputs=[username_input, client_state],
+        outputs=[sessions_dropdown, client_state]
     )
     
     new_session_btn.click(
         new_session,
-        inputs=[username_input],
-        outputs=[chatbot_interface, sessions_dropdown]
+        inputs=[username_input, client_state],
+        outputs=[chatbot_interface, sessions_dropdown, client_state]
     )
     
     sessions_dropdown.change(
         load_session,
-        inputs=[username_input, sessions_dropdown],
-        outputs=[chatbot_interface]
+        inputs=[username_input, sessions_dropdown, client_state],
+        outputs=[chatbot_interface, client_state]
     )
 
 if __name__ == "__main__":
+    startup.warm_up_in_background()
     demo.launch(server_name="0.0.0.0", server_port=7860)
\ No newline at end of file
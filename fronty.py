@@ -1,77 +1,129 @@
 # fronty.py
+import os
 import gradio as gr
-from chat_handler import ChatHandler
-from typing import List, Tuple
+from chat_handler import AsyncChatHandler, ClientState, prepend_history
+from typing import AsyncIterator, List, Tuple
+import checkpoint_retention
+import metrics
+import startup
 
-# Initialize chat handler
-chat_handler = ChatHandler()
+# Initialize chat handler (async: a pending LLM call doesn't hold a worker thread).
+# It is shared by every browser tab; who is chatting in which session lives in a
+# per-tab ClientState (gr.State), so concurrent users can't overwrite each other.
+chat_handler = AsyncChatHandler()
 
 # Always use one default user
 DEFAULT_USER = "default_user"
+# events of the same kind (e.g. chat turns) served at once; safe now that state is per client
+CONCURRENCY = int(os.getenv("GRADIO_CONCURRENCY", "32"))
 
 # --- Chat function ---
-def chat_function(message: str, history: List[List[str]]) -> Tuple[List[List[str]], str]:
-    """Handle chat message and return updated history"""
+async def chat_function(message: str, history: List[List[str]],
+                        client: ClientState) -> AsyncIterator[Tuple[List[List[str]], str]]:
+    """Stream the AI reply into the chat history as tokens arrive"""
     if not message.strip():
-        return history, ""
+        yield history, ""
+        return
     
+    history.append([message, ""])
+    reply, status = "", ""
     try:
-        ai_reply = chat_handler.process_message(message, DEFAULT_USER)
-        history.append([message, ai_reply])
-        return history, ""
+        async for event in chat_handler.stream_message(message, DEFAULT_USER, client):
+            if event["type"] in ("token", "done"):
+                reply, status = event["reply"], ""
+            elif event["type"] == "tool" and event["status"] == "running":
+                # the model is calling a tool, so any text so far was not the final answer
+                reply, status = "", f"_Running {event['name']}..._"
+            history[-1][1] = f"{reply}\n\n{status}" if reply and status else (reply or status)
+            yield history, ""
     except Exception as e:
-        history.append([message, f"Error: {str(e)}"])
-        return history, ""
+        history[-1][1] = f"Error: {str(e)}"
+        yield history, ""
 
 # --- Load session history ---
-def load_session(session_choice: str) -> List[List[str]]:
-    """Load selected session history"""
+async def load_session(session_choice: str, client: ClientState):
+    """Load the latest page of the selected session"""
     if not session_choice:
-        return []
+        return [], None, gr.Button(visible=False), client
     
     session_id = session_choice[1] if isinstance(session_choice, tuple) else session_choice
-    chat_handler.set_session(session_id)
-    return chat_handler.get_session_history(session_id)
+    chat_handler.set_session(session_id, client)
+    history, cursor = await chat_handler.get_session_history_page(session_id, client=client)
+    return history, cursor, gr.Button(visible=cursor is not None), client
+
+# --- Load older messages ---
+async def load_older(session_choice: str, history: List[List[str]], cursor):
+    """Prepend the next older page of the selected session"""
+    if not session_choice or cursor is None:
+        return history, None, gr.Button(visible=False)
+    
+    session_id = session_choice[1] if isinstance(session_choice, tuple) else session_choice
+    older, cursor = await chat_handler.get_session_history_page(session_id, before=cursor)
+    return prepend_history(older, history), cursor, gr.Button(visible=cursor is not None)
+
+def reset_paging():
+    """Forget the older-page cursor when the visible chat is cleared"""
+    return None, gr.Button(visible=False)
 
 # --- Refresh sessions dropdown ---
-def refresh_sessions() -> gr.Dropdown:
+async def refresh_sessions(client: ClientState) -> gr.Dropdown:
     """Refresh sessions dropdown"""
-    choices = chat_handler.get_user_sessions_formatted(DEFAULT_USER)
+    choices = await chat_handler.get_user_sessions_formatted(DEFAULT_USER, client)
     return gr.Dropdown(choices=choices)
 
 # --- Create new session ---
-def new_session() -> Tuple[List[List[str]], gr.Dropdown]:
+async def new_session(client: ClientState) -> Tuple[List[List[str]], gr.Dropdown, ClientState]:
     """Create new session"""
-    chat_handler.create_new_session(DEFAULT_USER)
-    choices = chat_handler.get_user_sessions_formatted(DEFAULT_USER)
-    return [], gr.Dropdown(choices=choices)
+    await chat_handler.create_new_session(DEFAULT_USER, client)
+    choices = await chat_handler.get_user_sessions_formatted(DEFAULT_USER, client)
+    return [], gr.Dropdown(choices=choices), client
 
 # --- Delete session ---
-def delete_session_handler(session_choice: str) -> Tuple[List[List[str]], gr.Dropdown]:
+async def delete_session_handler(session_choice: str,
+                                 client: ClientState) -> Tuple[List[List[str]], gr.Dropdown, ClientState]:
     """Delete selected session"""
     if not session_choice:
-        return [], gr.Dropdown(choices=[])
+        return [], gr.Dropdown(choices=[]), client
     
     session_id = session_choice[1] if isinstance(session_choice, tuple) else session_choice
-    chat_handler.delete_session(session_id)
+    await chat_handler.delete_session(session_id, client)
     
-    choices = chat_handler.get_user_sessions_formatted(DEFAULT_USER)
-    return [], gr.Dropdown(choices=choices)
+    choices = await chat_handler.get_user_sessions_formatted(DEFAULT_USER, client)
+    return [], gr.Dropdown(choices=choices), client
+
+# --- Search messages ---
+async def search_messages(query: str, client: ClientState):
+    """Fill the matches dropdown with sessions whose messages match the query"""
+    if not query.strip():
+        return gr.Dropdown(choices=[], value=None), [], client
+    matches = await chat_handler.search_sessions(query, DEFAULT_USER, client)
+    return gr.Dropdown(choices=matches, value=None), matches, client
+
+async def open_search_result(result: str, matches: List[Tuple[str, str]], client: ClientState) -> gr.Dropdown:
+    """Select the matching session in the sessions dropdown, which loads it"""
+    if not result:
+        return gr.Dropdown()
+    session_id = result[1] if isinstance(result, tuple) else result
+    choices = await chat_handler.get_user_sessions_formatted(DEFAULT_USER, client)
+    if session_id not in [value for _, value in choices]:
+        # older than the sessions the dropdown lists
+        label = dict((value, label) for label, value in matches).get(session_id, session_id)
+        choices = [(label, session_id)] + choices
+    return gr.Dropdown(choices=choices, value=session_id)
 
 # --- Create Gradio interface ---
 def create_interface():
-    # Populate dropdown at launch
-    initial_sessions = chat_handler.get_user_sessions_formatted(DEFAULT_USER)
-
     with gr.Blocks(title="AI Chatbot", theme=gr.themes.Soft()) as demo:
         gr.Markdown("# 🤖 AI Chatbot with Sessions")
+        # per-tab user/session; Gradio gives each browser session its own copy
+        client_state = gr.State(ClientState())
         
         with gr.Row():
             with gr.Column(scale=1):
                 gr.Markdown("### Session Management")
                 sessions_dropdown = gr.Dropdown(
                     label="Chat Sessions",
-                    choices=initial_sessions,
+                    choices=[],
                     interactive=True
                 )
                 
@@ -79,8 +131,22 @@ def create_interface():
                     refresh_btn = gr.Button("Refresh", size="sm")
                     new_session_btn = gr.Button("New Session", size="sm", variant="primary")
                     delete_btn = gr.Button("Delete", size="sm", variant="stop")
+
+                search_input = gr.Textbox(
+                    label="Search messages",
+                    placeholder="e.g. jazz mix",
+                    lines=1
+                )
+                search_matches = gr.State([])
+                search_results = gr.Dropdown(
+                    label="Matching sessions",
+                    choices=[],
+                    interactive=True
+                )
             
             with gr.Column(scale=3):
+                history_cursor = gr.State(None)
+                load_older_btn = gr.Button("Load older messages", size="sm", visible=False)
                 chatbot_interface = gr.Chatbot(
                     label="Chat",
                     height=500,
@@ -97,42 +163,76 @@ def create_interface():
                     send_btn = gr.Button("Send", variant="primary", scale=1)
 
         # --- Event handlers ---
+        # Populate dropdown once the page loads instead of blocking startup on the DB
+        demo.load(
+            refresh_sessions,
+            inputs=[client_state],
+            outputs=[sessions_dropdown]
+        )
+
         send_btn.click(
             chat_function,
-            inputs=[message_input, chatbot_interface],
+            inputs=[message_input, chatbot_interface, client_state],
             outputs=[chatbot_interface, message_input]
         )
         
         message_input.submit(
             chat_function,
-            inputs=[message_input, chatbot_interface],
+            inputs=[message_input, chatbot_interface, client_state],
             outputs=[chatbot_interface, message_input]
         )
         
         refresh_btn.click(
             refresh_sessions,
+            inputs=[client_state],
             outputs=[sessions_dropdown]
         )
         
         new_session_btn.click(
             new_session,
-            outputs=[chatbot_interface, sessions_dropdown]
-        )
+            inputs=[client_state],
+            outputs=[chatbot_interface, sessions_dropdown, client_state]
+        ).then(reset_paging, outputs=[history_cursor, load_older_btn])
         
         sessions_dropdown.change(
             load_session,
-            inputs=[sessions_dropdown],
-            outputs=[chatbot_interface]
+            inputs=[sessions_dropdown, client_state],
+            outputs=[chatbot_interface, history_cursor, load_older_btn, client_state]
+        )
+        
+        load_older_btn.click(
+            load_older,
+            inputs=[sessions_dropdown, chatbot_interface, history_cursor],
+            outputs=[chatbot_interface, history_cursor, load_older_btn]
         )
         
         delete_btn.click(
             delete_session_handler,
-            inputs=[sessions_dropdown],
-            outputs=[chatbot_interface, sessions_dropdown]
+            inputs=[sessions_dropdown, client_state],
+            outputs=[chatbot_interface, sessions_dropdown, client_state]
+        ).then(reset_paging, outputs=[history_cursor, load_older_btn])
+        
+        search_input.submit(
+            search_messages,
+            inputs=[search_input, client_state],
+            outputs=[search_results, search_matches, client_state]
+        )
+        
+        search_results.change(
+            open_search_result,
+            inputs=[search_results, search_matches, client_state],
+            outputs=[sessions_dropdown]
         )
     
     return demo
 
 if __name__ == "__main__":
     demo = create_interface()
+    # the async handler opens its pool/checkpointer inside the event loop, so only warm the shared pieces
+    startup.warm_up_in_background(["embedding_model", "playlist_index", "llm"])
+    # Prometheus /metrics on METRICS_PORT, unless METRICS=0
+    metrics.start_server()
+    # trims old LangGraph checkpoints every CHECKPOINT_COMPACT_INTERVAL seconds, unless 0
+    checkpoint_retention.start_compactor()
+    demo.queue(default_concurrency_limit=CONCURRENCY)
     demo.launch(server_name="0.0.0.0", server_port=7860)
@@ -1,8 +1,11 @@
 import gradio as gr
-from chat_handler import ChatHandler
-from typing import List, Tuple
+from chat_handler import ChatHandler, ClientState, prepend_history
+from typing import Iterator, List, Tuple
 import os 
 from langsmith import traceable
+import checkpoint_retention
+import metrics
+import startup
 
 from dotenv import load_dotenv
 
@@ -13,42 +16,64 @@ os.environ['LANGSMITH_PROJECT']="Jarvish-bot"
 # Initialize chat handler
 chat_handler = ChatHandler()
 DEFAULT_USER = "default_user"
+# sync handlers run on Gradio's worker threads, so this is also the thread count
+CONCURRENCY = int(os.getenv("GRADIO_CONCURRENCY", "16"))
 
 
-def chat_function(message: str, history: List[List[str]]) -> Tuple[List[List[str]], str]:
+def chat_function(message: str, history: List[List[str]], client: ClientState) -> Iterator[Tuple[List[List[str]], str]]:
     if not message.strip():
-        return history, ""
-    ai_reply = chat_handler.process_message(message, DEFAULT_USER)
-    history.append([message, ai_reply])
-    return history, ""
+        yield history, ""
+        return
+    history.append([message, ""])
+    reply, status = "", ""
+    for event in chat_handler.stream_message(message, DEFAULT_USER, client):
+        if event["type"] in ("token", "done"):
+            reply, status = event["reply"], ""
+        elif event["type"] == "tool" and event["status"] == "running":
+            reply, status = "", f"_Running {event['name']}..._"
+        history[-1][1] = f"{reply}\n\n{status}" if reply and status else (reply or status)
+        yield history, ""
+
+
+def load_session(session_choice: str, client: ClientState):
+    if not session_choice:
+        return [], None, gr.Button(visible=False), client
+    session_id = session_choice[1] if isinstance(session_choice, tuple) else session_choice
+    chat_handler.set_session(session_id, client)
+    history, cursor = chat_handler.get_session_history_page(session_id, client=client)
+    return history, cursor, gr.Button(visible=cursor is not None), client
 
 
-def load_session(session_choice: str) -> List[List[str]]:
-    if not session_choice:
-        return []
+def load_older(session_choice: str, history: List[List[str]], cursor):
+    if not session_choice or cursor is None:
+        return history, None, gr.Button(visible=False)
     session_id = session_choice[1] if isinstance(session_choice, tuple) else session_choice
-    chat_handler.set_session(session_id)
-    return chat_handler.get_session_history(session_id)
+    older, cursor = chat_handler.get_session_history_page(session_id, before=cursor)
+    return prepend_history(older, history), cursor, gr.Button(visible=cursor is not None)
+
 
+def reset_paging():
+    return None, gr.Button(visible=False)
 
-def refresh_sessions() -> gr.Dropdown:
-    choices = chat_handler.get_user_sessions_formatted(DEFAULT_USER)
+
+def refresh_sessions(client: ClientState) -> gr.Dropdown:
+    choices = chat_handler.get_user_sessions_formatted(DEFAULT_USER, client)
     return gr.Dropdown(choices=choices)
 
 
-def new_session() -> Tuple[List[List[str]], gr.Dropdown]:
-    chat_handler.create_new_session(DEFAULT_USER)
-    choices = chat_handler.get_user_sessions_formatted(DEFAULT_USER)
-    return [], gr.Dropdown(choices=choices)
+def new_session(client: ClientState) -> Tuple[List[List[str]], gr.Dropdown, ClientState]:
+    chat_handler.create_new_session(DEFAULT_USER, client)
+    choices = chat_handler.get_user_sessions_formatted(DEFAULT_USER, client)
+    return [], gr.Dropdown(choices=choices), client
 
 
-def delete_session_handler(session_choice: str) -> Tuple[List[List[str]], gr.Dropdown]:
+def delete_session_handler(session_choice: str, client: ClientState) -> Tuple[List[List[str]], gr.Dropdown, ClientState]:
     if not session_choice:
-        return [], gr.Dropdown(choices=[])
+        return [], gr.Dropdown(choices=[]), client
     session_id = session_choice[1] if isinstance(session_choice, tuple) else session_choice
-    chat_handler.delete_session(session_id)
-    choices = chat_handler.get_user_sessions_formatted(DEFAULT_USER)
-    return [], gr.Dropdown(choices=choices)
+    chat_handler.delete_session(session_id, client)
+    choices = chat_handler.get_user_sessions_formatted(DEFAULT_USER, client)
+    return [], gr.Dropdown(choices=choices), client
 
 # ----------------- Professional Interface -----------------
 
@@ -57,6 +82,8 @@ def create_interface():
         # Header
         gr.Markdown("## 🤖 AI Chatbot with Session Management")
         gr.Markdown("Manage multiple sessions and chat seamlessly with the AI.")
+        # per-tab user/session; Gradio gives each browser session its own copy
+        client_state = gr.State(ClientState())
         
         with gr.Row():
             # ---------------- Left Panel: Sessions ----------------
@@ -75,6 +102,8 @@ def create_interface():
             
             # ---------------- Right Panel: Chat ----------------
             with gr.Column(scale=3):
+                history_cursor = gr.State(None)
+                load_older_btn = gr.Button("⬆️ Load older messages", size="sm", variant="secondary", visible=False)
                 chatbot_interface = gr.Chatbot(
                     label="Chat",
                     height=550,
@@ -93,34 +122,47 @@ def create_interface():
         # ---------------- Event Handlers ----------------
         send_btn.click(
             chat_function,
-            inputs=[message_input, chatbot_interface],
+            inputs=[message_input, chatbot_interface, client_state],
             outputs=[chatbot_interface, message_input]
         )
         message_input.submit(
             chat_function,
-            inputs=[message_input, chatbot_interface],
+            inputs=[message_input, chatbot_interface, client_state],
             outputs=[chatbot_interface, message_input]
         )
         refresh_btn.click(
             refresh_sessions,
+            inputs=[client_state],
             outputs=[sessions_dropdown]
         )
         new_session_btn.click(
             new_session,
-            outputs=[chatbot_interface, sessions_dropdown]
-        )
+            inputs=[client_state],
+            outputs=[chatbot_interface, sessions_dropdown, client_state]
+        ).then(reset_paging, outputs=[history_cursor, load_older_btn])
         sessions_dropdown.change(
             load_session,
-            inputs=[sessions_dropdown],
-            outputs=[chatbot_interface]
+            inputs=[sessions_dropdown, client_state],
+            outputs=[chatbot_interface, history_cursor, load_older_btn, client_state]
+        )
+        load_older_btn.click(
+            load_older,
+            inputs=[sessions_dropdown, chatbot_interface, history_cursor],
+            outputs=[chatbot_interface, history_cursor, load_older_btn]
         )
         delete_btn.click(
             delete_session_handler,
-            inputs=[sessions_dropdown],
-            outputs=[chatbot_interface, sessions_dropdown]
-        )
+            inputs=[sessions_dropdown, client_state],
+            outputs=[chatbot_interface, sessions_dropdown, client_state]
+        ).then(reset_paging, outputs=[history_cursor, load_older_btn])
     return demo
 
 if __name__ == "__main__":
     demo = create_interface()
+    startup.warm_up_in_background()
+    # Prometheus /metrics on METRICS_PORT, unless METRICS=0
+    metrics.start_server()
+    # trims old LangGraph checkpoints every CHECKPOINT_COMPACT_INTERVAL seconds, unless 0
+    checkpoint_retention.start_compactor()
+    demo.queue(default_concurrency_limit=CONCURRENCY)
     demo.launch(server_name="0.0.0.0", server_port=7860)
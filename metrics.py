@@ -0,0 +1,214 @@
+"""Latency histograms for the hot path, served in Prometheus text format.
+
+Hooks are cheap (a perf_counter pair, a bisect and a lock per observation) and
+meant to stay on in production. METRICS=0 turns every hook into a no-op: the
+decorators return the original function and ``time()`` yields without timing.
+
+    with metrics.NODE_SECONDS.time(node="chat_node"): ...
+    @metrics.instrumented(metrics.DB_SECONDS)   # every public method of a class
+
+``start_server()`` exposes /metrics on METRICS_HOST:METRICS_PORT from a daemon
+thread, next to the Gradio app.
+"""
+import bisect
+import functools
+import inspect
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS", "1") == "1"
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+
+# seconds; spans a cached FAISS lookup up to a slow LLM turn
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per label combination"""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # label values -> [bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        if not METRICS_ENABLED:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        for key, counts, total in sorted(snapshot):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_label_str(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+_histograms: Dict[str, Histogram] = {}
+_collectors: List[Tuple[str, Callable[[], Dict[str, float]]]] = []
+_registry_lock = threading.Lock()
+
+
+def histogram(name: str, help: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+    """Get or create a registered histogram"""
+    with _registry_lock:
+        if name not in _histograms:
+            _histograms[name] = Histogram(name, help, labelnames, buckets)
+        return _histograms[name]
+
+
+def register_collector(prefix: str, collect: Callable[[], Dict[str, float]]) -> None:
+    """Export the numeric values of ``collect()`` as gauges named ``<prefix>_<key>`` on every scrape"""
+    with _registry_lock:
+        _collectors.append((prefix, collect))
+
+
+def timed(hist: Histogram, **labels):
+    """Decorator timing a sync or async function into ``hist``"""
+    def decorate(fn):
+        if not METRICS_ENABLED:
+            return fn
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with hist.time(**labels):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with hist.time(**labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def instrumented(hist: Histogram, label: str = "method"):
+    """Class decorator timing every public (static)method, labelled by method name.
+
+    Generators are left alone: their work happens after the call returns.
+    """
+    def decorate(cls):
+        for name, attr in list(vars(cls).items()):
+            if name.startswith("_"):
+                continue
+            is_static = isinstance(attr, staticmethod)
+            fn = attr.__func__ if is_static else attr
+            if not callable(fn) or inspect.isgeneratorfunction(fn) or inspect.isasyncgenfunction(fn):
+                continue
+            wrapped = timed(hist, **{label: name})(fn)
+            setattr(cls, name, staticmethod(wrapped) if is_static else wrapped)
+        return cls
+    return decorate
+
+
+def render() -> str:
+    """All histograms and collector gauges in Prometheus text exposition format"""
+    lines = []
+    with _registry_lock:
+        histograms = list(_histograms.values())
+        collectors = list(_collectors)
+    for hist in histograms:
+        lines.extend(hist.render())
+    for prefix, collect in collectors:
+        try:
+            values = collect()
+        except Exception as e:
+            lines.append(f"# {prefix}: collector failed: {e}")
+            continue
+        for key, value in sorted(values.items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = re.sub(r"[^a-zA-Z0-9_]", "_", f"{prefix}_{key}")
+            lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # scrapes every few seconds would flood the console
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_server(port: int = METRICS_PORT, host: str = METRICS_HOST) -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics from a daemon thread; no-op if disabled or already running"""
+    global _server
+    if not METRICS_ENABLED or _server is not None:
+        return _server
+    try:
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        print(f"[metrics] could not listen on {host}:{port}: {e}")
+        return None
+    threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"[metrics] serving http://{host}:{port}/metrics")
+    return _server
+
+
+### -------- Hot-path histograms --------
+NODE_SECONDS = histogram("assistant_graph_node_seconds", "Time spent in each LangGraph node", ["node"])
+DB_SECONDS = histogram("assistant_db_seconds", "DatabaseManager call latency", ["method"])
+EMBED_SECONDS = histogram("assistant_embed_seconds", "Query embedding latency (LRU hits included)")
+SEARCH_SECONDS = histogram("assistant_faiss_search_seconds", "Playlist index search latency")
+TOOL_SECONDS = histogram("assistant_tool_seconds", "Tool call latency", ["tool", "status"])
+TURN_SECONDS = histogram("assistant_turn_seconds", "Whole chat turn latency as seen by ChatHandler", ["mode"])
@@ -0,0 +1,73 @@
+"""Move existing sessions to CHAT_STORAGE_MODE=checkpoint.
+
+For every session that still has rows in `messages`:
+  * if its LangGraph thread has no checkpoint yet, seed one from the rows
+  * with --purge, delete the rows once the checkpoint holds at least as many
+    user/ai messages (sessions.message_count is preserved for the dropdown)
+
+Safe to re-run; --dry-run only reports what would happen.
+
+Usage: python migrate_history_storage.py [--dry-run] [--purge]
+"""
+import argparse
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from bot2 import get_chatbot
+from chat_handler import checkpoint_rows
+from database import connection
+from database_manager import DatabaseManager
+
+SELECT_SESSIONS_WITH_ROWS_SQL = "SELECT DISTINCT session_id FROM messages"
+COUNT_SESSION_ROWS_SQL = "SELECT message_count FROM sessions WHERE session_id = %s"
+RESTORE_COUNT_SQL = "UPDATE sessions SET message_count = %s WHERE session_id = %s"
+
+
+def to_messages(rows):
+    return [HumanMessage(content=text) if sender == "user" else AIMessage(content=text) for sender, text in rows]
+
+
+def migrate_session(chatbot, session_id: str, dry_run: bool, purge: bool) -> str:
+    rows = list(DatabaseManager.iter_session_messages(session_id))
+    config = {"configurable": {"thread_id": session_id}}
+    stored = checkpoint_rows(chatbot.get_state(config))
+
+    action = "kept"
+    if not stored:
+        action = "seeded"
+        if not dry_run:
+            # recorded as chat_node output, so the next turn continues from here
+            chatbot.update_state(config, {"messages": to_messages(rows)}, as_node="chat_node")
+            stored = checkpoint_rows(chatbot.get_state(config))
+    if purge:
+        if not dry_run and len(stored) < len(rows):
+            return f"{action}, NOT purged ({len(stored)} checkpointed < {len(rows)} rows)"
+        action += ", purged"
+        if not dry_run:
+            with connection() as conn, conn.transaction(), conn.cursor() as cur:
+                cur.execute(COUNT_SESSION_ROWS_SQL, (session_id,))
+                count = cur.fetchone()[0]
+                cur.execute("DELETE FROM messages WHERE session_id = %s", (session_id,))
+                # the delete trigger decremented message_count; the dropdown should still show it
+                cur.execute(RESTORE_COUNT_SQL, (count, session_id))
+    return f"{action} ({len(rows)} rows)"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--purge", action="store_true", help="delete message rows once checkpointed")
+    args = parser.parse_args()
+
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(SELECT_SESSIONS_WITH_ROWS_SQL)
+        session_ids = [row[0] for row in cur.fetchall()]
+
+    chatbot = get_chatbot()
+    for session_id in session_ids:
+        print(f"{session_id}: {migrate_session(chatbot, session_id, args.dry_run, args.purge)}")
+    print(f"{len(session_ids)} sessions {'checked' if args.dry_run else 'migrated'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Versioned schema migrations for the users / sessions / messages tables.
+
+Each migration runs in its own transaction and is recorded in schema_migrations,
+so ``migrate()`` is idempotent and safe to call on every startup.
+
+Usage: python migrations.py [--status]
+"""
+import argparse
+from typing import List, Tuple
+
+import psycopg
+
+from database import DATABASE_URL
+
+# arbitrary key so concurrent workers don't apply the same migration twice
+MIGRATION_LOCK_ID = 7261_0001
+
+MIGRATIONS: List[Tuple[int, str, str]] = [
+    (1, "create users, sessions and messages", """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id     TEXT PRIMARY KEY,
+            username    TEXT NOT NULL UNIQUE,
+            created_at  TIMESTAMP NOT NULL DEFAULT now()
+        );
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id    TEXT PRIMARY KEY,
+            user_id       TEXT NOT NULL REFERENCES users (user_id) ON DELETE CASCADE,
+            session_name  TEXT,
+            start_time    TIMESTAMP NOT NULL DEFAULT now()
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            message_id    TEXT PRIMARY KEY,
+            session_id    TEXT NOT NULL REFERENCES sessions (session_id) ON DELETE CASCADE,
+            sender        TEXT NOT NULL,
+            message_text  TEXT NOT NULL,
+            created_at    TIMESTAMP NOT NULL DEFAULT now()
+        );
+    """),
+    (2, "denormalized sessions.message_count maintained by triggers", """
+        ALTER TABLE sessions ADD COLUMN IF NOT EXISTS message_count INTEGER NOT NULL DEFAULT 0;
+
+        UPDATE sessions s SET message_count = c.n
+        FROM (SELECT session_id, COUNT(*) AS n FROM messages GROUP BY session_id) c
+        WHERE c.session_id = s.session_id;
+
+        -- statement-level triggers: one UPDATE per session per statement, not per row
+        CREATE OR REPLACE FUNCTION messages_count_insert() RETURNS trigger AS $$
+        BEGIN
+            UPDATE sessions s SET message_count = s.message_count + d.n
+            FROM (SELECT session_id, COUNT(*) AS n FROM new_rows GROUP BY session_id) d
+            WHERE s.session_id = d.session_id;
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION messages_count_delete() RETURNS trigger AS $$
+        BEGIN
+            UPDATE sessions s SET message_count = GREATEST(s.message_count - d.n, 0)
+            FROM (SELECT session_id, COUNT(*) AS n FROM old_rows GROUP BY session_id) d
+            WHERE s.session_id = d.session_id;
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS messages_count_insert ON messages;
+        CREATE TRIGGER messages_count_insert AFTER INSERT ON messages
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION messages_count_insert();
+
+        DROP TRIGGER IF EXISTS messages_count_delete ON messages;
+        CREATE TRIGGER messages_count_delete AFTER DELETE ON messages
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION messages_count_delete();
+    """),
+    (3, "indexes for history reads and session listing", """
+        CREATE INDEX IF NOT EXISTS messages_session_created_idx
+            ON messages (session_id, created_at);
+        -- covers get_user_sessions so the dropdown is an index-only scan
+        CREATE INDEX IF NOT EXISTS sessions_user_start_idx
+            ON sessions (user_id, start_time DESC)
+            INCLUDE (session_id, session_name, message_count);
+        -- tables created before migration 1 have no index behind get_or_create_user
+        CREATE INDEX IF NOT EXISTS users_username_idx ON users (username);
+    """),
+    (4, "keyset index for paginated history", """
+        -- (created_at, message_id) is a unique sort key; scanned backwards for newest-first pages
+        CREATE INDEX IF NOT EXISTS messages_session_keyset_idx
+            ON messages (session_id, created_at, message_id);
+        DROP INDEX IF EXISTS messages_session_created_idx;
+    """),
+    (5, "cascade session deletes to LangGraph checkpoints", """
+        -- the checkpoint tables belong to PostgresSaver.setup() and may not exist yet;
+        -- plpgsql resolves table names when a statement first runs, so this is safe
+        CREATE OR REPLACE FUNCTION sessions_delete_checkpoints() RETURNS trigger AS $$
+        BEGIN
+            IF to_regclass('checkpoints') IS NULL THEN
+                RETURN NULL;
+            END IF;
+            DELETE FROM checkpoint_writes WHERE thread_id IN (SELECT session_id FROM old_rows);
+            DELETE FROM checkpoint_blobs WHERE thread_id IN (SELECT session_id FROM old_rows);
+            DELETE FROM checkpoints WHERE thread_id IN (SELECT session_id FROM old_rows);
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql;
+
+        -- also fires for sessions removed by ON DELETE CASCADE from users
+        DROP TRIGGER IF EXISTS sessions_delete_checkpoints ON sessions;
+        CREATE TRIGGER sessions_delete_checkpoints AFTER DELETE ON sessions
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION sessions_delete_checkpoints();
+    """),
+    (6, "full-text search over messages", """
+        -- rewrites the table once; the 'english' config must match SEARCH_MESSAGES_SQL
+        ALTER TABLE messages ADD COLUMN IF NOT EXISTS message_tsv tsvector
+            GENERATED ALWAYS AS (to_tsvector('english', message_text)) STORED;
+        CREATE INDEX IF NOT EXISTS messages_tsv_idx ON messages USING GIN (message_tsv);
+    """),
+    (7, "unique messages.message_id for idempotent inserts", """
+        -- write_behind.py inserts with ON CONFLICT (message_id), which needs a unique index;
+        -- tables that predate migration 1 may have no key at all, and may hold duplicates
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_index i
+                JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+                WHERE i.indrelid = 'messages'::regclass AND i.indisunique
+                  AND i.indnkeyatts = 1 AND a.attname = 'message_id'
+            ) THEN
+                DELETE FROM messages m USING messages d
+                WHERE m.message_id = d.message_id AND m.ctid > d.ctid;
+                CREATE UNIQUE INDEX messages_message_id_key ON messages (message_id);
+            END IF;
+        END $$;
+    """),
+]
+
+
+def _ensure_table(cur) -> None:
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version     INTEGER PRIMARY KEY,
+            name        TEXT NOT NULL,
+            applied_at  TIMESTAMP NOT NULL DEFAULT now()
+        )
+    """)
+
+
+def applied_versions(conn) -> List[int]:
+    with conn.cursor() as cur:
+        _ensure_table(cur)
+        cur.execute("SELECT version FROM schema_migrations ORDER BY version")
+        return [row[0] for row in cur.fetchall()]
+
+
+def migrate(conninfo: str = DATABASE_URL) -> List[int]:
+    """Apply pending migrations in order; returns the versions applied by this call"""
+    applied = []
+    # a dedicated connection, so this can run before the pool is handed out
+    with psycopg.connect(conninfo, autocommit=True) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        try:
+            done = set(applied_versions(conn))
+            for version, name, sql in MIGRATIONS:
+                if version in done:
+                    continue
+                with conn.transaction(), conn.cursor() as cur:
+                    cur.execute(sql)
+                    cur.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                        (version, name)
+                    )
+                applied.append(version)
+                print(f"[migrations] applied {version}: {name}")
+        finally:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+    return applied
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--status", action="store_true", help="list migrations without applying them")
+    args = parser.parse_args()
+
+    if args.status:
+        with psycopg.connect(DATABASE_URL, autocommit=True) as conn:
+            done = set(applied_versions(conn))
+        for version, name, _ in MIGRATIONS:
+            print(f"{'x' if version in done else ' '} {version:>3}  {name}")
+        return
+    if not migrate():
+        print("[migrations] schema is up to date")
+
+
+if __name__ == "__main__":
+    main()
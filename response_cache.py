@@ -0,0 +1,201 @@
+"""Semantic cache of tool-call plans, consulted by chat_node before the LLM.
+
+A completed turn of the form
+
+    user message -> AI tool calls -> tool results -> AI reply
+
+is stored as (message embedding, tool calls, tool results, reply). A later message
+from the same user whose embedding is within RESPONSE_CACHE_THRESHOLD (cosine) of a
+stored one gets the tool calls replayed without an LLM call; if the tools return the
+same results as last time, the stored reply is replayed too, so the whole turn
+skips the LLM. Plain chat turns (no tools) are never cached.
+
+Opt-in with RESPONSE_CACHE=1. Entries are evicted LRU past RESPONSE_CACHE_SIZE and
+expire after RESPONSE_CACHE_TTL seconds.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional
+
+import faiss
+import numpy as np
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+import metrics
+import setvectordb
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE", "0") == "1"
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.92"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2000"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+
+# response_metadata key marking an AIMessage produced by the cache
+CACHE_MARKER = "response_cache"
+
+
+class CachedPlan(NamedTuple):
+    scope: str
+    text: str
+    tool_calls: List[Dict]  # [{"name": ..., "args": {...}}]
+    tool_results: List[str]
+    reply: str
+    created: float
+
+
+def cache_scope(config) -> str:
+    """Entries are shared between a user's sessions, never across users"""
+    configurable = (config or {}).get("configurable", {})
+    return str(configurable.get("user_id") or configurable.get("thread_id") or "")
+
+
+def current_turn(messages: List[BaseMessage]) -> List[BaseMessage]:
+    """Messages from the latest HumanMessage on"""
+    for i in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[i], HumanMessage):
+            return messages[i:]
+    return []
+
+
+def _replayed_key(message: BaseMessage) -> Optional[int]:
+    if isinstance(message, AIMessage):
+        return message.response_metadata.get(CACHE_MARKER)
+    return None
+
+
+class ResponseCache:
+    def __init__(self, threshold: float = RESPONSE_CACHE_THRESHOLD, maxsize: int = RESPONSE_CACHE_SIZE,
+                 ttl: float = RESPONSE_CACHE_TTL, encode=None):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.encode = encode or setvectordb.encode_queries
+        self._entries: "OrderedDict[int, CachedPlan]" = OrderedDict()  # LRU order
+        self._indexes: Dict[str, faiss.Index] = {}  # one index per scope
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.replies_replayed = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _embed(self, text: str) -> np.ndarray:
+        return np.asarray(self.encode([text]), dtype="float32").reshape(1, -1)
+
+    def _drop(self, key: int) -> CachedPlan:
+        entry = self._entries.pop(key)
+        self._indexes[entry.scope].remove_ids(np.array([key], dtype="int64"))
+        return entry
+
+    def _nearest(self, scope: str, vector: np.ndarray):
+        """(key, score) of the closest live entry in scope, or (None, 0.0)"""
+        index = self._indexes.get(scope)
+        if index is None or index.ntotal == 0:
+            return None, 0.0
+        scores, keys = index.search(vector, 1)
+        key, score = int(keys[0][0]), float(scores[0][0])
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, 0.0
+        if time.time() - entry.created > self.ttl:
+            self._drop(key)
+            self.expirations += 1
+            return None, 0.0
+        return key, score
+
+    def lookup(self, scope: str, text: str) -> Optional[int]:
+        """Key of a cached plan for `text`, or None"""
+        vector = self._embed(text)
+        with self._lock:
+            key, score = self._nearest(scope, vector)
+            if key is None or score < self.threshold:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return key
+
+    def store(self, scope: str, text: str, tool_calls: List[Dict], tool_results: List[str], reply: str) -> None:
+        vector = self._embed(text)
+        with self._lock:
+            # a near-duplicate is replaced, so one repeated command holds one entry
+            key, score = self._nearest(scope, vector)
+            if key is not None and score >= self.threshold:
+                self._drop(key)
+            index = self._indexes.get(scope)
+            if index is None:
+                index = self._indexes[scope] = faiss.IndexIDMap2(faiss.IndexFlatIP(vector.shape[1]))
+            key, self._next_key = self._next_key, self._next_key + 1
+            index.add_with_ids(vector, np.array([key], dtype="int64"))
+            self._entries[key] = CachedPlan(scope, text, tool_calls, tool_results, reply, time.time())
+            self.stores += 1
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def respond(self, messages: List[BaseMessage], scope: str) -> Optional[AIMessage]:
+        """The next AI message for this turn from the cache, or None to call the LLM"""
+        turn = current_turn(messages)
+        if len(turn) == 1:
+            key = self.lookup(scope, turn[0].content)
+            if key is None:
+                return None
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            tool_calls = [{"name": c["name"], "args": c["args"], "id": f"call_{uuid.uuid4().hex}"}
+                          for c in entry.tool_calls]
+            return AIMessage(content="", tool_calls=tool_calls, response_metadata={CACHE_MARKER: key})
+
+        key = _replayed_key(turn[1]) if len(turn) > 1 else None
+        if key is None or not all(isinstance(m, ToolMessage) for m in turn[2:]):
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+        # different tool output (e.g. the playlist is gone) needs the LLM to phrase the reply
+        if entry is None or [str(m.content) for m in turn[2:]] != entry.tool_results:
+            return None
+        self.replies_replayed += 1
+        return AIMessage(content=entry.reply, response_metadata={CACHE_MARKER: key})
+
+    def record(self, messages: List[BaseMessage], scope: str) -> None:
+        """Store the turn ending in messages[-1] if it is a single round of tool calls"""
+        turn = current_turn(messages)
+        if len(turn) < 4 or _replayed_key(turn[1]) is not None:
+            return
+        plan, results, reply = turn[1], turn[2:-1], turn[-1]
+        if not (isinstance(plan, AIMessage) and plan.tool_calls and isinstance(reply, AIMessage)
+                and not reply.tool_calls and isinstance(reply.content, str) and reply.content):
+            return
+        if len(results) != len(plan.tool_calls) or not all(isinstance(m, ToolMessage) for m in results):
+            return
+        self.store(
+            scope,
+            turn[0].content,
+            [{"name": c["name"], "args": c["args"]} for c in plan.tool_calls],
+            [str(m.content) for m in results],
+            reply.content,
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"size": len(self._entries), "scopes": len(self._indexes), "hits": self.hits,
+                    "misses": self.misses, "hit_rate": self.hits / total if total else 0.0,
+                    "replies_replayed": self.replies_replayed, "stores": self.stores,
+                    "evictions": self.evictions, "expirations": self.expirations}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._indexes.clear()
+
+
+# shared by the compiled graphs; None unless RESPONSE_CACHE=1
+cache = ResponseCache() if RESPONSE_CACHE_ENABLED else None
+if cache is not None:
+    metrics.register_collector("assistant_response_cache", cache.stats)
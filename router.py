@@ -0,0 +1,144 @@
+"""Deterministic fast path for obvious tool intents, run before chat_node.
+
+Cheap pattern rules (plus the playlist index score for playlist requests) pick a
+tool call directly when confidence is high; chat_node then phrases the reply from
+the tool result without an LLM round-trip. Anything else falls through to the LLM.
+
+    "https://example.com" / "open www.example.com"    -> open_url
+    "play my lofi playlist" / "play the focus mix"      -> play_playlist   (index score >= ROUTER_PLAYLIST_THRESHOLD)
+    "play lofi beats" (no playlist word)                -> play_playlist   (index score >= ROUTER_PLAYLIST_STRICT_THRESHOLD)
+    "search youtube for X" / "play X on youtube"        -> youtube_search
+
+Disable with FAST_PATH=0.
+"""
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Dict, List, NamedTuple, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+import metrics
+import setvectordb
+
+FAST_PATH_ENABLED = os.getenv("FAST_PATH", "1") == "1"
+# cosine score of the best playlist match needed to skip the LLM
+ROUTER_PLAYLIST_THRESHOLD = float(os.getenv("ROUTER_PLAYLIST_THRESHOLD", "0.55"))
+# "play X" without the word playlist/mix/album could also be a single video
+ROUTER_PLAYLIST_STRICT_THRESHOLD = float(os.getenv("ROUTER_PLAYLIST_STRICT_THRESHOLD", "0.8"))
+
+# response_metadata key marking an AIMessage produced by the router
+ROUTER_MARKER = "fast_path"
+
+_POLITE = r"(?:(?:please|pls|can you|could you|hey)\s+)*"
+URL_RE = re.compile(rf"^{_POLITE}(?:open\s+|go to\s+|visit\s+)?(?P<url>(?:https?://|www\.)\S+?)[.!]?$", re.I)
+PLAYLIST_RE = re.compile(
+    rf"^{_POLITE}(?:play|put on|start|shuffle)\s+(?:my\s+|the\s+|some\s+|a\s+)?(?P<query>.+?)\s+(?:playlist|mix|album)s?[.!]?$",
+    re.I,
+)
+PLAY_RE = re.compile(rf"^{_POLITE}(?:play|put on)\s+(?:my\s+|the\s+|some\s+)?(?P<query>.+?)[.!]?$", re.I)
+SEARCH_RE = re.compile(
+    rf"^{_POLITE}(?:(?:search|find|look up)\s+(?:on\s+)?youtube\s+for\s+(?P<q1>.+?)"
+    rf"|(?:search|find|look up)\s+(?:for\s+)?(?P<q2>.+?)\s+on\s+youtube"
+    rf"|play\s+(?P<q3>.+?)\s+on\s+youtube)[.!]?$",
+    re.I,
+)
+
+
+class Route(NamedTuple):
+    tool: Optional[str]  # None = fall back to the LLM
+    args: Dict
+    confidence: float
+    rule: str
+
+
+def best_playlist_score(query: str) -> float:
+    results = setvectordb.get_store().search(setvectordb.encode_queries([query]), 1)[0]
+    return float(results[0][1]) if results else 0.0
+
+
+def classify(text: str) -> Route:
+    text = " ".join(text.split())
+    m = URL_RE.match(text)
+    if m:
+        url = m.group("url")
+        return Route("open_url", {"link": url if "://" in url else f"https://{url}"}, 1.0, "url")
+    m = SEARCH_RE.match(text)
+    if m:
+        query = m.group("q1") or m.group("q2") or m.group("q3")
+        return Route("youtube_search", {"query": query}, 0.95, "youtube")
+    m = PLAYLIST_RE.match(text)
+    if m:
+        query = m.group("query")
+        score = best_playlist_score(query)
+        if score >= ROUTER_PLAYLIST_THRESHOLD:
+            return Route("play_playlist", {"query": query}, score, "playlist")
+        return Route(None, {}, score, "playlist")
+    m = PLAY_RE.match(text)
+    if m:
+        query = m.group("query")
+        score = best_playlist_score(query)
+        if score >= ROUTER_PLAYLIST_STRICT_THRESHOLD:
+            return Route("play_playlist", {"query": query}, score, "play")
+        return Route(None, {}, score, "play")
+    return Route(None, {}, 0.0, "none")
+
+
+class FastPathRouter:
+    def __init__(self, classify_fn=classify):
+        self.classify = classify_fn
+        self._lock = threading.Lock()
+        self.decisions: Dict[str, int] = {}
+
+    def route(self, messages: List[BaseMessage]) -> Optional[AIMessage]:
+        """A tool-call AIMessage for the latest user message, or None to use the LLM"""
+        last = messages[-1] if messages else None
+        if not isinstance(last, HumanMessage) or not isinstance(last.content, str):
+            return None
+        start = time.perf_counter()
+        try:
+            route = self.classify(last.content)
+        except Exception as e:
+            # e.g. the playlist index failed to load; the LLM path still works
+            print(f"[router] classify failed, using llm: {e}")
+            return None
+        decision = route.tool or "llm"
+        with self._lock:
+            self.decisions[decision] = self.decisions.get(decision, 0) + 1
+        print(f"[router] {decision} rule={route.rule} confidence={route.confidence:.2f} "
+              f"in {(time.perf_counter() - start) * 1000:.1f}ms")
+        if route.tool is None:
+            return None
+        tool_call = {"name": route.tool, "args": route.args, "id": f"call_{uuid.uuid4().hex}"}
+        return AIMessage(content="", tool_calls=[tool_call],
+                         response_metadata={ROUTER_MARKER: {"rule": route.rule, "confidence": route.confidence}})
+
+    def compose_reply(self, messages: List[BaseMessage]) -> Optional[AIMessage]:
+        """Reply for a routed turn once its tool has run, or None if the turn wasn't routed"""
+        if not messages or not isinstance(messages[-1], ToolMessage):
+            return None
+        i = len(messages) - 1
+        while i > 0 and isinstance(messages[i], ToolMessage):
+            i -= 1
+        plan = messages[i]
+        if not (isinstance(plan, AIMessage) and ROUTER_MARKER in plan.response_metadata):
+            return None
+        replies = []
+        for call, result in zip(plan.tool_calls, messages[i + 1:]):
+            content = str(result.content)
+            if call["name"] == "open_url" and content in ("", "null", "None"):
+                content = f"Opened {call['args']['link']}"
+            replies.append(content)
+        return AIMessage(content="\n".join(replies), response_metadata={ROUTER_MARKER: plan.response_metadata[ROUTER_MARKER]})
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.decisions)
+
+
+# shared by the compiled graphs; None when FAST_PATH=0
+router = FastPathRouter() if FAST_PATH_ENABLED else None
+if router is not None:
+    metrics.register_collector("assistant_router_decisions", router.stats)
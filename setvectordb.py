@@ -1,15 +1,483 @@
-import json 
-import faiss 
+import json
+import os
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer 
+import embeddings as embedding_backends
+import metrics
+import startup
 
-with open("playlist.json","r") as f:
-  playlists = json.load(f)
+PLAYLIST_PATH = "playlist.json"
+MODEL_NAME = "all-MiniLM-L6-v2"
+CACHE_DIR = os.getenv("VECTOR_CACHE_DIR", ".vector_cache")
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
 
-model = SentenceTransformer("all-MiniLM-L6-v2")
-playlist_names = [p["name"] for p in playlists]
-embeddings = model.encode(playlist_names,normalize_embeddings=True)
+# flat = exact scan; ivf / hnsw are approximate and meant for large catalogs
+INDEX_TYPE = os.getenv("PLAYLIST_INDEX_TYPE", "flat")
+INDEX_NLIST = int(os.getenv("PLAYLIST_INDEX_NLIST", "0"))  # 0 = 4*sqrt(n)
+INDEX_NPROBE = int(os.getenv("PLAYLIST_INDEX_NPROBE", "8"))
+INDEX_HNSW_M = int(os.getenv("PLAYLIST_INDEX_HNSW_M", "32"))
+INDEX_EF_CONSTRUCTION = int(os.getenv("PLAYLIST_INDEX_EF_CONSTRUCTION", "40"))
+INDEX_EF_SEARCH = int(os.getenv("PLAYLIST_INDEX_EF_SEARCH", "64"))
+# seconds between playlist.json checks, 0 disables the watcher
+WATCH_INTERVAL = float(os.getenv("PLAYLIST_WATCH_INTERVAL", "5"))
+# playlists found through the YouTube API, kept beside the index cache
+DISCOVERED_FILE = "discovered_playlists.json"
 
-dimension = embeddings.shape[1]
-index = faiss.IndexFlatIP(dimension)
-index.add(np.array(embeddings))
\ No newline at end of file
+### -------- Cache helpers --------
+def load_playlists(path:str=PLAYLIST_PATH):
+  with open(path,"rb") as f:
+    raw = f.read()
+  return json.loads(raw),raw
+
+def cache_key(raw:bytes,model_name:str,dimension:int,spec:str="")->str:
+  """Hash of playlist.json contents + model name + embedding dimension + index build spec"""
+  h = hashlib.sha256()
+  h.update(raw)
+  h.update(f"|{model_name}|{dimension}|{spec}".encode())
+  return h.hexdigest()
+
+def load_discovered(path:str)->list:
+  """API-sourced playlists saved by PlaylistIndex.add_discovered; [] if there are none yet"""
+  try:
+    with open(path,"r") as f:
+      return json.load(f)
+  except (OSError,ValueError):
+    return []
+
+def save_discovered(path:str,playlists)->None:
+  os.makedirs(os.path.dirname(path) or ".",exist_ok=True)
+  tmp_path = path + ".tmp"
+  with open(tmp_path,"w") as f:
+    json.dump(list(playlists),f)
+  os.replace(tmp_path,path)
+
+def catalog_bytes(raw:bytes,discovered)->bytes:
+  """playlist.json bytes plus the discovered playlists: what the index cache is keyed on"""
+  if not discovered:
+    return raw
+  return raw + b"\n" + json.dumps(sorted(discovered,key=lambda p:str(p["id"])),sort_keys=True).encode()
+
+def playlist_key(playlist:dict)->int:
+  """Stable int64 FAISS id for a playlist, derived from its YouTube playlist id"""
+  digest = hashlib.blake2b(str(playlist["id"]).encode(),digest_size=8).digest()
+  return int.from_bytes(digest,"big") & 0x7FFFFFFFFFFFFFFF
+
+def _cache_paths(cache_dir:str):
+  return (os.path.join(cache_dir,"playlists.faiss"),
+          os.path.join(cache_dir,"embeddings.npy"),
+          os.path.join(cache_dir,"ids.npy"),
+          os.path.join(cache_dir,"meta.json"))
+
+def load_cached_index(key:str,cache_dir:str=CACHE_DIR):
+  """Return (index, ids, embeddings) from disk if the stored key matches, else None"""
+  index_path,emb_path,ids_path,meta_path = _cache_paths(cache_dir)
+  try:
+    with open(meta_path,"r") as f:
+      meta = json.load(f)
+  except (OSError,ValueError):
+    return None
+  if meta.get("key") != key:
+    return None
+  try:
+    cached_index = faiss.read_index(index_path,faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+  except RuntimeError:
+    # older faiss builds can't mmap every index type, fall back to a normal read
+    cached_index = faiss.read_index(index_path)
+  try:
+    cached_ids = np.load(ids_path)
+  except OSError:
+    return None
+  cached_embeddings = np.load(emb_path,mmap_mode="r")
+  return cached_index,cached_ids,cached_embeddings
+
+def save_cached_index(key:str,index,ids,embeddings,cache_dir:str=CACHE_DIR)->None:
+  os.makedirs(cache_dir,exist_ok=True)
+  index_path,emb_path,ids_path,meta_path = _cache_paths(cache_dir)
+  # invalidate first so a crash mid-save can't pair a new index with old meta
+  if os.path.exists(meta_path):
+    os.remove(meta_path)
+  faiss.write_index(index,index_path)
+  np.save(emb_path,embeddings)
+  np.save(ids_path,ids)
+  # meta is written last so a half-written cache never matches a key
+  tmp_path = meta_path + ".tmp"
+  with open(tmp_path,"w") as f:
+    json.dump({"key":key,"count":int(index.ntotal)},f)
+  os.replace(tmp_path,meta_path)
+## ---------------------------------
+
+### -------- Index factory --------
+def index_spec(kind:str=INDEX_TYPE)->str:
+  """Build-time parameters that change the stored index (search-time knobs are excluded)"""
+  if kind == "ivf":
+    return f"ivf:nlist={INDEX_NLIST}"
+  if kind == "hnsw":
+    return f"hnsw:M={INDEX_HNSW_M}:efc={INDEX_EF_CONSTRUCTION}"
+  return kind
+
+def create_index(embeddings,ids=None,kind:str=INDEX_TYPE,nlist:int=INDEX_NLIST,hnsw_m:int=INDEX_HNSW_M,
+                 ef_construction:int=INDEX_EF_CONSTRUCTION):
+  """Build an ID-mapped inner-product index of the given kind over normalized embeddings"""
+  x = np.ascontiguousarray(embeddings,dtype="float32")
+  n,dim = x.shape
+  ids = np.arange(n,dtype="int64") if ids is None else np.ascontiguousarray(ids,dtype="int64")
+  if kind == "flat":
+    index = faiss.IndexFlatIP(dim)
+  elif kind == "ivf":
+    # faiss wants ~39 training points per centroid
+    nlist = nlist or int(4 * np.sqrt(max(n,1)))
+    nlist = max(1,min(nlist,n // 39 or 1))
+    quantizer = faiss.IndexFlatIP(dim)
+    index = faiss.IndexIVFFlat(quantizer,dim,nlist,faiss.METRIC_INNER_PRODUCT)
+    index.train(x)
+  elif kind == "hnsw":
+    index = faiss.IndexHNSWFlat(dim,hnsw_m,faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = ef_construction
+  else:
+    raise ValueError(f"unknown index type {kind!r}, expected flat, ivf or hnsw")
+  # IndexIDMap2 keeps our ids through add/remove instead of positional rows
+  index = faiss.IndexIDMap2(index)
+  if n:
+    index.add_with_ids(x,ids)
+  set_search_params(index)
+  return index
+
+def set_search_params(index,nprobe:int=INDEX_NPROBE,ef_search:int=INDEX_EF_SEARCH)->None:
+  """Apply query-time knobs; safe to call on any index type"""
+  if isinstance(index,faiss.IndexIDMap):
+    index = faiss.downcast_index(index.index)
+  if isinstance(index,faiss.IndexIVF):
+    index.nprobe = min(nprobe,index.nlist)
+  elif isinstance(index,faiss.IndexHNSW):
+    index.hnsw.efSearch = ef_search
+
+def build_index(embeddings,ids=None):
+  return create_index(embeddings,ids)
+## ---------------------------------
+
+def load_model(model_name:str=MODEL_NAME,backend:str=None):
+  """Encoder for EMBEDDING_BACKEND (torch, onnx or int8), see embeddings.py"""
+  return embedding_backends.load_encoder(model_name,backend)
+
+def encode_playlists(model,playlists):
+  names = [p["name"] for p in playlists]
+  if not names:
+    return np.empty((0,model.get_sentence_embedding_dimension()),dtype="float32")
+  return np.asarray(model.encode(names,normalize_embeddings=True),dtype="float32")
+
+def load_or_build(path:str=PLAYLIST_PATH,model_name:str=MODEL_NAME,cache_dir:str=CACHE_DIR,use_cache:bool=True,model=None):
+  """Load the playlist index from the disk cache, rebuilding it only when the key changed"""
+  playlists,raw = load_playlists(path)
+  discovered_path = os.path.join(cache_dir,DISCOVERED_FILE) if use_cache else None
+  discovered = load_discovered(discovered_path) if discovered_path else []
+  # playlist.json wins when it also lists a discovered playlist
+  listed = {playlist_key(p) for p in playlists}
+  playlists = playlists + [p for p in discovered if playlist_key(p) not in listed]
+  if model is None:
+    model = load_model(model_name)
+  dimension = model.get_sentence_embedding_dimension()
+  # vectors from different backends differ slightly, so each gets its own cache entry
+  key = cache_key(catalog_bytes(raw,discovered),embedding_backends.model_id(model_name),dimension,index_spec())
+
+  cached = load_cached_index(key,cache_dir) if use_cache else None
+  if cached is not None:
+    index,ids,embeddings = cached
+    set_search_params(index)
+  else:
+    ids = np.array([playlist_key(p) for p in playlists],dtype="int64")
+    embeddings = encode_playlists(model,playlists)
+    index = build_index(embeddings,ids)
+    if use_cache:
+      save_cached_index(key,index,ids,embeddings,cache_dir)
+  return PlaylistIndex(playlists,index,ids,embeddings,model,model_name=model_name,cache_dir=cache_dir if use_cache else None,
+                       discovered=discovered,discovered_path=discovered_path,raw=raw)
+
+### -------- Live playlist index --------
+_Snapshot = namedtuple("_Snapshot",["index","playlists","ids","embeddings"])
+
+class PlaylistIndex:
+  """Playlist catalog plus its ID-mapped FAISS index, updatable while serving queries.
+
+  Updates are copy-on-write: a writer builds the next snapshot off to the side and swaps
+  it in with a single assignment, so searches never wait on (or see half of) an update.
+
+  Playlists found through the YouTube API (add_discovered) are tracked apart from
+  playlist.json and saved to `discovered_path`, so sync() keeps them and a restart loads them.
+  """
+
+  def __init__(self,playlists,index,ids,embeddings,model,model_name:str=MODEL_NAME,cache_dir:str=None,
+               discovered=(),discovered_path:str=None,raw:bytes=None):
+    self.model = model
+    self.model_name = model_name
+    self.cache_dir = cache_dir
+    self.discovered_path = discovered_path
+    self._discovered = {playlist_key(p):p for p in discovered}
+    self._raw = raw  # playlist.json bytes the snapshot was last saved for
+    self._write_lock = threading.Lock()
+    self._discovered_lock = threading.Lock()
+    self._save_lock = threading.Lock()
+    by_key = {playlist_key(p):p for p in playlists}
+    self._snapshot = _Snapshot(index,by_key,np.asarray(ids,dtype="int64"),embeddings)
+
+  @property
+  def index(self):
+    return self._snapshot.index
+
+  @property
+  def playlists(self):
+    return list(self._snapshot.playlists.values())
+
+  @property
+  def embeddings(self):
+    return self._snapshot.embeddings
+
+  def search(self,query_embeddings,k:int=1):
+    """For each query row, a list of (playlist, score) best-first"""
+    snap = self._snapshot
+    scores,keys = snap.index.search(np.ascontiguousarray(query_embeddings,dtype="float32"),k)
+    return [[(snap.playlists[key],float(score)) for key,score in zip(row_keys,row_scores)
+             if key != -1 and key in snap.playlists]
+            for row_keys,row_scores in zip(keys,scores)]
+
+  def upsert(self,playlists)->int:
+    """Add new playlists and re-encode ones whose name changed"""
+    return self._apply(set(),list(playlists))
+
+  def add_discovered(self,playlists)->int:
+    """Upsert playlists found through the YouTube API and persist them with the index"""
+    playlists = list(playlists)
+    with self._discovered_lock:
+      new = [p for p in playlists if self._discovered.get(playlist_key(p)) != p]
+    if not new:
+      return 0
+    changed = self.upsert(new)
+    with self._discovered_lock:
+      for p in new:
+        self._discovered[playlist_key(p)] = p
+      if self.discovered_path is not None:
+        save_discovered(self.discovered_path,self._discovered.values())
+    self.save()
+    return changed
+
+  def remove(self,playlist_ids)->int:
+    """Remove playlists by their YouTube playlist id"""
+    keys = {playlist_key({"id":pid}) for pid in playlist_ids}
+    with self._discovered_lock:
+      if keys & set(self._discovered):
+        for key in keys:
+          self._discovered.pop(key,None)
+        if self.discovered_path is not None:
+          save_discovered(self.discovered_path,self._discovered.values())
+    return self._apply(keys,[])
+
+  def sync(self,playlists)->dict:
+    """Diff against a fresh copy of playlist.json and apply only the changes; discovered playlists stay"""
+    current = self._snapshot.playlists
+    incoming = {playlist_key(p):p for p in playlists}
+    with self._discovered_lock:
+      removed = set(current) - set(incoming) - set(self._discovered)
+    changed = [p for key,p in incoming.items() if current.get(key) != p]
+    added = sum(1 for p in changed if playlist_key(p) not in current)
+    if removed or changed:
+      self._apply(removed,changed)
+    return {"added":added,"updated":len(changed) - added,"removed":len(removed)}
+
+  def _apply(self,remove_keys:set,upserts:list)->int:
+    # only playlists whose name changed need the model; encode before taking the lock
+    current = self._snapshot.playlists
+    to_encode = [p for p in upserts if current.get(playlist_key(p),{}).get("name") != p["name"]]
+    vectors = encode_playlists(self.model,to_encode)
+    with self._write_lock:
+      snap = self._snapshot
+      by_key = dict(snap.playlists)
+      for key in remove_keys:
+        by_key.pop(key,None)
+      for p in upserts:
+        by_key[playlist_key(p)] = p
+
+      new_ids = np.array([playlist_key(p) for p in to_encode],dtype="int64")
+      drop = np.array(sorted((remove_keys | set(new_ids.tolist())) & set(snap.ids.tolist())),dtype="int64")
+      keep = ~np.isin(snap.ids,drop)
+      ids = np.concatenate([snap.ids[keep],new_ids])
+      embeddings = np.concatenate([np.asarray(snap.embeddings)[keep],vectors]) if len(ids) else vectors
+      index = self._next_index(snap.index,drop,new_ids,vectors,embeddings,ids)
+      self._snapshot = _Snapshot(index,by_key,ids,embeddings)
+    return len(drop) + len(new_ids)
+
+  def _next_index(self,index,drop,new_ids,vectors,embeddings,ids):
+    try:
+      # never mutate the index readers are searching
+      index = faiss.clone_index(index)
+    except RuntimeError:
+      index = None
+    base = faiss.downcast_index(index.index) if index is not None else None
+    if index is None or (drop.size and isinstance(base,faiss.IndexHNSW)):
+      # mmapped on-disk lists can't be cloned and HNSW can't delete: rebuild from stored vectors
+      return create_index(embeddings,ids)
+    if drop.size and isinstance(base,faiss.IndexIVF):
+      # IndexIDMap2 compacts its id map on removal but IVF lists keep their internal ids,
+      # so the two would drift apart: refill the (still trained) lists instead
+      ivf = faiss.clone_index(base)
+      ivf.reset()
+      index = faiss.IndexIDMap2(ivf)
+      index.add_with_ids(np.ascontiguousarray(embeddings,dtype="float32"),ids)
+      set_search_params(index)
+      return index
+    if drop.size:
+      index.remove_ids(drop)
+    if new_ids.size:
+      index.add_with_ids(vectors,new_ids)
+    set_search_params(index)
+    return index
+
+  def save(self,raw:bytes=None)->None:
+    """Persist the current snapshot under the cache key for `raw` playlist.json bytes (the last saved if None)"""
+    if self.cache_dir is None:
+      return
+    with self._save_lock:
+      if raw is not None:
+        self._raw = raw
+      if self._raw is None:
+        return
+      snap = self._snapshot
+      with self._discovered_lock:
+        discovered = list(self._discovered.values())
+      key = cache_key(catalog_bytes(self._raw,discovered),embedding_backends.model_id(self.model_name),
+                      self.model.get_sentence_embedding_dimension(),index_spec())
+      save_cached_index(key,snap.index,snap.ids,np.asarray(snap.embeddings),self.cache_dir)
+
+def reload_playlists(path:str=PLAYLIST_PATH)->dict:
+  """Apply playlist.json changes to the live index (the reload endpoint)"""
+  playlists,raw = load_playlists(path)
+  store = get_store()
+  diff = store.sync(playlists)
+  if any(diff.values()):
+    store.save(raw)
+  return diff
+
+class PlaylistWatcher(threading.Thread):
+  """Polls playlist.json and applies diffs to the live index"""
+
+  def __init__(self,path:str=PLAYLIST_PATH,interval:float=WATCH_INTERVAL):
+    super().__init__(name="playlist-watcher",daemon=True)
+    self.path = path
+    self.interval = interval
+    self._stop_event = threading.Event()
+    self._last = self._stamp()
+
+  def _stamp(self):
+    try:
+      st = os.stat(self.path)
+      return (st.st_mtime_ns,st.st_size)
+    except OSError:
+      return None
+
+  def run(self):
+    while not self._stop_event.wait(self.interval):
+      stamp = self._stamp()
+      if stamp is None or stamp == self._last:
+        continue
+      self._last = stamp
+      try:
+        diff = reload_playlists(self.path)
+        print(f"[setvectordb] applied {self.path} changes: {diff}")
+      except Exception as e:
+        # e.g. an editor mid-save left invalid JSON; retry on the next tick
+        self._last = None
+        print(f"[setvectordb] skipped reload of {self.path}: {e}")
+
+  def stop(self):
+    self._stop_event.set()
+## ---------------------------------
+
+### -------- Lazy module state --------
+_model = startup.lazy("embedding_model",load_model)
+
+def _load_store():
+  store = load_or_build(model=_model.get())
+  if WATCH_INTERVAL > 0:
+    PlaylistWatcher().start()
+  return store
+
+_store = startup.lazy("playlist_index",_load_store)
+
+def get_model():
+  return _model.get()
+
+def get_store()->"PlaylistIndex":
+  """The live PlaylistIndex, loaded on first use"""
+  return _store.get()
+
+### -------- Query embedding cache --------
+class QueryEmbeddingCache:
+  """Bounded LRU of normalized query -> embedding, so repeated queries skip the model"""
+
+  def __init__(self,maxsize:int=QUERY_CACHE_SIZE):
+    self.maxsize = maxsize
+    self._data = OrderedDict()
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+
+  @staticmethod
+  def normalize(query:str)->str:
+    return " ".join(query.lower().split())
+
+  def get_many(self,queries,encode):
+    """Embeddings for `queries` (one row each); misses are encoded in a single `encode` call"""
+    keys = [self.normalize(q) for q in queries]
+    found = {}
+    with self._lock:
+      for key in keys:
+        if key in self._data:
+          self._data.move_to_end(key)
+          found[key] = self._data[key]
+      missed = [k for k in keys if k not in found]
+      self.hits += len(keys) - len(missed)
+      self.misses += len(missed)
+    # duplicates within one batch are encoded once
+    missing = list(dict.fromkeys(missed))
+    if missing:
+      vectors = np.asarray(encode(missing),dtype="float32")
+      with self._lock:
+        for key,vector in zip(missing,vectors):
+          found[key] = vector
+          self._data[key] = vector
+          self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+          self._data.popitem(last=False)
+    return np.stack([found[k] for k in keys])
+
+  def stats(self)->dict:
+    with self._lock:
+      total = self.hits + self.misses
+      return {"size":len(self._data),"hits":self.hits,"misses":self.misses,
+              "hit_rate":self.hits / total if total else 0.0}
+
+  def clear(self)->None:
+    with self._lock:
+      self._data.clear()
+
+query_cache = QueryEmbeddingCache()
+metrics.register_collector("assistant_query_cache",query_cache.stats)
+
+def encode_queries(queries):
+  """Normalized query embeddings as a float32 (n, dim) array, served from the LRU where possible"""
+  return query_cache.get_many(queries,lambda texts: get_model().encode(texts,normalize_embeddings=True))
+
+def encode_texts(texts):
+  """Normalized embeddings for one-off texts (e.g. chat messages), bypassing the query LRU"""
+  return np.asarray(get_model().encode(list(texts),normalize_embeddings=True),dtype="float32")
+## ---------------------------------
+
+def __getattr__(name):
+  # keeps `setvectordb.playlists` / `setvectordb.index` / ... working without import-time loading
+  if name in ("playlists","index","model","embeddings"):
+    return getattr(get_store(),name)
+  if name == "dimension":
+    return get_store().embeddings.shape[1]
+  raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+## ---------------------------------
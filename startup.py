@@ -0,0 +1,173 @@
+"""Lazy resource initialization with per-phase startup timing.
+
+Expensive resources (DB connections, the embedding model, the compiled graph)
+are wrapped in a ``LazyResource`` and created on first use, or warmed up in a
+background thread once the UI is already serving.
+"""
+import asyncio
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+_registry: Dict[str, "LazyResource"] = {}
+_timings: List[tuple] = []
+_timings_lock = threading.Lock()
+_local = threading.local()
+
+
+class LazyResource:
+    """A value that is created by ``factory`` the first time ``get()`` is called"""
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.name = name
+        self._factory = factory
+        self._value: Any = None
+        self._ready = False
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    def get(self) -> Any:
+        if self._ready:
+            return self._value
+        with self._lock:
+            if not self._ready:
+                with phase(self.name):
+                    self._value = self._factory()
+                self._ready = True
+        return self._value
+
+    def set(self, value: Any) -> None:
+        """Inject an already-built value (used by tests and benchmarks)"""
+        with self._lock:
+            self._value = value
+            self._ready = True
+
+    def reset(self) -> Any:
+        """Drop the cached value so the next ``get()`` rebuilds it; returns the old value"""
+        with self._lock:
+            value, self._value, self._ready = self._value, None, False
+        return value
+
+
+class AsyncLazyResource:
+    """Like ``LazyResource`` but for resources that must be created inside the event loop"""
+
+    def __init__(self, name: str, factory: Callable[[], Awaitable[Any]]):
+        self.name = name
+        self._factory = factory
+        self._value: Any = None
+        self._ready = False
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    async def get(self) -> Any:
+        if self._ready:
+            return self._value
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self._ready:
+                start = time.perf_counter()
+                self._value = await self._factory()
+                record(self.name, time.perf_counter() - start)
+                self._ready = True
+        return self._value
+
+    def set(self, value: Any) -> None:
+        self._value = value
+        self._ready = True
+
+    def reset(self) -> Any:
+        value, self._value, self._ready = self._value, None, False
+        return value
+
+
+def lazy(name: str, factory: Callable[[], Any]) -> LazyResource:
+    """Create and register a lazily initialized resource"""
+    resource = LazyResource(name, factory)
+    _registry[name] = resource
+    return resource
+
+
+def lazy_async(name: str, factory: Callable[[], Awaitable[Any]]) -> AsyncLazyResource:
+    """Create a lazily initialized async resource (not part of the threaded warm-up)"""
+    return AsyncLazyResource(name, factory)
+
+
+def record(name: str, seconds: float, ok: bool = True) -> None:
+    """Record a phase timed outside of ``phase`` (e.g. in a coroutine)"""
+    with _timings_lock:
+        _timings.append((name, seconds, seconds, threading.current_thread().name, ok))
+
+
+class phase:
+    """Time a startup phase; time spent in nested phases is reported separately"""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        self._start = time.perf_counter()
+        self._children = 0.0
+        stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        total = time.perf_counter() - self._start
+        stack = _local.stack
+        stack.pop()
+        if stack:
+            stack[-1]._children += total
+        with _timings_lock:
+            _timings.append((self.name, total - self._children, total, threading.current_thread().name, exc is None))
+        return False
+
+
+def warm_up(names: Optional[Iterable[str]] = None) -> List[str]:
+    """Initialize the named resources (all registered ones by default); returns those that failed.
+
+    A failure is logged and the rest are still warmed; the failed resource retries on first use.
+    """
+    failed = []
+    for name in list(names or _registry):
+        try:
+            _registry[name].get()
+        except Exception as e:
+            print(f"[startup] warm-up of {name} failed: {e}")
+            failed.append(name)
+    return failed
+
+
+def warm_up_in_background(names: Optional[Iterable[str]] = None, report: bool = True) -> threading.Thread:
+    """Warm resources in a daemon thread so the server can bind its port first"""
+    names = list(names) if names is not None else None
+
+    def _run():
+        warm_up(names)
+        if report:
+            print(timing_report())
+
+    thread = threading.Thread(target=_run, name="startup-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def timing_report() -> str:
+    """Per-phase startup timing table"""
+    with _timings_lock:
+        rows = list(_timings)
+    lines = ["[startup] phase timings", f"  {'phase':<20} {'self ms':>10} {'total ms':>10}  thread"]
+    for name, own, total, thread_name, ok in rows:
+        status = "" if ok else "  (failed)"
+        lines.append(f"  {name:<20} {own * 1000:>10.1f} {total * 1000:>10.1f}  {thread_name}{status}")
+    lines.append(f"  {'sum':<20} {sum(r[1] for r in rows) * 1000:>10.1f}")
+    return "\n".join(lines)
@@ -0,0 +1,106 @@
+"""Runs the tool calls of one AI message in parallel, each bounded by a timeout.
+
+Replaces LangGraph's ToolNode in the "tools" node. The calls of a message are
+independent, so they run concurrently on a bounded thread pool. A call that
+misses its deadline is answered with a structured error ToolMessage, so the LLM
+can tell the user instead of the whole turn hanging:
+
+    {"error": "timeout", "tool": "play_playlist", "timeout_s": 10.0}
+
+Queued calls are cancelled when their deadline passes. A call already running in a
+thread can't be interrupted (webbrowser.open blocks), so its result is discarded.
+Each call runs in a copy of the caller's contextvars context, as under ToolNode, so
+LangChain's run context and per-turn instrumentation reach the tool.
+
+TOOL_TIMEOUT sets the default timeout in seconds. TOOL_TIMEOUT_<NAME>
+(e.g. TOOL_TIMEOUT_PLAY_PLAYLIST=15) overrides it for one tool, and
+TOOL_WORKERS sizes the pool.
+"""
+import asyncio
+import contextvars
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, List, Optional
+
+from langchain_core.messages import AIMessage, ToolMessage
+
+import metrics
+
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "10"))
+TOOL_WORKERS = int(os.getenv("TOOL_WORKERS", "8"))
+
+
+def _error(call: Dict, error: str, **details) -> ToolMessage:
+    content = json.dumps({"error": error, "tool": call["name"], **details})
+    return ToolMessage(content=content, name=call["name"], tool_call_id=call["id"], status="error")
+
+
+class ToolExecutor:
+    def __init__(self, tools, max_workers: int = TOOL_WORKERS, timeout: float = TOOL_TIMEOUT,
+                 timeouts: Optional[Dict[str, float]] = None):
+        self.tools_by_name = {t.name: t for t in tools}
+        self.timeout = timeout
+        self.timeouts = dict(timeouts or {})
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+
+    def timeout_for(self, name: str) -> float:
+        if name in self.timeouts:
+            return self.timeouts[name]
+        return float(os.getenv(f"TOOL_TIMEOUT_{name.upper()}", self.timeout))
+
+    def _run(self, call: Dict, config) -> ToolMessage:
+        tool = self.tools_by_name.get(call["name"])
+        if tool is None:
+            return _error(call, "unknown_tool", available=sorted(self.tools_by_name))
+        start = time.perf_counter()
+        try:
+            result = tool.invoke(call["args"], config)
+        except Exception as e:
+            metrics.TOOL_SECONDS.observe(time.perf_counter() - start, tool=call["name"], status="error")
+            return _error(call, "exception", message=str(e))
+        metrics.TOOL_SECONDS.observe(time.perf_counter() - start, tool=call["name"], status="ok")
+        content = result if isinstance(result, str) else json.dumps(result, default=str)
+        return ToolMessage(content=content, name=call["name"], tool_call_id=call["id"])
+
+    def _timed_out(self, call: Dict, timeout: float) -> ToolMessage:
+        metrics.TOOL_SECONDS.observe(timeout, tool=call["name"], status="timeout")
+        print(f"[tools] {call['name']} timed out after {timeout:.1f}s")
+        return _error(call, "timeout", timeout_s=timeout)
+
+    @staticmethod
+    def _tool_calls(state) -> List[Dict]:
+        messages = state["messages"] if isinstance(state, dict) else state
+        last = messages[-1] if messages else None
+        return list(last.tool_calls) if isinstance(last, AIMessage) else []
+
+    def invoke(self, state, config=None) -> dict:
+        calls = self._tool_calls(state)
+        start = time.monotonic()
+        # one copy per call: a context can't be entered by two threads at once
+        futures = [self._pool.submit(contextvars.copy_context().run, self._run, call, config) for call in calls]
+        results = []
+        for call, future in zip(calls, futures):
+            # all calls started together, so each deadline counts from the same start
+            timeout = self.timeout_for(call["name"])
+            try:
+                results.append(future.result(timeout=max(start + timeout - time.monotonic(), 0)))
+            except FutureTimeout:
+                future.cancel()
+                results.append(self._timed_out(call, timeout))
+        return {"messages": results}
+
+    async def ainvoke(self, state, config=None) -> dict:
+        calls = self._tool_calls(state)
+        loop = asyncio.get_running_loop()
+
+        async def run(call: Dict) -> ToolMessage:
+            timeout = self.timeout_for(call["name"])
+            future = loop.run_in_executor(self._pool, contextvars.copy_context().run, self._run, call, config)
+            try:
+                return await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                return self._timed_out(call, timeout)
+
+        return {"messages": list(await asyncio.gather(*(run(call) for call in calls)))}
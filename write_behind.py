@@ -0,0 +1,355 @@
+"""Write-behind persistence for chat turns, off the request path.
+
+With WRITE_BEHIND=1 the chat handlers hand each turn to a bounded in-process queue
+instead of writing it to Postgres before replying. A background writer drains the
+queue in batches of up to WRITE_BEHIND_BATCH (waiting at most WRITE_BEHIND_MAX_WAIT
+seconds to fill one) and writes each batch in one transaction with pipelined
+executemany.
+
+  * ordering:  one writer, FIFO. Rows keep the timestamps taken on the request path,
+               so history order is the order the user saw.
+  * retries:   connection errors (DB restarting, pool timeout) retry the same batch
+               with capped exponential backoff, so nothing is lost or reordered.
+               Any other error, including an OperationalError the server raised
+               for the statement (a timeout or cancel), isolates the batch one op
+               at a time and drops only the op that fails.
+  * reads:     until a turn is committed its rows are kept per session. The
+               WriteBehind*Manager read methods merge them into query results by
+               message_id, so the current session never looks like it lost a message.
+  * shutdown:  close() (registered with atexit) flushes for up to
+               WRITE_BEHIND_SHUTDOWN_TIMEOUT seconds.
+  * backpressure: when the queue is full for WRITE_BEHIND_BLOCK seconds, the turn
+               is written synchronously instead.
+
+Inserts are idempotent (ON CONFLICT DO NOTHING) and skip sessions deleted meanwhile.
+The writer uses the sync pool, also under the async handler.
+"""
+import asyncio
+import atexit
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import psycopg
+
+import database
+import metrics
+from database_manager import (AsyncDatabaseManager, DatabaseManager, NAME_UNNAMED_SESSION_SQL, RECORD_TURN_SQL,
+                              turn_params)
+
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND", "0") == "1"
+WRITE_BEHIND_QUEUE = int(os.getenv("WRITE_BEHIND_QUEUE", "10000"))
+WRITE_BEHIND_BATCH = int(os.getenv("WRITE_BEHIND_BATCH", "200"))
+WRITE_BEHIND_MAX_WAIT = float(os.getenv("WRITE_BEHIND_MAX_WAIT", "0.05"))
+WRITE_BEHIND_BLOCK = float(os.getenv("WRITE_BEHIND_BLOCK", "1"))
+WRITE_BEHIND_RETRY_BASE = float(os.getenv("WRITE_BEHIND_RETRY_BASE", "0.5"))
+WRITE_BEHIND_RETRY_MAX = float(os.getenv("WRITE_BEHIND_RETRY_MAX", "30"))
+WRITE_BEHIND_SHUTDOWN_TIMEOUT = float(os.getenv("WRITE_BEHIND_SHUTDOWN_TIMEOUT", "10"))
+
+# connection exceptions, no free connection slots, and the server shutting down or starting up
+CONNECTION_LOST_SQLSTATES = ("08", "53300", "57P01", "57P02", "57P03")
+
+# idempotent for retries (the conflict target is guaranteed by migration 7);
+# a session deleted while its turn was queued gets no rows
+INSERT_QUEUED_MESSAGE_SQL = """
+    INSERT INTO messages (message_id, session_id, sender, message_text, created_at)
+    SELECT %(message_id)s, %(session_id)s, %(sender)s, %(message_text)s, %(created_at)s
+    WHERE EXISTS (SELECT 1 FROM sessions WHERE session_id = %(session_id)s)
+    ON CONFLICT (message_id) DO NOTHING
+    """
+
+FLUSH_SECONDS = metrics.histogram("assistant_write_behind_flush_seconds", "Write-behind batch transaction latency")
+
+
+def message_rows(params: dict) -> List[dict]:
+    """INSERT_QUEUED_MESSAGE_SQL parameters for a turn_params() turn"""
+    return [
+        {"message_id": params["user_message_id"], "session_id": params["session_id"], "sender": "user",
+         "message_text": params["user_text"], "created_at": params["user_at"]},
+        {"message_id": params["ai_message_id"], "session_id": params["session_id"], "sender": "ai",
+         "message_text": params["ai_text"], "created_at": params["ai_at"]},
+    ]
+
+
+def connection_lost(e: psycopg.OperationalError) -> bool:
+    """True if the database couldn't be reached (worth waiting out), False if it rejected the batch.
+
+    Client-side failures (connect errors, a dropped connection, PoolTimeout) carry no SQLSTATE.
+    """
+    return e.sqlstate is None or e.sqlstate.startswith(CONNECTION_LOST_SQLSTATES)
+
+
+def merge_pending(rows: List[tuple], pending: List[tuple]) -> List[Tuple[str, str]]:
+    """(message_id, sender, text) DB rows, oldest first, plus the pending rows not among them,
+    as (sender, text) rows.
+
+    Matched on message_id, so a repeated turn is not mistaken for one already written.
+    Take the `pending` snapshot before the DB read: a turn committed in between is then
+    in both and shown once.
+    """
+    stored = {row[0] for row in rows}
+    return ([(sender, text) for _, sender, text in rows] +
+            [(sender, text) for message_id, sender, text in pending if message_id not in stored])
+
+
+class WriteBehindQueue:
+    def __init__(self, maxsize: int = WRITE_BEHIND_QUEUE, batch_size: int = WRITE_BEHIND_BATCH,
+                 max_wait: float = WRITE_BEHIND_MAX_WAIT, retry_base: float = WRITE_BEHIND_RETRY_BASE,
+                 retry_max: float = WRITE_BEHIND_RETRY_MAX, connection: Callable = database.connection):
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.connection = connection
+        self._queue: "queue.Queue" = queue.Queue(maxsize=maxsize)
+        # session_id -> [(message_id, sender, text)] queued but not committed, oldest first
+        self._pending: Dict[str, List[tuple]] = {}
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._closed = False
+        self.max_depth = 0
+        self.batches = 0
+        self.flushed_turns = 0
+        self.retries = 0
+        self.dropped = 0
+        self.overflows = 0
+
+    ### -------- Request path --------
+    def _start(self) -> None:
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                    self._worker.start()
+
+    def submit_turn(self, params: dict, timeout: float = WRITE_BEHIND_BLOCK) -> bool:
+        """Queue a turn_params() turn; False if the queue stayed full (the caller writes it itself)"""
+        self._start()
+        session_id = params["session_id"]
+        rows = [(params["user_message_id"], "user", params["user_text"]),
+                (params["ai_message_id"], "ai", params["ai_text"])]
+        with self._lock:
+            self._pending.setdefault(session_id, []).extend(rows)
+        if self._put(("turn", params), timeout):
+            return True
+        self._release_rows(session_id, {row[0] for row in rows})
+        return False
+
+    def submit_record(self, session_id: str, user_text: str, message_count: int = 2,
+                      timeout: float = WRITE_BEHIND_BLOCK) -> bool:
+        """Queue a record_turn() (checkpoint storage mode); False if the queue stayed full"""
+        self._start()
+        return self._put(("record", (session_id, user_text, message_count)), timeout)
+
+    def _put(self, op: tuple, timeout: float) -> bool:
+        if self._closed:
+            return False
+        try:
+            self._queue.put(op, timeout=timeout)
+        except queue.Full:
+            self.overflows += 1
+            return False
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        return True
+
+    def pending_rows(self, session_id: str) -> List[Tuple[str, str, str]]:
+        """(message_id, sender, text) rows of the session not committed yet, oldest first"""
+        with self._lock:
+            return list(self._pending.get(session_id, []))
+
+    def discard_session(self, session_id: str) -> None:
+        """Forget a deleted session's pending rows; its queued inserts become no-ops"""
+        with self._lock:
+            self._pending.pop(session_id, None)
+
+    def _release_rows(self, session_id: str, message_ids: set) -> None:
+        with self._lock:
+            rows = [row for row in self._pending.get(session_id, []) if row[0] not in message_ids]
+            if rows:
+                self._pending[session_id] = rows
+            else:
+                self._pending.pop(session_id, None)
+
+    ### -------- Writer --------
+    def _commit(self, batch: List[tuple]) -> None:
+        turns = [params for kind, params in batch if kind == "turn"]
+        records: Dict[str, list] = {}
+        for kind, (session_id, user_text, count) in (op for op in batch if op[0] == "record"):
+            # one UPDATE per session; the first message of the batch names an unnamed session
+            entry = records.setdefault(session_id, [0, user_text[:30], session_id])
+            entry[0] += count
+        with self.connection() as conn, conn.transaction(), conn.cursor() as cur:
+            if turns:
+                cur.executemany(INSERT_QUEUED_MESSAGE_SQL, [row for params in turns for row in message_rows(params)])
+                first_turns = {}
+                for params in turns:
+                    first_turns.setdefault(params["session_id"], params["session_name"])
+                cur.executemany(NAME_UNNAMED_SESSION_SQL, [(name, sid) for sid, name in first_turns.items()])
+            if records:
+                cur.executemany(RECORD_TURN_SQL, [tuple(entry) for entry in records.values()])
+
+    def _write(self, batch: List[tuple]) -> None:
+        attempt = 0
+        while True:
+            try:
+                with FLUSH_SECONDS.time():
+                    self._commit(batch)
+                break
+            except psycopg.OperationalError as e:
+                if not connection_lost(e):
+                    # e.g. a statement timeout: retrying the same batch would stall the writer
+                    print(f"[write-behind] batch of {len(batch)} rejected ({e}); writing ops one at a time")
+                    self._write_each(batch)
+                    break
+                # the database is unreachable: keep the batch (and everything behind it) in order
+                attempt += 1
+                self.retries += 1
+                delay = min(self.retry_base * 2 ** (attempt - 1), self.retry_max)
+                print(f"[write-behind] batch of {len(batch)} failed ({e}); retry {attempt} in {delay:.1f}s")
+                time.sleep(delay)
+            except Exception as e:
+                print(f"[write-behind] batch of {len(batch)} rejected ({e}); writing ops one at a time")
+                self._write_each(batch)
+                break
+        self.batches += 1
+        self.flushed_turns += sum(1 for kind, _ in batch if kind == "turn")
+        for kind, params in batch:
+            if kind == "turn":
+                self._release_rows(params["session_id"], {params["user_message_id"], params["ai_message_id"]})
+
+    def _write_each(self, batch: List[tuple]) -> None:
+        for op in batch:
+            try:
+                self._commit([op])
+            except Exception as e:
+                self.dropped += 1
+                print(f"[write-behind] dropped {op[0]} for session {op[1]['session_id'] if op[0] == 'turn' else op[1][0]}: {e}")
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything queued so far is written; False on timeout"""
+        with self._queue.all_tasks_done:
+            return self._queue.all_tasks_done.wait_for(lambda: self._queue.unfinished_tasks == 0, timeout)
+
+    def close(self, timeout: float = WRITE_BEHIND_SHUTDOWN_TIMEOUT) -> bool:
+        """Stop accepting turns and flush what is queued"""
+        self._closed = True
+        if self._worker is None:
+            return True
+        done = self.flush(timeout)
+        if not done:
+            print(f"[write-behind] shutdown with {self._queue.qsize()} queued ops unwritten")
+        return done
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending_sessions = len(self._pending)
+        return {"queue_depth": self._queue.qsize(), "max_depth": self.max_depth, "pending_sessions": pending_sessions,
+                "batches": self.batches, "flushed_turns": self.flushed_turns, "retries": self.retries,
+                "dropped": self.dropped, "overflows": self.overflows}
+
+
+class WriteBehindDatabaseManager:
+    """DatabaseManager whose turn writes go through a WriteBehindQueue; other calls pass through"""
+
+    def __init__(self, db=None, writer: Optional[WriteBehindQueue] = None):
+        self.db = db or DatabaseManager()
+        self.writer = writer or get_writer()
+
+    def __getattr__(self, name: str):
+        return getattr(self.db, name)
+
+    def insert_turn(self, session_id: str, user_text: str, ai_text: str, user_at=None) -> Tuple[str, str]:
+        """Queue the turn; written synchronously only if the queue is full"""
+        params = turn_params(session_id, user_text, ai_text, user_at)
+        if not self.writer.submit_turn(params):
+            return self.db.insert_turn(session_id, user_text, ai_text, user_at)
+        return params["user_message_id"], params["ai_message_id"]
+
+    def record_turn(self, session_id: str, user_text: str, message_count: int = 2) -> None:
+        if not self.writer.submit_record(session_id, user_text, message_count):
+            self.db.record_turn(session_id, user_text, message_count)
+
+    def get_session_messages(self, session_id: str) -> List[Tuple[str, str]]:
+        pending = self.writer.pending_rows(session_id)
+        return merge_pending(self.db.get_session_messages(session_id, with_ids=True), pending)
+
+    def get_session_messages_page(self, session_id: str, limit: int = 50, before=None):
+        # pending rows are the newest, so only the latest page needs them
+        pending = self.writer.pending_rows(session_id) if before is None else []
+        rows, cursor = self.db.get_session_messages_page(session_id, limit=limit, before=before, with_ids=True)
+        return merge_pending(rows, pending), cursor
+
+    def delete_session(self, session_id: str) -> None:
+        self.writer.discard_session(session_id)
+        self.db.delete_session(session_id)
+
+
+class AsyncWriteBehindDatabaseManager:
+    """asyncio twin of WriteBehindDatabaseManager over AsyncDatabaseManager"""
+
+    def __init__(self, db=None, writer: Optional[WriteBehindQueue] = None):
+        self.db = db or AsyncDatabaseManager()
+        self.writer = writer or get_writer()
+
+    def __getattr__(self, name: str):
+        return getattr(self.db, name)
+
+    async def insert_turn(self, session_id: str, user_text: str, ai_text: str, user_at=None) -> Tuple[str, str]:
+        params = turn_params(session_id, user_text, ai_text, user_at)
+        # a full queue blocks for up to WRITE_BEHIND_BLOCK, so never on the event loop
+        if not (self.writer.submit_turn(params, timeout=0) or
+                await asyncio.to_thread(self.writer.submit_turn, params)):
+            return await self.db.insert_turn(session_id, user_text, ai_text, user_at)
+        return params["user_message_id"], params["ai_message_id"]
+
+    async def record_turn(self, session_id: str, user_text: str, message_count: int = 2) -> None:
+        if not (self.writer.submit_record(session_id, user_text, message_count, timeout=0) or
+                await asyncio.to_thread(self.writer.submit_record, session_id, user_text, message_count)):
+            await self.db.record_turn(session_id, user_text, message_count)
+
+    async def get_session_messages(self, session_id: str) -> List[Tuple[str, str]]:
+        pending = self.writer.pending_rows(session_id)
+        return merge_pending(await self.db.get_session_messages(session_id, with_ids=True), pending)
+
+    async def get_session_messages_page(self, session_id: str, limit: int = 50, before=None):
+        pending = self.writer.pending_rows(session_id) if before is None else []
+        rows, cursor = await self.db.get_session_messages_page(session_id, limit=limit, before=before,
+                                                               with_ids=True)
+        return merge_pending(rows, pending), cursor
+
+    async def delete_session(self, session_id: str) -> None:
+        self.writer.discard_session(session_id)
+        await self.db.delete_session(session_id)
+
+
+_writer: Optional[WriteBehindQueue] = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> WriteBehindQueue:
+    """Process-wide queue, created on first use, with its metrics and atexit flush"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = WriteBehindQueue()
+            metrics.register_collector("assistant_write_behind", _writer.stats)
+            atexit.register(_writer.close)
+        return _writer
@@ -0,0 +1,185 @@
+"""YouTube Data API access with a persistent response cache and a quota budget.
+
+One googleapiclient service is shared by every call (googleapiclient/httplib2 is
+not thread-safe, so executes are serialized). Responses are cached on disk, one
+JSON file per (method, params):
+
+  * younger than YOUTUBE_CACHE_TTL   -> served from disk
+  * younger than YOUTUBE_STALE_TTL   -> served from disk, refreshed in the background
+  * older, or missing                -> fetched, if the quota budget allows
+
+The budget counts API units (search.list costs 100) against YOUTUBE_QUOTA_UNITS per
+day, resetting at midnight Pacific like the real quota. When it is spent, any cached
+response (however old) is served; with nothing cached, QuotaExceeded is raised.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+YOUTUBE_CACHE_DIR = os.getenv("YOUTUBE_CACHE_DIR", ".youtube_cache")
+YOUTUBE_CACHE_TTL = float(os.getenv("YOUTUBE_CACHE_TTL", str(6 * 3600)))
+YOUTUBE_STALE_TTL = float(os.getenv("YOUTUBE_STALE_TTL", str(7 * 24 * 3600)))
+YOUTUBE_QUOTA_UNITS = int(os.getenv("YOUTUBE_QUOTA_UNITS", "10000"))  # the API's default daily quota
+
+# https://developers.google.com/youtube/v3/determine_quota_cost
+QUOTA_COST = {"search": 100, "playlists": 1, "playlistItems": 1, "videos": 1}
+
+# the API quota resets at midnight Pacific time; close enough without tz data
+_PACIFIC = timezone(timedelta(hours=-8))
+
+
+class QuotaExceeded(RuntimeError):
+    pass
+
+
+class QuotaBudget:
+    """In-process count of API units spent today"""
+
+    def __init__(self, units: int = YOUTUBE_QUOTA_UNITS):
+        self.units = units
+        self._lock = threading.Lock()
+        self._day = None
+        self.spent = 0
+
+    def _roll(self) -> None:
+        day = datetime.now(_PACIFIC).date()
+        if day != self._day:
+            self._day, self.spent = day, 0
+
+    def try_spend(self, cost: int) -> bool:
+        with self._lock:
+            self._roll()
+            if self.spent + cost > self.units:
+                return False
+            self.spent += cost
+            return True
+
+    def remaining(self) -> int:
+        with self._lock:
+            self._roll()
+            return self.units - self.spent
+
+
+class DiskCache:
+    """One JSON file per key; writes are atomic (tmp file + os.replace)"""
+
+    def __init__(self, cache_dir: str = YOUTUBE_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Tuple[dict, float]]:
+        """(response, age in seconds), or None"""
+        try:
+            with open(self._path(key), "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry["response"], time.time() - entry["stored_at"]
+
+    def put(self, key: str, response: dict) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"stored_at": time.time(), "response": response}, f)
+        os.replace(tmp, path)
+
+
+def request_key(resource: str, params: Dict) -> str:
+    raw = json.dumps([resource, params], sort_keys=True)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class YouTubeClient:
+    def __init__(self, service: Callable[[], object], cache: Optional[DiskCache] = None,
+                 budget: Optional[QuotaBudget] = None, ttl: float = YOUTUBE_CACHE_TTL,
+                 stale_ttl: float = YOUTUBE_STALE_TTL):
+        self.service = service  # returns the shared googleapiclient resource
+        self.cache = cache or DiskCache()
+        self.budget = budget or QuotaBudget()
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._execute_lock = threading.Lock()
+        self._refreshing = set()
+        self._stats_lock = threading.Lock()
+        self.counts = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0,
+                       "quota_rejections": 0, "errors": 0}
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            self.counts[name] += 1
+
+    def _fetch(self, resource: str, params: Dict, key: str) -> dict:
+        with self._execute_lock:
+            response = getattr(self.service(), resource)().list(**params).execute()
+        self.cache.put(key, response)
+        return response
+
+    def _refresh(self, resource: str, params: Dict, key: str) -> None:
+        try:
+            self._fetch(resource, params, key)
+            self._count("refreshes")
+        except Exception as e:
+            self._count("errors")
+            print(f"[youtube] background refresh of {resource} failed: {e}")
+        finally:
+            with self._stats_lock:
+                self._refreshing.discard(key)
+
+    def _refresh_in_background(self, resource: str, params: Dict, key: str) -> None:
+        with self._stats_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        if not self.budget.try_spend(QUOTA_COST.get(resource, 1)):
+            with self._stats_lock:
+                self._refreshing.discard(key)
+            self._count("quota_rejections")
+            return
+        threading.Thread(target=self._refresh, args=(resource, params, key), daemon=True).start()
+
+    def list(self, resource: str, **params) -> dict:
+        """``service.<resource>().list(**params).execute()``, through the cache and budget"""
+        key = request_key(resource, params)
+        cached = self.cache.get(key)
+        if cached is not None:
+            response, age = cached
+            if age < self.ttl:
+                self._count("hits")
+                return response
+            if age < self.stale_ttl:
+                self._count("stale_hits")
+                self._refresh_in_background(resource, params, key)
+                return response
+
+        self._count("misses")
+        if not self.budget.try_spend(QUOTA_COST.get(resource, 1)):
+            self._count("quota_rejections")
+            if cached is not None:
+                return cached[0]
+            raise QuotaExceeded(f"YouTube quota budget of {self.budget.units} units spent for today")
+        try:
+            return self._fetch(resource, params, key)
+        except Exception:
+            self._count("errors")
+            if cached is not None:
+                return cached[0]
+            raise
+
+    def search(self, query: str, kind: str = "video", max_results: int = 5) -> List[Dict]:
+        """[{"id", "title", "channel"}] for videos or playlists matching `query`"""
+        response = self.list("search", q=query, part="snippet", type=kind, maxResults=max_results)
+        id_field = "playlistId" if kind == "playlist" else "videoId"
+        return [{"id": item["id"][id_field], "title": item["snippet"]["title"],
+                 "channel": item["snippet"].get("channelTitle", "")}
+                for item in response.get("items", []) if id_field in item.get("id", {})]
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {**self.counts, "quota_remaining": self.budget.remaining()}